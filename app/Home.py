@@ -1,40 +1,58 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime, timedelta
-import sys
 import os
+import sys
 
-# Ajustar el path para importaciones
-current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.dirname(current_dir)
-sys.path.insert(0, current_dir)
-sys.path.insert(0, parent_dir)
+# `streamlit run app/Home.py` solo agrega app/ a sys.path: se agrega la raíz del repo
+# una vez para que Home y las páginas importen `app.lib` del mismo modo.
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
 
-# Intentar diferentes rutas de importación
-try:
-    from lib.auth import login_form, has_permission
-    from lib.sp_wrappers import kpis
-    from lib.db import query
-except ImportError:
-    try:
-        from app.lib.auth import login_form, has_permission
-        from app.lib.sp_wrappers import kpis
-        from app.lib.db import query
-    except ImportError:
-        try:
-            import lib.auth as auth
-            import lib.sp_wrappers as sp
-            import lib.db as db
-            login_form = auth.login_form
-            has_permission = auth.has_permission
-            kpis = sp.kpis
-            query = db.query
-        except ImportError as e:
-            st.error(f"Error importando módulos: {e}")
-            st.error("Verifica que los archivos lib/auth.py, lib/sp_wrappers.py y lib/db.py existan")
-            st.stop()
+from app.lib import profiler
+profiler.start_page("Home")
+
+# Solo lo que necesita el login; pandas se importa al entrar al dashboard
+with profiler.section("imports", "imports"):
+    from app.lib.auth import login_form, has_permission, sede_filter, sede_scope
+    from app.lib.db import query, query_df, fetch_parallel
+    from app.lib.ui import fragment, lazy_tabs
+    from app.lib import estado, realtime
 
 st.set_page_config(page_title="Gym Manager", page_icon="🏋️", layout="wide")
+# Sesión nueva con cookie gym_sid (otro worker o recarga): recupera usuario y carrito
+estado.restaurar()
+
+@fragment(run_every=realtime.REFRESH_S if realtime.ENABLED else None)
+def aforo_por_sede():
+    """Aforo por sede: del mapa en vivo (LISTEN/NOTIFY) o, si no está disponible, de la BD.
+    Un usuario limitado a una sede solo ve la suya."""
+    vivo = realtime.aforo_por_sede()
+    sede = sede_scope()
+    if vivo is not None:
+        aforo_data = sorted(({"nombre": v["nombre"], "aforo_actual": v["aforo"]}
+                             for k, v in vivo.items() if sede is None or k == sede),
+                            key=lambda r: r["nombre"])
+    else:
+        try:
+            pred, p = sede_filter("s", column="id", glue=" WHERE ")
+            aforo_data = query(f"""
+                SELECT s.nombre, sp_aforo_actual(s.id) as aforo_actual
+                FROM sede s{pred} ORDER BY s.nombre
+            """, tuple(p))
+        except Exception as e:
+            st.error(f"Error obteniendo aforo: {e}")
+            aforo_data = []
+    if aforo_data:
+        st.subheader("🏢 Aforo Actual por Sede")
+        aforo_cols = st.columns(len(aforo_data))
+        for i, sede_info in enumerate(aforo_data):
+            with aforo_cols[i]:
+                st.metric(
+                    f"📍 {sede_info['nombre']}", 
+                    f"{sede_info['aforo_actual']} personas",
+                    help="Personas actualmente en la sede"
+                )
 
 # Header
 left, right = st.columns([0.8, 0.2])
@@ -44,7 +62,7 @@ with right:
     if st.session_state.get("user"):
         if st.button("🚪 Salir", type="primary", help="Cerrar sesión"):
             try:
-                from lib.auth import logout
+                from app.lib.auth import logout
                 logout()
             except Exception:
                 for k in ("user", "permissions", "jwt", "auth_user", "session_id", "col_index"):
@@ -60,123 +78,142 @@ else:
     u = st.session_state["user"]
     st.success(f"Hola, {u['email']} ({u['rol']})")
 
-    # === KPIs PRINCIPALES ===
-    st.header("📊 Resumen Ejecutivo")
-    
-    try:
-        data = kpis()
-        d = data[0] if data else {}
-        socios = d.get("socios", "—")
-        activas = d.get("membresias_activas", "—")
-        accesos_hoy = d.get("accesos_hoy", "—")
-    except Exception:
-        socios = query("SELECT COUNT(*) c FROM socio")[0]["c"]
-        activas = query("SELECT COUNT(*) c FROM membresia WHERE estado='activa' AND fecha_fin>=CURRENT_DATE")[0]["c"]
-        accesos_hoy = query("SELECT COUNT(*) c FROM acceso WHERE fecha_entrada::date=CURRENT_DATE")[0]["c"]
-
-    # KPIs adicionales
-    try:
-        # Aforo actual por sede
-        aforo_data = query("""
-            SELECT s.nombre, sp_aforo_actual(s.id) as aforo_actual
-            FROM sede s ORDER BY s.nombre
-        """)
-        
-        # Ventas del día
-        ventas_hoy = query("""
-            SELECT COALESCE(SUM(total), 0)::numeric(10,2) as total
-            FROM venta WHERE fecha::date = CURRENT_DATE
-        """)[0]["total"] if query("SELECT COUNT(*) c FROM venta WHERE fecha::date = CURRENT_DATE")[0]["c"] > 0 else 0
+    with profiler.section("import pandas", "imports"):
+        import pandas as pd
 
-        # Próximas clases (hoy)
-        clases_hoy = query("""
-            SELECT COUNT(*) c FROM clase 
-            WHERE fecha_hora::date = CURRENT_DATE AND estado = 'programada'
-        """)[0]["c"]
+    # Consultas independientes del dashboard en paralelo (KPIs + tendencias):
+    # el bloque tarda lo que la más lenta y un fallo solo afecta a su widget
+    # Ventas, clases y accesos se limitan a la sede del usuario (si no tiene 'all_sedes');
+    # socios y membresías son de toda la red
+    with profiler.section("kpis y tendencias: consultas", "sql"):
+        pred, ps = sede_filter()
+        ps = tuple(ps)
+        datos = fetch_parallel({
+            "kpis": ("SELECT * FROM sp_kpis(%s)", (sede_scope(),)),
+            "ventas_hoy": (f"""
+                SELECT COALESCE(SUM(total), 0)::numeric(10,2) AS total FROM venta
+                WHERE fecha >= CURRENT_DATE AND fecha < CURRENT_DATE + 1{pred}
+            """, ps),
+            "clases_hoy": (f"""
+                SELECT COUNT(*) c FROM clase 
+                WHERE fecha_hora >= CURRENT_DATE AND fecha_hora < CURRENT_DATE + 1 AND estado = 'programada'{pred}
+            """, ps),
+            "vencimientos": """
+                SELECT COUNT(*) c FROM membresia m
+                WHERE (m.estado = 'activa' OR (m.estado = 'congelada' AND m.congelada_hasta <= CURRENT_DATE))
+                  AND fecha_fin BETWEEN CURRENT_DATE AND CURRENT_DATE + 7
+            """,
+            "accesos_semana": (f"""
+                SELECT 
+                    fecha_entrada::date as fecha,
+                    COUNT(*) as accesos
+                FROM acceso 
+                WHERE fecha_entrada >= CURRENT_DATE - 7{pred}
+                GROUP BY fecha_entrada::date
+                ORDER BY fecha
+            """, ps),
+            "ventas_semana": (f"""
+                SELECT 
+                    fecha::date as fecha,
+                    SUM(total) as total_ventas
+                FROM venta 
+                WHERE fecha >= CURRENT_DATE - 7{pred}
+                GROUP BY fecha::date
+                ORDER BY fecha
+            """, ps),
+        }, replica=None)  # lecturas de tablero: réplica si está sana, salvo tras escribir
 
-        # Membresías que vencen en 7 días
-        vencimientos = query("""
-            SELECT COUNT(*) c FROM membresia 
-            WHERE estado = 'activa' AND fecha_fin BETWEEN CURRENT_DATE AND CURRENT_DATE + 7
-        """)[0]["c"]
+    with profiler.section("kpis: consultas"):
+        try:
+            data = datos["kpis"]
+            d = data[0] if data else {}
+            socios = d.get("socios", "—")
+            activas = d.get("membresias_activas", "—")
+            accesos_hoy = d.get("accesos_hoy", "—")
+        except Exception:
+            conteos = fetch_parallel({
+                "socios": "SELECT COUNT(*) c FROM socio",
+                "activas": """SELECT COUNT(*) c FROM membresia m
+                              WHERE (m.estado = 'activa' OR (m.estado = 'congelada' AND m.congelada_hasta <= CURRENT_DATE)) AND fecha_fin>=CURRENT_DATE""",
+                "accesos_hoy": (f"SELECT COUNT(*) c FROM acceso WHERE fecha_entrada::date=CURRENT_DATE{pred}", ps),
+            })
+            socios, activas, accesos_hoy = (conteos[k][0]["c"] if k not in conteos.errores else "—"
+                                            for k in ("socios", "activas", "accesos_hoy"))
 
-    except Exception as e:
-        st.error(f"Error obteniendo datos adicionales: {e}")
-        aforo_data = []
-        ventas_hoy = 0
-        clases_hoy = 0
-        vencimientos = 0
+        # KPIs adicionales
+        try:
+            ventas_hoy = datos["ventas_hoy"][0]["total"]    # Ventas del día
+            clases_hoy = datos["clases_hoy"][0]["c"]        # Próximas clases (hoy)
+            vencimientos = datos["vencimientos"][0]["c"]    # Membresías que vencen en 7 días
+        except Exception as e:
+            st.error(f"Error obteniendo datos adicionales: {e}")
+            ventas_hoy = 0
+            clases_hoy = 0
+            vencimientos = 0
 
-    # Mostrar KPIs en columnas
-    col1, col2, col3, col4, col5 = st.columns(5)
+    with profiler.section("kpis: render", "render"):
+        # Mostrar KPIs en columnas
+        col1, col2, col3, col4, col5 = st.columns(5)
     
-    with col1:
-        st.metric("👥 Socios Totales", socios)
-    with col2:
-        st.metric("💳 Membresías Activas", activas)
-    with col3:
-        st.metric("🚪 Accesos Hoy", accesos_hoy)
-    with col4:
-        st.metric("💰 Ventas Hoy", f"S/. {ventas_hoy}")
-    with col5:
-        st.metric("📅 Clases Hoy", clases_hoy)
+        with col1:
+            st.metric("👥 Socios Totales", socios)
+        with col2:
+            st.metric("💳 Membresías Activas", activas)
+        with col3:
+            st.metric("🚪 Accesos Hoy", accesos_hoy)
+        with col4:
+            st.metric("💰 Ventas Hoy", f"S/. {ventas_hoy}")
+        with col5:
+            st.metric("📅 Clases Hoy", clases_hoy)
 
-    # === ALERTAS ===
-    if vencimientos > 0:
-        st.warning(f"⚠️ {vencimientos} membresías vencen en los próximos 7 días")
+        # === ALERTAS ===
+        if vencimientos > 0:
+            st.warning(f"⚠️ {vencimientos} membresías vencen en los próximos 7 días")
 
-    # === AFORO POR SEDE ===
-    if aforo_data:
-        st.subheader("🏢 Aforo Actual por Sede")
-        aforo_cols = st.columns(len(aforo_data))
-        for i, sede_info in enumerate(aforo_data):
-            with aforo_cols[i]:
-                st.metric(
-                    f"📍 {sede_info['nombre']}", 
-                    f"{sede_info['aforo_actual']} personas",
-                    help="Personas actualmente en la sede"
-                )
+        # === AFORO POR SEDE ===
+        aforo_por_sede()
 
     st.divider()
 
     # === SELECTOR DE MÓDULOS ===
     st.header("🚀 Módulos del Sistema")
     
-    # Lista de módulos disponibles según permisos
-    modulos_disponibles = []
+    with profiler.section("módulos", "auth"):
+        # Lista de módulos disponibles según permisos
+        modulos_disponibles = []
     
-    if has_permission("socios_read"):
-        modulos_disponibles.append("👤 Gestión de Socios")
-    if has_permission("membership_assign") or has_permission("plans_manage"):
-        modulos_disponibles.append("💳 Membresías y Planes")
-    if has_permission("classes_publish") or has_permission("reservations_create"):
-        modulos_disponibles.append("📆 Clases y Reservas")
-    if has_permission("access_entry") or has_permission("access_exit"):
-        modulos_disponibles.append("🚪 Control de Acceso")
-    if has_permission("products_manage"):
-        modulos_disponibles.append("🛒 Inventario")
-    if has_permission("sales_read") or has_permission("sales_create"):
-        modulos_disponibles.append("💵 Punto de Venta")
-    if has_permission("payments_read") or has_permission("payments_create"):
-        modulos_disponibles.append("💳 Gestión de Pagos")
-    if has_permission("reports_view"):
-        modulos_disponibles.append("📊 Reportes")
-    if has_permission("users_manage"):
-        modulos_disponibles.append("👥 Administración")
-    if has_permission("audit_view"):
-        modulos_disponibles.append("📑 Auditoría")
+        if has_permission("socios_read"):
+            modulos_disponibles.append("👤 Gestión de Socios")
+        if has_permission("membership_assign") or has_permission("plans_manage"):
+            modulos_disponibles.append("💳 Membresías y Planes")
+        if has_permission("classes_publish") or has_permission("reservations_create"):
+            modulos_disponibles.append("📆 Clases y Reservas")
+        if has_permission("access_entry") or has_permission("access_exit"):
+            modulos_disponibles.append("🚪 Control de Acceso")
+        if has_permission("products_manage"):
+            modulos_disponibles.append("🛒 Inventario")
+        if has_permission("sales_read") or has_permission("sales_create"):
+            modulos_disponibles.append("💵 Punto de Venta")
+        if has_permission("payments_read") or has_permission("payments_create"):
+            modulos_disponibles.append("💳 Gestión de Pagos")
+        if has_permission("reports_view"):
+            modulos_disponibles.append("📊 Reportes")
+        if has_permission("users_manage"):
+            modulos_disponibles.append("👥 Administración")
+        if has_permission("audit_view"):
+            modulos_disponibles.append("📑 Auditoría")
 
-    # Nota sobre navegación
-    if modulos_disponibles:
-        st.info("📝 **Nota:** Para acceder a los módulos específicos, navega usando las páginas del sidebar izquierdo. Si encuentras errores de importación, contacta al administrador del sistema.")
+        # Nota sobre navegación
+        if modulos_disponibles:
+            st.info("📝 **Nota:** Para acceder a los módulos específicos, navega usando las páginas del sidebar izquierdo. Si encuentras errores de importación, contacta al administrador del sistema.")
         
-        # Mostrar módulos disponibles como información
-        cols = st.columns(3)
-        for i, modulo in enumerate(modulos_disponibles):
-            with cols[i % 3]:
-                st.write(f"✅ {modulo}")
-    else:
-        st.warning("No tienes permisos para acceder a módulos específicos. Contacta al administrador.")
+            # Mostrar módulos disponibles como información
+            cols = st.columns(3)
+            for i, modulo in enumerate(modulos_disponibles):
+                with cols[i % 3]:
+                    st.write(f"✅ {modulo}")
+        else:
+            st.warning("No tienes permisos para acceder a módulos específicos. Contacta al administrador.")
 
     st.divider()
 
@@ -185,173 +222,182 @@ else:
     
     chart_col1, chart_col2 = st.columns(2)
     
-    with chart_col1:
-        st.subheader("Accesos por Día (Última Semana)")
-        try:
-            accesos_semana = query("""
-                SELECT 
-                    fecha_entrada::date as fecha,
-                    COUNT(*) as accesos
-                FROM acceso 
-                WHERE fecha_entrada >= CURRENT_DATE - 7
-                GROUP BY fecha_entrada::date
-                ORDER BY fecha
-            """)
-            if accesos_semana:
-                df_accesos = pd.DataFrame(accesos_semana)
-                st.line_chart(df_accesos.set_index('fecha'))
-            else:
-                st.info("No hay datos de accesos en la última semana")
-        except Exception as e:
-            st.error(f"Error cargando gráfico de accesos: {e}")
+    with profiler.section("tendencia accesos"):
+        with chart_col1:
+            st.subheader("Accesos por Día (Última Semana)")
+            try:
+                accesos_semana = datos["accesos_semana"]
+                if accesos_semana:
+                    with profiler.section("df_accesos", "dataframe"):
+                        df_accesos = pd.DataFrame(accesos_semana)
+                    st.line_chart(df_accesos.set_index('fecha'))
+                else:
+                    st.info("No hay datos de accesos en la última semana")
+            except Exception as e:
+                st.error(f"Error cargando gráfico de accesos: {e}")
 
-    with chart_col2:
-        st.subheader("Ventas por Día (Última Semana)")
-        try:
-            ventas_semana = query("""
-                SELECT 
-                    fecha::date as fecha,
-                    SUM(total) as total_ventas
-                FROM venta 
-                WHERE fecha >= CURRENT_DATE - 7
-                GROUP BY fecha::date
-                ORDER BY fecha
-            """)
-            if ventas_semana:
-                df_ventas = pd.DataFrame(ventas_semana)
-                st.line_chart(df_ventas.set_index('fecha'))
-            else:
-                st.info("No hay datos de ventas en la última semana")
-        except Exception as e:
-            st.error(f"Error cargando gráfico de ventas: {e}")
+    with profiler.section("tendencia ventas"):
+        with chart_col2:
+            st.subheader("Ventas por Día (Última Semana)")
+            try:
+                ventas_semana = datos["ventas_semana"]
+                if ventas_semana:
+                    with profiler.section("df_ventas", "dataframe"):
+                        df_ventas = pd.DataFrame(ventas_semana)
+                    st.line_chart(df_ventas.set_index('fecha'))
+                else:
+                    st.info("No hay datos de ventas en la última semana")
+            except Exception as e:
+                st.error(f"Error cargando gráfico de ventas: {e}")
 
     st.divider()
 
     # === INFORMACIÓN DETALLADA ===
-    tab1, tab2, tab3, tab4 = st.tabs(["📅 Próximas Clases", "⏰ Actividad Reciente", "📋 Membresías por Vencer", "🏆 Top Productos"])
+    # Solo se consulta la pestaña visible; cambiar de pestaña re-ejecuta solo este fragmento
+    @fragment()
+    def detalle():
+        tab1, tab2, tab3, tab4 = lazy_tabs(["📅 Próximas Clases", "⏰ Actividad Reciente", "📋 Membresías por Vencer", "🏆 Top Productos"], key="home_detalle")
 
-    with tab1:
-        st.subheader("Clases Programadas (Próximas 48 horas)")
-        try:
-            clases = query("""
-                SELECT 
-                    c.id,
-                    c.nombre,
-                    s.nombre AS sede,
-                    c.fecha_hora,
-                    c.capacidad,
-                    COUNT(r.id) as reservas,
-                    (c.capacidad - COUNT(r.id)) as disponibles
-                FROM clase c 
-                JOIN sede s ON s.id = c.sede_id
-                LEFT JOIN reserva r ON r.clase_id = c.id AND r.estado = 'confirmada'
-                WHERE c.fecha_hora >= now() - interval '1 hour'
-                  AND c.fecha_hora <= now() + interval '48 hours'
-                  AND c.estado = 'programada'
-                GROUP BY c.id, c.nombre, s.nombre, c.fecha_hora, c.capacidad
-                ORDER BY c.fecha_hora
-                LIMIT 20
-            """)
-            if clases:
-                df_clases = pd.DataFrame(clases)
-                df_clases['fecha_hora'] = pd.to_datetime(df_clases['fecha_hora'])
-                st.dataframe(
-                    df_clases[['nombre', 'sede', 'fecha_hora', 'reservas', 'disponibles']], 
-                    use_container_width=True,
-                    column_config={
-                        'fecha_hora': st.column_config.DatetimeColumn(
-                            'Fecha y Hora',
-                            format='DD/MM/YYYY HH:mm'
+        if tab1:
+            with profiler.section("tab: próximas clases"):
+                st.subheader("Clases Programadas (Próximas 48 horas)")
+                try:
+                    pred, ps = sede_filter("c")
+                    df_clases = query_df(f"""
+                        SELECT 
+                            c.id,
+                            c.nombre,
+                            s.nombre AS sede,
+                            c.fecha_hora,
+                            c.capacidad,
+                            COUNT(r.id) as reservas,
+                            (c.capacidad - COUNT(r.id)) as disponibles
+                        FROM clase c 
+                        JOIN sede s ON s.id = c.sede_id
+                        LEFT JOIN reserva r ON r.clase_id = c.id AND r.estado = 'confirmada'
+                        WHERE c.fecha_hora >= now() - interval '1 hour'
+                          AND c.fecha_hora <= now() + interval '48 hours'
+                          AND c.estado = 'programada'{pred}
+                        GROUP BY c.id, c.nombre, s.nombre, c.fecha_hora, c.capacidad
+                        ORDER BY c.fecha_hora
+                        LIMIT 20
+                    """, tuple(ps))
+                    if not df_clases.empty:
+                        st.dataframe(
+                            df_clases[['nombre', 'sede', 'fecha_hora', 'reservas', 'disponibles']], 
+                            use_container_width=True,
+                            column_config={
+                                'fecha_hora': st.column_config.DatetimeColumn(
+                                    'Fecha y Hora',
+                                    format='DD/MM/YYYY HH:mm'
+                                )
+                            }
                         )
-                    }
-                )
-            else:
-                st.info("No hay clases programadas en las próximas 48 horas")
-        except Exception as e:
-            st.error(f"Error cargando clases: {e}")
+                    else:
+                        st.info("No hay clases programadas en las próximas 48 horas")
+                except Exception as e:
+                    st.error(f"Error cargando clases: {e}")
 
-    with tab2:
-        st.subheader("Últimos Accesos")
-        try:
-            accesos_recientes = query("""
-                SELECT 
-                    s.nombre as socio,
-                    se.nombre as sede,
-                    a.fecha_entrada,
-                    CASE WHEN a.fecha_salida IS NULL THEN 'Dentro' ELSE 'Salió' END as estado
-                FROM acceso a
-                JOIN socio s ON s.id = a.socio_id
-                JOIN sede se ON se.id = a.sede_id
-                ORDER BY a.fecha_entrada DESC
-                LIMIT 10
-            """)
-            if accesos_recientes:
-                df_accesos = pd.DataFrame(accesos_recientes)
-                df_accesos['fecha_entrada'] = pd.to_datetime(df_accesos['fecha_entrada'])
-                st.dataframe(
-                    df_accesos,
-                    use_container_width=True,
-                    column_config={
-                        'fecha_entrada': st.column_config.DatetimeColumn(
-                            'Hora de Entrada',
-                            format='DD/MM/YYYY HH:mm'
+        if tab2:
+            with profiler.section("tab: actividad reciente"):
+                st.subheader("Últimos Accesos")
+                try:
+                    pred, ps = sede_filter("a", glue=" WHERE ")
+                    df_accesos = query_df(f"""
+                        SELECT 
+                            s.nombre as socio,
+                            se.nombre as sede,
+                            a.fecha_entrada,
+                            CASE WHEN a.fecha_salida IS NULL THEN 'Dentro' ELSE 'Salió' END as estado
+                        FROM acceso a
+                        JOIN socio s ON s.id = a.socio_id
+                        JOIN sede se ON se.id = a.sede_id{pred}
+                        ORDER BY a.fecha_entrada DESC
+                        LIMIT 10
+                    """, tuple(ps))
+                    if not df_accesos.empty:
+                        st.dataframe(
+                            df_accesos,
+                            use_container_width=True,
+                            column_config={
+                                'fecha_entrada': st.column_config.DatetimeColumn(
+                                    'Hora de Entrada',
+                                    format='DD/MM/YYYY HH:mm'
+                                )
+                            }
                         )
-                    }
-                )
-            else:
-                st.info("No hay accesos recientes")
-        except Exception as e:
-            st.error(f"Error cargando accesos: {e}")
+                    else:
+                        st.info("No hay accesos recientes")
+                except Exception as e:
+                    st.error(f"Error cargando accesos: {e}")
 
-    with tab3:
-        st.subheader("Membresías que Vencen Pronto")
-        try:
-            vencimientos_detalle = query("""
-                SELECT 
-                    s.nombre as socio,
-                    s.telefono,
-                    mp.nombre as plan,
-                    m.fecha_fin,
-                    (m.fecha_fin - CURRENT_DATE) as dias_restantes
-                FROM membresia m
-                JOIN socio s ON s.id = m.socio_id
-                JOIN membresia_plan mp ON mp.id = m.plan_id
-                WHERE m.estado = 'activa' 
-                  AND m.fecha_fin BETWEEN CURRENT_DATE AND CURRENT_DATE + 15
-                ORDER BY m.fecha_fin
-            """)
-            if vencimientos_detalle:
-                df_venc = pd.DataFrame(vencimientos_detalle)
-                st.dataframe(df_venc, use_container_width=True)
-            else:
-                st.success("No hay membresías por vencer en los próximos 15 días")
-        except Exception as e:
-            st.error(f"Error cargando vencimientos: {e}")
+        if tab3:
+            with profiler.section("tab: vencimientos"):
+                st.subheader("Membresías que Vencen Pronto")
+                try:
+                    # Riesgo precalculado por tools/churn.py: los de mayor riesgo primero
+                    df_venc = query_df("""
+                        SELECT 
+                            s.nombre as socio,
+                            s.telefono,
+                            mp.nombre as plan,
+                            m.fecha_fin,
+                            (m.fecha_fin - CURRENT_DATE) as dias_restantes,
+                            sr.riesgo,
+                            sr.nivel
+                        FROM membresia m
+                        JOIN socio s ON s.id = m.socio_id
+                        JOIN membresia_plan mp ON mp.id = m.plan_id
+                        LEFT JOIN socio_riesgo sr ON sr.socio_id = m.socio_id
+                        -- un congelamiento fijo ya cumplido cuenta como activa (sp_reactivar_congeladas)
+                        WHERE (m.estado = 'activa' OR (m.estado = 'congelada' AND m.congelada_hasta <= CURRENT_DATE))
+                          AND m.fecha_fin BETWEEN CURRENT_DATE AND CURRENT_DATE + 15
+                        ORDER BY sr.riesgo DESC NULLS LAST, m.fecha_fin
+                    """)
+                    if not df_venc.empty:
+                        df_venc["riesgo"] = df_venc["riesgo"] * 100
+                        st.dataframe(
+                            df_venc,
+                            use_container_width=True,
+                            column_config={
+                                "riesgo": st.column_config.ProgressColumn(
+                                    "Riesgo de abandono", format="%.0f%%", min_value=0, max_value=100
+                                ),
+                                "nivel": "Nivel",
+                            }
+                        )
+                    else:
+                        st.success("No hay membresías por vencer en los próximos 15 días")
+                except Exception as e:
+                    st.error(f"Error cargando vencimientos: {e}")
 
-    with tab4:
-        st.subheader("Productos Más Vendidos (Último Mes)")
-        try:
-            top_productos = query("""
-                SELECT 
-                    p.nombre,
-                    SUM(vi.cantidad) as total_vendido,
-                    SUM(vi.subtotal) as ingresos,
-                    p.stock as stock_actual
-                FROM venta_item vi
-                JOIN producto p ON p.id = vi.producto_id
-                JOIN venta v ON v.id = vi.venta_id
-                WHERE v.fecha >= CURRENT_DATE - 30
-                GROUP BY p.id, p.nombre, p.stock
-                ORDER BY total_vendido DESC
-                LIMIT 10
-            """)
-            if top_productos:
-                df_productos = pd.DataFrame(top_productos)
-                st.dataframe(df_productos, use_container_width=True)
-            else:
-                st.info("No hay ventas de productos en el último mes")
-        except Exception as e:
-            st.error(f"Error cargando productos: {e}")
+        if tab4:
+            with profiler.section("tab: top productos"):
+                st.subheader("Productos Más Vendidos (Último Mes)")
+                try:
+                    pred, ps = sede_filter("v")
+                    df_productos = query_df(f"""
+                        SELECT 
+                            p.nombre,
+                            SUM(vi.cantidad) as total_vendido,
+                            SUM(vi.subtotal) as ingresos,
+                            p.stock as stock_actual
+                        FROM venta_item vi
+                        JOIN producto p ON p.id = vi.producto_id
+                        JOIN venta v ON v.id = vi.venta_id
+                        WHERE v.fecha >= CURRENT_DATE - 30{pred}
+                        GROUP BY p.id, p.nombre, p.stock
+                        ORDER BY total_vendido DESC
+                        LIMIT 10
+                    """, tuple(ps))
+                    if not df_productos.empty:
+                        st.dataframe(df_productos, use_container_width=True)
+                    else:
+                        st.info("No hay ventas de productos en el último mes")
+                except Exception as e:
+                    st.error(f"Error cargando productos: {e}")
+
+    detalle()
 
     # === ACCIONES RÁPIDAS ===
     st.divider()
@@ -375,3 +421,5 @@ else:
     st.divider()
     st.caption(f"🕒 Última actualización: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
     st.caption("💡 **Sugerencia:** Si encuentras errores al navegar a otras páginas, todas las funciones principales están disponibles desde este dashboard.")
+
+profiler.render_panel()
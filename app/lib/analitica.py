@@ -0,0 +1,413 @@
+# app/lib/analitica.py
+"""
+Analítica sobre snapshots columnares (Parquet) en lugar del Postgres transaccional.
+
+snapshot() copia pago, venta, venta_item, acceso y membresia a archivos
+Parquet locales, de forma incremental:
+  - por marca de agua de id (solo las filas nuevas), particionado por mes;
+  - las tablas que cambian después de insertarse se releen en una ventana
+    reciente (ventas anuladas: se borran; accesos: fecha_salida), que
+    reemplaza a la copia anterior de esa ventana; pago relee el último día
+    porque los id se asignan antes del commit (un id menor puede confirmarse
+    después de uno mayor y quedar bajo la marca de agua);
+  - membresia (pequeña, se actualiza en cualquier fecha) se copia entera.
+Pensado para cron (python -m tools.snapshot_analitica) o el botón de Reportes.
+
+Los reportes (ingresos por día/mes/medio/sede, mix de productos, frecuencia de
+visitas) corren sobre esos archivos con DuckDB si está instalado y, si no, con
+pandas vectorizado (pyarrow lee solo las columnas y particiones necesarias).
+No tocan la BD: cuestan lo que leer unos Parquet locales.
+
+    from app.lib import analitica
+    analitica.snapshot()                         # incremental
+    analitica.ingresos_por_mes(sede_id=2)        # DataFrame mes/medio/sede_id/ingresos
+
+Variables de entorno:
+    ANALYTICS             0 para desactivar (Reportes vuelve a consultar la BD)
+    ANALYTICS_DIR         carpeta de los Parquet (default: <tmp>/gym_analytics)
+    ANALYTICS_RELEER_DIAS ventana que se relee de venta/venta_item (default 7)
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from psycopg import IsolationLevel
+from psycopg.rows import tuple_row
+
+from . import metrics
+from .db import get_conn
+
+try:
+    import duckdb
+except ImportError:   # opcional: sin DuckDB los reportes usan pandas
+    duckdb = None
+
+ENABLED = os.getenv("ANALYTICS", "1").strip().lower() not in ("0", "false", "off", "no")
+DIR = os.getenv("ANALYTICS_DIR") or os.path.join(tempfile.gettempdir(), "gym_analytics")
+RELEER_DIAS = int(os.getenv("ANALYTICS_RELEER_DIAS", "7"))
+APP_TZ = os.getenv("APP_TZ", "America/Lima")
+BLOQUE = 50_000       # filas por ida al servidor al extraer
+
+SNAPSHOT_SECONDS = metrics.histogram("gym_analytics_snapshot_seconds", "Duración de un snapshot de analítica",
+                                     buckets=(0.5, 1, 2, 5, 10, 30, 60, 120, 300))
+SNAPSHOT_ROWS = metrics.counter("gym_analytics_snapshot_rows_total", "Filas copiadas a Parquet", ["tabla"])
+REPORT_SECONDS = metrics.histogram("gym_analytics_report_seconds", "Duración de un reporte de analítica",
+                                   ["reporte", "motor"], buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2))
+
+# tabla -> extracción. id/fecha: columnas (con alias de la consulta) para la marca de
+# agua y la ventana; releer: días recientes que se vuelven a copiar; numericas: NUMERIC -> float
+TABLAS = {
+    "pago": {
+        "sql": "SELECT id, socio_id, sede_id, fecha, monto, medio FROM pago",
+        "id": "id", "fecha": "fecha", "releer": 1, "numericas": ["monto"],
+    },
+    "venta": {
+        "sql": "SELECT id, socio_id, sede_id, fecha, total FROM venta",
+        "id": "id", "fecha": "fecha", "releer": RELEER_DIAS, "numericas": ["total"],
+    },
+    "venta_item": {
+        # Desnormalizada (fecha, sede y nombre del producto): el mix no necesita joins
+        "sql": """SELECT vi.id, vi.venta_id, v.fecha, v.sede_id, vi.producto_id, p.nombre AS producto, vi.cantidad,
+                         COALESCE(vi.subtotal, vi.cantidad * COALESCE(vi.precio_unitario, vi.precio)) AS subtotal
+                  FROM venta_item vi JOIN venta v ON v.id = vi.venta_id JOIN producto p ON p.id = vi.producto_id""",
+        "id": "vi.id", "fecha": "v.fecha", "releer": RELEER_DIAS, "numericas": ["subtotal"],
+    },
+    "acceso": {
+        "sql": "SELECT id, socio_id, sede_id, fecha_entrada AS fecha, fecha_salida FROM acceso",
+        "id": "id", "fecha": "fecha_entrada", "releer": 2,
+    },
+    "membresia": {
+        "sql": """SELECT m.id, m.socio_id, m.plan_id, mp.nombre AS plan, m.fecha_inicio, m.fecha_fin, m.estado
+                  FROM membresia m JOIN membresia_plan mp ON mp.id = m.plan_id""",
+        "completa": True,
+    },
+}
+
+_lock = threading.Lock()
+
+# -------------------------------------------
+# Marcas de agua
+# -------------------------------------------
+def _ruta(*partes):
+    return os.path.join(DIR, *partes)
+
+def estado() -> dict:
+    """{tabla: {"max_id", "filas", "actualizado"}} del último snapshot ({} si no hay)."""
+    try:
+        with open(_ruta("_estado.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _guardar_estado(est: dict):
+    tmp = _ruta("_estado.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(est, f, indent=2)
+    os.replace(tmp, _ruta("_estado.json"))
+
+def disponible() -> bool:
+    """True si el modo analítica está activo y ya hay un snapshot."""
+    return ENABLED and bool(estado())
+
+def actualizado() -> datetime | None:
+    """Momento del snapshot más antiguo entre las tablas (lo que puede faltar en los reportes)."""
+    est = estado()
+    if not est:
+        return None
+    return min(datetime.fromisoformat(t["actualizado"]) for t in est.values())
+
+# -------------------------------------------
+# Snapshot
+# -------------------------------------------
+def _extraer(conn, tabla, sql, params) -> pd.DataFrame:
+    """Filas de `sql` con un cursor de servidor: se traen de a BLOQUE, no todo el resultado de una vez."""
+    with conn.cursor(name=f"snapshot_{tabla}", row_factory=tuple_row) as cur:
+        cur.itersize = BLOQUE
+        cur.execute(sql, params)
+        columnas = [d.name for d in cur.description]
+        return pd.DataFrame.from_records(iter(cur), columns=columnas)
+
+def _tipar(df: pd.DataFrame, spec: dict) -> pd.DataFrame:
+    for c in spec.get("numericas", []):
+        df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+    for c in ("fecha", "fecha_salida"):
+        if c in df:
+            df[c] = pd.to_datetime(df[c], utc=True)
+    for c in ("fecha_inicio", "fecha_fin"):
+        if c in df:
+            df[c] = pd.to_datetime(df[c])
+    for c in ("sede_id", "socio_id"):
+        if c in df:
+            df[c] = df[c].astype("Int64")   # admite NULL (ventas/pagos sin sede)
+    return df
+
+def _escribir(df: pd.DataFrame, ruta: str):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    tmp = os.path.join(os.path.dirname(ruta), "." + os.path.basename(ruta) + ".tmp")   # pyarrow ignora ".*"
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp, compression="zstd")
+    os.replace(tmp, ruta)   # los lectores ven el archivo viejo o el nuevo, nunca uno a medias
+
+def _fusionar(carpeta_tabla: str, nuevos: pd.DataFrame, corte):
+    """Mezcla `nuevos` en las particiones mensuales que tocan (y en las que corta la ventana)."""
+    mes = nuevos["fecha"].dt.strftime("%Y-%m")
+    meses = set(mes)
+    if corte is not None:
+        carpeta = _ruta(carpeta_tabla)
+        existentes = {n[:-8] for n in os.listdir(carpeta) if n.endswith(".parquet")} if os.path.isdir(carpeta) else set()
+        meses |= {m for m in existentes if m >= corte.strftime("%Y-%m")}
+    ids = nuevos["id"]
+    for m in sorted(meses):
+        ruta = _ruta(carpeta_tabla, f"{m}.parquet")
+        parte = nuevos[mes == m]
+        if os.path.exists(ruta):
+            viejo = pd.read_parquet(ruta)
+            quedan = ~viejo["id"].isin(ids)
+            if corte is not None:
+                quedan &= viejo["fecha"] < corte   # la ventana se reemplaza: desaparecen las filas borradas
+            parte = pd.concat([viejo[quedan], parte], ignore_index=True) if len(parte) else viejo[quedan]
+        if len(parte):
+            _escribir(parte.sort_values("id"), ruta)
+        elif os.path.exists(ruta):
+            os.remove(ruta)
+
+def _filas(tabla) -> int:
+    carpeta = _ruta(tabla)
+    if not os.path.isdir(carpeta):
+        return 0
+    return sum(pq.ParquetFile(os.path.join(carpeta, n)).metadata.num_rows
+               for n in os.listdir(carpeta) if n.endswith(".parquet"))
+
+def _copiar(conn, tabla: str, spec: dict, previo: dict, carpeta: str | None = None) -> tuple[int, dict]:
+    """
+    Copia una tabla (completa o el delta desde `previo`) a su carpeta (u otra,
+    para armar un snapshot completo aparte); devuelve (filas leídas, nueva marca de agua).
+    """
+    carpeta = carpeta or tabla
+    ahora = datetime.now(timezone.utc)
+    max_id = int(previo.get("max_id", 0))
+    if spec.get("completa"):
+        df = _tipar(_extraer(conn, tabla, spec["sql"], ()), spec)
+        _escribir(df, _ruta(carpeta, "todo.parquet"))
+    else:
+        corte = ahora - timedelta(days=spec["releer"]) if spec["releer"] and previo else None
+        cond = f"{spec['id']} > %s" + (f" OR {spec['fecha']} >= %s" if corte else "")
+        where = " AND " if " where " in spec["sql"].lower() else " WHERE "
+        params = (max_id, corte) if corte else (max_id,)
+        df = _tipar(_extraer(conn, tabla, f"{spec['sql']}{where}({cond})", params), spec)
+        if len(df) or corte is not None:
+            _fusionar(carpeta, df, corte)
+    if len(df):
+        max_id = max(max_id, int(df["id"].max()))
+    return len(df), {"max_id": max_id, "filas": _filas(carpeta), "actualizado": ahora.isoformat(timespec="seconds")}
+
+def snapshot(completo: bool = False, tablas=None) -> dict:
+    """
+    Copia las tablas a Parquet (incremental salvo completo=True) y devuelve
+    {tabla: filas leídas de la BD}. Un snapshot a la vez por proceso.
+
+    completo=True arma cada tabla en una carpeta aparte (".tabla.nuevo") y solo
+    al terminar todas las cambia por las actuales: si la copia falla, Reportes
+    sigue con el snapshot anterior.
+    """
+    t0 = time.perf_counter()
+    with _lock:
+        est = estado()
+        os.makedirs(DIR, exist_ok=True)
+        copiadas = {}
+        nuevas = {}   # tabla -> carpeta aparte (completo)
+        try:
+            # sede=None: se copia toda la red aunque lo dispare (botón de Reportes) un
+            # usuario limitado a una sede; con RLS vería solo la suya y las marcas de
+            # agua compartidas saltarían las filas de las demás
+            with get_conn(timeout="batch", sede=None) as conn:
+                # REPEATABLE READ: todas las consultas ven el mismo instante (venta y
+                # venta_item, pago y membresia coinciden); solo lectura
+                conn.isolation_level = IsolationLevel.REPEATABLE_READ
+                conn.read_only = True
+                for tabla, spec in TABLAS.items():
+                    if tablas and tabla not in tablas:
+                        continue
+                    previo = est.get(tabla, {})
+                    if completo:
+                        nuevas[tabla] = f".{tabla}.nuevo"
+                        shutil.rmtree(_ruta(nuevas[tabla]), ignore_errors=True)
+                        previo = {}
+                    copiadas[tabla], est[tabla] = _copiar(conn, tabla, spec, previo, nuevas.get(tabla))
+                    SNAPSHOT_ROWS.inc(copiadas[tabla], tabla=tabla)
+                conn.rollback()
+        except BaseException:
+            for carpeta in nuevas.values():
+                shutil.rmtree(_ruta(carpeta), ignore_errors=True)
+            raise
+        for tabla, carpeta in nuevas.items():
+            viejo = _ruta(f".{tabla}.viejo")
+            shutil.rmtree(viejo, ignore_errors=True)
+            if os.path.isdir(_ruta(tabla)):
+                os.rename(_ruta(tabla), viejo)
+            if os.path.isdir(_ruta(carpeta)):   # sin filas no hay carpeta: la tabla queda vacía
+                os.rename(_ruta(carpeta), _ruta(tabla))
+            shutil.rmtree(viejo, ignore_errors=True)
+        _guardar_estado(est)
+    SNAPSHOT_SECONDS.observe(time.perf_counter() - t0)
+    return copiadas
+
+# -------------------------------------------
+# Motores de consulta
+# -------------------------------------------
+def motor() -> str:
+    return "duckdb" if duckdb is not None else "pandas"
+
+def _glob(tabla):
+    return _ruta(tabla, "*.parquet").replace("'", "''")
+
+def _hay(tabla) -> bool:
+    """True si la tabla tiene algún Parquet: sin filas copiadas todavía no existe su carpeta."""
+    carpeta = _ruta(tabla)
+    return os.path.isdir(carpeta) and any(n.endswith(".parquet") for n in os.listdir(carpeta))
+
+def _usar_duck(tabla) -> bool:
+    # read_parquet() sin archivos falla ("No files found"): esas tablas van por pandas, que da vacío
+    return duckdb is not None and _hay(tabla)
+
+def _duck(sql: str, params=()) -> pd.DataFrame:
+    """SQL de DuckDB; {pago}, {venta}... se reemplazan por read_parquet() de cada tabla."""
+    con = duckdb.connect()
+    try:
+        con.execute(f"SET TimeZone = '{APP_TZ.replace(chr(39), '')}'")
+        vistas = {t: f"read_parquet('{_glob(t)}')" for t in TABLAS}
+        return con.execute(sql.format(**vistas), params).df()
+    finally:
+        con.close()
+
+def _leer(tabla: str, columnas: list[str], desde=None, sede_id=None) -> pd.DataFrame:
+    """Columnas de la tabla, filtradas por fecha/sede al leer (pyarrow salta row groups)."""
+    carpeta = _ruta(tabla)
+    if not _hay(tabla):
+        # Vacío pero con las fechas tipadas, para que .dt y las comparaciones funcionen igual
+        df = pd.DataFrame(columns=columnas)
+        if "fecha" in df:
+            df["fecha"] = pd.to_datetime(df["fecha"], utc=True).dt.tz_convert(APP_TZ)
+        for c in ("fecha_inicio", "fecha_fin"):
+            if c in df:
+                df[c] = pd.to_datetime(df[c])
+        return df
+    filtros = []
+    if desde is not None:
+        filtros.append(("fecha", ">=", pd.Timestamp(desde).tz_convert("UTC") if pd.Timestamp(desde).tzinfo
+                        else pd.Timestamp(desde, tz=APP_TZ).tz_convert("UTC")))
+    if sede_id is not None:
+        filtros.append(("sede_id", "=", int(sede_id)))
+    df = pd.read_parquet(carpeta, columns=columnas, filters=filtros or None)
+    if "fecha" in df:
+        df["fecha"] = df["fecha"].dt.tz_convert(APP_TZ)
+    return df
+
+def _medir(nombre):
+    def deco(fn):
+        def envoltura(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                REPORT_SECONDS.observe(time.perf_counter() - t0, reporte=nombre, motor=motor())
+        envoltura.__name__, envoltura.__doc__ = fn.__name__, fn.__doc__
+        return envoltura
+    return deco
+
+def _inicio_dia(dias: int):
+    return pd.Timestamp.now(tz=APP_TZ).normalize() - pd.Timedelta(days=dias - 1)
+
+def _sede_sql(sede_id, alias=""):
+    return (f" AND {alias}sede_id = ?", [int(sede_id)]) if sede_id is not None else ("", [])
+
+# -------------------------------------------
+# Reportes
+# -------------------------------------------
+@_medir("ingresos_dia")
+def ingresos_por_dia(dias: int = 60, sede_id=None) -> pd.DataFrame:
+    """dia, ingresos (pagos) de los últimos `dias` días en APP_TZ."""
+    desde = _inicio_dia(dias)
+    if _usar_duck("pago"):
+        pred, p = _sede_sql(sede_id)
+        return _duck(f"""
+            SELECT CAST(fecha AS DATE) AS dia, SUM(monto) AS ingresos
+            FROM {{pago}} WHERE fecha >= ?{pred} GROUP BY 1 ORDER BY 1
+        """, [desde.to_pydatetime(), *p])
+    df = _leer("pago", ["fecha", "monto", "sede_id"], desde, sede_id)
+    return (df.assign(dia=df["fecha"].dt.date).groupby("dia", as_index=False)["monto"].sum()
+            .rename(columns={"monto": "ingresos"}))
+
+@_medir("ingresos_mes")
+def ingresos_por_mes(meses: int = 12, sede_id=None) -> pd.DataFrame:
+    """mes (primer día), medio, sede_id, ingresos y pagos: se pivotea por medio o por sede en la página."""
+    desde = pd.Timestamp.now(tz=APP_TZ).normalize().replace(day=1) - pd.DateOffset(months=meses - 1)
+    if _usar_duck("pago"):
+        pred, p = _sede_sql(sede_id)
+        return _duck(f"""
+            SELECT CAST(date_trunc('month', fecha) AS DATE) AS mes, medio, sede_id,
+                   SUM(monto) AS ingresos, COUNT(*) AS pagos
+            FROM {{pago}} WHERE fecha >= ?{pred} GROUP BY ALL ORDER BY 1, 2
+        """, [desde.to_pydatetime(), *p])
+    df = _leer("pago", ["fecha", "monto", "medio", "sede_id"], desde, sede_id)
+    df["mes"] = df["fecha"].dt.tz_localize(None).dt.to_period("M").dt.start_time.dt.date
+    return (df.groupby(["mes", "medio", "sede_id"], as_index=False, dropna=False)
+            .agg(ingresos=("monto", "sum"), pagos=("monto", "size")).sort_values(["mes", "medio"]))
+
+@_medir("mix_productos")
+def mix_productos(dias: int = 30, sede_id=None) -> pd.DataFrame:
+    """producto, unidades, ingresos, ventas y % de los ingresos del período, de mayor a menor."""
+    desde = _inicio_dia(dias)
+    if _usar_duck("venta_item"):
+        pred, p = _sede_sql(sede_id)
+        df = _duck(f"""
+            SELECT producto, SUM(cantidad) AS unidades, SUM(subtotal) AS ingresos, COUNT(DISTINCT venta_id) AS ventas
+            FROM {{venta_item}} WHERE fecha >= ?{pred} GROUP BY 1 ORDER BY ingresos DESC
+        """, [desde.to_pydatetime(), *p])
+    else:
+        df = _leer("venta_item", ["fecha", "venta_id", "producto", "cantidad", "subtotal", "sede_id"], desde, sede_id)
+        df = (df.groupby("producto", as_index=False)
+              .agg(unidades=("cantidad", "sum"), ingresos=("subtotal", "sum"), ventas=("venta_id", "nunique"))
+              .sort_values("ingresos", ascending=False, ignore_index=True))
+    total = df["ingresos"].sum()
+    df["pct"] = (df["ingresos"] / total * 100).round(1) if total else 0.0
+    return df
+
+FRECUENCIA_TRAMOS = [(1, 1, "1"), (2, 4, "2-4"), (5, 8, "5-8"), (9, 12, "9-12"), (13, None, "13+")]
+
+@_medir("frecuencia_visitas")
+def frecuencia_visitas(dias: int = 30, sede_id=None) -> pd.DataFrame:
+    """tramo de visitas por socio en el período (1, 2-4, ...), socios y % (solo socios con ≥1 visita)."""
+    desde = _inicio_dia(dias)
+    if _usar_duck("acceso"):
+        pred, p = _sede_sql(sede_id)
+        visitas = _duck(f"""
+            SELECT socio_id, COUNT(*) AS visitas FROM {{acceso}} WHERE fecha >= ?{pred} GROUP BY 1
+        """, [desde.to_pydatetime(), *p])["visitas"]
+    else:
+        visitas = _leer("acceso", ["fecha", "socio_id", "sede_id"], desde, sede_id)["socio_id"].value_counts()
+    bordes = [lo - 0.5 for lo, _, _ in FRECUENCIA_TRAMOS] + [float("inf")]
+    tramos = pd.cut(visitas, bordes, labels=[t for _, _, t in FRECUENCIA_TRAMOS])
+    df = tramos.value_counts(sort=False).rename_axis("visitas").reset_index(name="socios")
+    df["pct"] = (df["socios"] / df["socios"].sum() * 100).round(1) if len(visitas) else 0.0
+    return df
+
+@_medir("membresias_plan")
+def membresias_por_plan() -> pd.DataFrame:
+    """plan, activas (vigentes hoy) y socios distintos, de mayor a menor."""
+    hoy = pd.Timestamp.now(tz=APP_TZ).normalize().tz_localize(None)
+    if _usar_duck("membresia"):
+        return _duck("""
+            SELECT plan, COUNT(*) AS activas, COUNT(DISTINCT socio_id) AS socios
+            FROM {membresia} WHERE estado = 'activa' AND fecha_fin >= ? GROUP BY 1 ORDER BY activas DESC
+        """, [hoy.to_pydatetime()])
+    df = _leer("membresia", ["plan", "socio_id", "estado", "fecha_fin"])
+    df = df[(df["estado"] == "activa") & (df["fecha_fin"] >= hoy)]
+    return (df.groupby("plan", as_index=False).agg(activas=("socio_id", "size"), socios=("socio_id", "nunique"))
+            .sort_values("activas", ascending=False, ignore_index=True))
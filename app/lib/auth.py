@@ -1,9 +1,20 @@
 # app/lib/auth.py
 import hashlib
+import ipaddress
 import json
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg
 import streamlit as st
+from . import db, estado, metrics
 from .db import query
 
+LOGINS = metrics.counter("gym_login_total", "Intentos de login", ["result"])
+PERMISSION_DENIED = metrics.counter("gym_permission_denied_total", "Accesos denegados por permisos", ["perm"])
+
 # -------------------------------------------
 # Fallback local (por si aún no migras a tablas RBAC)
 # -------------------------------------------
@@ -39,9 +50,6 @@ FALLBACK_PERMISSIONS = {
 # -------------------------------------------
 # Utilidades internas
 # -------------------------------------------
-def _sha256(s: str) -> str:
-    return hashlib.sha256(s.encode("utf-8")).hexdigest()
-
 def _load_roles_for_user(user_id: int) -> list[str]:
     """Devuelve roles del usuario desde tabla user_role (si existe)."""
     try:
@@ -63,7 +71,10 @@ def load_permissions(user_id: int) -> None:
     Carga y cachea permisos efectivos del usuario:
       - Intenta vista v_user_permissions (roles + overrides)
       - Si falla, usa FALLBACK_PERMISSIONS en base al rol de app_user
+    Guarda la versión de estado.version("permisos", user_id) con la que se cargaron:
+    si otro proceso invalida al usuario, has_permission() los recarga.
     """
+    st.session_state["permissions_version"] = estado.version("permisos", user_id)
     try:
         rows = query("SELECT perm FROM v_user_permissions WHERE user_id = %s", (user_id,))
         st.session_state["permissions"] = {r["perm"] for r in rows}
@@ -83,8 +94,11 @@ def load_permissions(user_id: int) -> None:
 def has_permission(perm: str) -> bool:
     """True si el usuario tiene el permiso. Usa cache en session_state."""
     perms = st.session_state.get("permissions")
+    u = st.session_state.get("user")
+    if perms is not None and u and st.session_state.get("permissions_version") != estado.version("permisos", u["id"]):
+        _refrescar_usuario(u["id"])
+        perms, u = None, st.session_state.get("user")
     if perms is None:
-        u = st.session_state.get("user")
         if not u:
             return False
         load_permissions(u["id"])
@@ -103,6 +117,7 @@ def require_perm(*perms: str):
     require_login()
     missing = [p for p in perms if not has_permission(p)]
     if missing:
+        PERMISSION_DENIED.inc(perm=",".join(missing))
         st.error("No tienes permisos para esta acción.")
         st.stop()
 
@@ -110,61 +125,210 @@ def require_any(*perms: str):
     """Bloquea si no tiene NINGUNO de los permisos (OR)."""
     require_login()
     if not any(has_permission(p) for p in perms):
+        PERMISSION_DENIED.inc(perm="|".join(perms))
         st.error("No tienes permisos suficientes.")
         st.stop()
 
 def has_role(role_name: str) -> bool:
+    u = st.session_state.get("user")
+    if u and "roles" not in st.session_state:
+        load_permissions(u["id"])   # sesión restaurada de otro worker: aún sin roles cargados
     roles = st.session_state.get("roles") or []
     return role_name.lower() in [r.lower() for r in roles]
 
 def require_role(*roles):
     require_login()
     if not any(has_role(r) for r in roles):
+        PERMISSION_DENIED.inc(perm="role:" + "|".join(roles))
         st.error("No tienes permisos para esta acción.")
         st.stop()
 
+def _refrescar_usuario(user_id: int):
+    """Relee rol y sede del usuario tras una invalidación (p.ej. editado en Usuarios)."""
+    st.session_state.pop("permissions", None)   # antes de consultar: sin permisos no hay sede (ni recursión)
+    rows = query("SELECT id, email, rol, sede_id FROM app_user WHERE id = %s", (user_id,), replica=False)
+    if not rows:
+        logout()
+        return
+    estado.guardar("user", dict(rows[0]))
+
+def _validar_sesion(user: dict):
+    """Usuario de una sesión compartida releído de la BD; None si ya no existe o cambió de rol."""
+    rows = query("SELECT id, email, rol, sede_id FROM app_user WHERE id = %s", (user.get("id"),))
+    if not rows or rows[0]["rol"] != user.get("rol"):
+        return None
+    return dict(rows[0])
+
+estado.set_validador_usuario(_validar_sesion)
+
 def logout():
-    for k in ("user", "permissions", "roles", "jwt", "auth_user", "session_id", "col_index"):
+    estado.cerrar()
+    for k in ("user", "permissions", "permissions_version", "roles", "jwt", "auth_user", "session_id", "col_index"):
         st.session_state.pop(k, None)
 
 def on_login_success(user: dict):
-    """Guarda usuario y carga permisos efectivos."""
-    st.session_state["user"] = user
+    """Guarda usuario (también en el estado compartido) y carga permisos efectivos."""
+    estado.guardar("user", user)
     load_permissions(user["id"])
 
 # -------------------------------------------
 # Login / sesión
 # -------------------------------------------
-def _db_login(email: str, password: str):
+# Una sola ida a la BD por intento: la sentencia preparada elige el esquema del
+# hash (bcrypt "$2a$..." con crypt(), o el SHA-256 hex heredado) y, si la clave
+# es correcta y el hash era SHA-256, lo reemplaza por bcrypt en la misma
+# transacción (migración transparente al iniciar sesión).
+db.register_statement("auth.login", """
+    WITH u AS (
+        SELECT id, email, rol, sede_id,
+               password_hash LIKE '$2%%' AS bcrypt,
+               CASE WHEN password_hash LIKE '$2%%' THEN password_hash = crypt(%(pw)s::text, password_hash)
+                    ELSE password_hash = encode(sha256(convert_to(%(pw)s::text, 'UTF8')), 'hex') END AS ok
+        FROM app_user
+        WHERE email = %(email)s
+        LIMIT 1
+    ), rehash AS (
+        UPDATE app_user a SET password_hash = crypt(%(pw)s::text, gen_salt('bf', %(coste)s::int))
+        FROM u WHERE a.id = u.id AND u.ok AND NOT u.bcrypt
+        RETURNING a.id
+    )
+    SELECT u.id, u.email, u.rol, u.sede_id, u.ok, EXISTS (SELECT 1 FROM rehash) AS rehash
+    FROM u
+""")
+# Sin pgcrypto (p.ej. un Postgres de desarrollo sin la extensión) solo se puede
+# validar el SHA-256 heredado, con sha256() del núcleo
+db.register_statement("auth.login_sha256", """
+    SELECT id, email, rol, sede_id,
+           password_hash = encode(sha256(convert_to(%(pw)s::text, 'UTF8')), 'hex') AS ok, false AS rehash
+    FROM app_user
+    WHERE email = %(email)s
+    LIMIT 1
+""")
+
+BCRYPT_COSTE = int(os.getenv("BCRYPT_COST", "10"))
+LOGIN_VENTANA_S = float(os.getenv("LOGIN_WINDOW_S", "300"))
+LOGIN_MAX_EMAIL = int(os.getenv("LOGIN_MAX_PER_EMAIL", "5"))     # intentos por email en la ventana
+LOGIN_MAX_IP = int(os.getenv("LOGIN_MAX_PER_IP", "20"))          # intentos fallidos por IP en la ventana
+# Proxies (IPs o redes CIDR, separadas por comas) cuyo X-Forwarded-For se cree; sin esto se usa la IP del socket
+LOGIN_PROXIES = [ipaddress.ip_network(x.strip(), strict=False)
+                 for x in os.getenv("LOGIN_TRUSTED_PROXIES", "").split(",") if x.strip()]
+
+REHASHES = metrics.counter("gym_login_rehash_total", "Hashes SHA-256 migrados a bcrypt al iniciar sesión")
+
+_pgcrypto = {"ok": True}   # pasa a False la primera vez que falta crypt()/gen_salt()
+
+def hash_password(password: str) -> str:
+    """Hash bcrypt (pgcrypto) para app_user.password_hash; SHA-256 si la BD no tiene pgcrypto."""
+    if _pgcrypto["ok"]:
+        try:
+            return query("SELECT crypt(%s::text, gen_salt('bf', %s::int)) AS h",
+                         (password, BCRYPT_COSTE), replica=False)[0]["h"]
+        except psycopg.errors.UndefinedFunction:
+            _pgcrypto["ok"] = False
+    return hashlib.sha256(password.encode("utf-8")).hexdigest()   # se migra a bcrypt al instalar pgcrypto
+
+class _Limitador:
     """
-    Valida con pgcrypto/crypt() en la BD (bcrypt). Si no está disponible,
-    cae a comparar SHA-256 (compatibilidad con tu implementación previa).
+    Ventana deslizante en memoria: como mucho `maximo` intentos por clave en
+    los últimos `ventana` segundos. Es por proceso: con N workers o réplicas de la
+    app el límite efectivo es N veces el configurado (suficiente para cortar
+    ráfagas antes de que lleguen a Postgres; no es un control distribuido).
     """
-    # 1) Intento con pgcrypto/crypt()
+
+    def __init__(self, maximo: int, ventana: float, max_claves: int = 10000):
+        self.maximo, self.ventana, self.max_claves = maximo, ventana, max_claves
+        self._lock = threading.Lock()
+        self._intentos: dict[str, deque] = {}
+
+    def _podar(self, q: deque, ahora: float):
+        while q and ahora - q[0] >= self.ventana:
+            q.popleft()
+
+    def espera(self, clave: str) -> float:
+        """Segundos hasta que `clave` pueda intentar de nuevo (0 si puede ya)."""
+        ahora = time.time()
+        with self._lock:
+            q = self._intentos.get(clave)
+            if not q:
+                return 0.0
+            self._podar(q, ahora)
+            return q[0] + self.ventana - ahora if len(q) >= self.maximo else 0.0
+
+    def registrar(self, clave: str):
+        ahora = time.time()
+        with self._lock:
+            if len(self._intentos) >= self.max_claves:
+                for k in [k for k, q in self._intentos.items() if not q or ahora - q[-1] >= self.ventana]:
+                    del self._intentos[k]
+            q = self._intentos.setdefault(clave, deque())
+            self._podar(q, ahora)
+            q.append(ahora)
+
+    def descontar(self, clave: str):
+        """Quita el último intento registrado (el que resultó correcto)."""
+        with self._lock:
+            q = self._intentos.get(clave)
+            if q:
+                q.pop()
+
+    def limpiar(self, clave: str):
+        with self._lock:
+            self._intentos.pop(clave, None)
+
+_por_email = _Limitador(LOGIN_MAX_EMAIL, LOGIN_VENTANA_S)
+_por_ip = _Limitador(LOGIN_MAX_IP, LOGIN_VENTANA_S)
+
+def _de_confianza(ip: str) -> bool:
     try:
-        rows = query("""
-            SELECT id, email, rol, sede_id,
-                   (password_hash = crypt(%s, password_hash)) AS ok
-            FROM app_user
-            WHERE email = %s
-            LIMIT 1
-        """, (password, email))
-        if rows and rows[0].get("ok"):
-            return {"id": rows[0]["id"], "email": rows[0]["email"], "rol": rows[0]["rol"], "sede_id": rows[0]["sede_id"]}
-        # Si no ok, cae al fallback más abajo
-    except Exception:
-        # Puede fallar si no existe la extensión pgcrypto o si password_hash tiene otro formato
-        pass
+        dir_ip = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(dir_ip in red for red in LOGIN_PROXIES)
 
-    # 2) Fallback a SHA-256 (tu código original)
+def _ip_cliente() -> str | None:
+    """
+    IP del navegador, o None si no se conoce (sin request: no hay cubeta por IP).
+    X-Forwarded-For solo se lee si la conexión viene de un proxy de LOGIN_TRUSTED_PROXIES:
+    se toma el último salto que no sea de confianza (los anteriores los escribe el cliente).
+    """
     try:
-        rows = query("SELECT id, email, password_hash, rol, sede_id FROM app_user WHERE email=%s LIMIT 1", (email,))
-        if rows and rows[0]["password_hash"] == _sha256(password):
-            return {"id": rows[0]["id"], "email": rows[0]["email"], "rol": rows[0]["rol"], "sede_id": rows[0]["sede_id"]}
+        from streamlit.runtime import Runtime
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+        cliente = Runtime.instance().get_client(ctx.session_id) if ctx else None
+        req = getattr(cliente, "request", None)
+        if req is None or not req.remote_ip:
+            return None
+        ip = req.remote_ip
+        if _de_confianza(ip):
+            saltos = [s.strip() for s in req.headers.get("X-Forwarded-For", "").split(",") if s.strip()]
+            while saltos and _de_confianza(ip):
+                ip = saltos.pop()
+        return ip
     except Exception:
-        pass
+        return None
 
-    return None
+def _db_login(email: str, password: str):
+    """
+    Valida la clave en la BD con una sola sentencia (ver "auth.login") y migra
+    a bcrypt los hashes SHA-256 heredados. Devuelve el usuario o None.
+    Los errores de BD se propagan: no son "credenciales inválidas".
+    """
+    params = {"email": email, "pw": password, "coste": BCRYPT_COSTE}
+    rows = None
+    if _pgcrypto["ok"]:
+        try:
+            rows = db.query_prepared("auth.login", params, commit=True)
+        except psycopg.errors.UndefinedFunction:
+            _pgcrypto["ok"] = False
+    if rows is None and not _pgcrypto["ok"]:
+        rows = db.query_prepared("auth.login_sha256", params)
+    if not rows or not rows[0]["ok"]:
+        return None
+    r = rows[0]
+    if r["rehash"]:
+        REHASHES.inc()
+    return {"id": r["id"], "email": r["email"], "rol": r["rol"], "sede_id": r["sede_id"]}
 
 def login_form():
     st.session_state.setdefault("user", None)
@@ -173,8 +337,30 @@ def login_form():
         password = st.text_input("Contraseña", type="password")
         submit = st.form_submit_button("Ingresar")
     if submit:
-        user = _db_login(email.strip(), password)
+        email = email.strip()
+        ip = _ip_cliente()
+        clave_email, clave_ip = f"email:{email.lower()}", (f"ip:{ip}" if ip else None)
+        espera = max(_por_email.espera(clave_email), _por_ip.espera(clave_ip) if clave_ip else 0.0)
+        if espera > 0:
+            LOGINS.inc(result="throttled")
+            st.error(f"Demasiados intentos. Vuelve a intentar en {int(espera) + 1} s.")
+            return
+        # Se registra antes de ir a la BD (acota ráfagas en paralelo); si resulta
+        # correcto se descuenta: por IP solo cuentan los fallidos
+        _por_email.registrar(clave_email)
+        if clave_ip:
+            _por_ip.registrar(clave_ip)
+        try:
+            user = _db_login(email, password)
+        except psycopg.Error as e:
+            LOGINS.inc(result="error")
+            st.error(str(e) if isinstance(e, db.BaseDatosNoDisponible) else "No se pudo validar el ingreso. Intenta más tarde.")
+            return
+        LOGINS.inc(result="ok" if user else "fail")
         if user:
+            _por_email.limpiar(clave_email)
+            if clave_ip:
+                _por_ip.descontar(clave_ip)
             on_login_success(user)
             st.success("Ingreso correcto")
             st.rerun()
@@ -182,34 +368,64 @@ def login_form():
             st.error("Credenciales inválidas")
 
 def require_login():
+    estado.restaurar()
     if not st.session_state.get("user"):
         st.info("Inicia sesión para continuar")
         login_form()
         st.stop()
 
 # -------------------------------------------
-# Scope por sede (helper útil en listados)
+# Scope por sede
 # -------------------------------------------
-def add_sede_scope(sql: str, params: list | tuple):
+# Usuarios sin 'all_sedes' y con sede asignada solo ven y escriben datos de su
+# sede. Las páginas filtran con sede_filter()/add_sede_scope() (para que el
+# planificador use los índices (sede_id, fecha)); además la sede viaja como
+# app.sede_id en cada conexión (ver db.set_sede_provider), que usan los DEFAULT
+# de venta/pago y las políticas opcionales de db/rls.sql.
+def sede_scope() -> int | None:
+    """sede_id al que está limitado el usuario, o None si ve todas las sedes."""
+    u = st.session_state.get("user") or {}
+    if not u or has_permission("all_sedes"):
+        return None
+    return u.get("sede_id")
+
+def sede_filter(alias: str | None = None, column: str = "sede_id", glue: str = " AND ") -> tuple[str, list]:
     """
-    Si el usuario NO tiene 'all_sedes', agrega filtro por su sede_id.
-    Uso:
-        sql, params = add_sede_scope(sql, [desde, hasta])
-        rows = query(sql, tuple(params))
+    Predicado de sede listo para insertar en un WHERE, o ("", []) sin límite:
+        pred, p = sede_filter("c")            # (" AND c.sede_id = %s", [3])
+        query(f"SELECT ... FROM clase c WHERE c.estado = %s{pred} ORDER BY ...", ("programada", *p))
     """
-    u = st.session_state.get("user") or {}
-    if has_permission("all_sedes"):
-        return sql, params
-    sede_id = u.get("sede_id")
+    sede_id = sede_scope()
     if sede_id is None:
-        return sql, params
-    # Si el SQL ya tiene WHERE, agrega AND; si no, agrega WHERE.
+        return "", []
+    col = f"{alias}.{column}" if alias else column
+    return f"{glue}{col} = %s", [sede_id]
+
+def add_sede_scope(sql: str, params: list | tuple, alias: str | None = None, column: str = "sede_id"):
+    """
+    Agrega el filtro de sede al final de un SQL que se arma por partes (antes
+    de ORDER BY / LIMIT, que el llamador agrega después):
+        sql, params = add_sede_scope(sql, [desde, hasta], alias="p")
+        rows = query(sql + " ORDER BY p.fecha DESC", tuple(params))
+    """
     glue = " AND " if " where " in sql.lower() else " WHERE "
-    sql = f"{sql}{glue}%s = %s"
-    # Nota: asume que tus tablas usan columna 'sede_id'; ajusta a tu alias: e.g., "c.sede_id = %s"
-    # Para mayor control, puedes pasar aquí la condición exacta; o crea un add_sede_scope_for(alias)
-    # Por simplicidad, devolvemos tal cual y el consumidor ajusta si necesita.
-    return sql, list(params) + [("sede_id", sede_id)]  # marcador informativo; ajústalo si usas psycopg directo
+    pred, extra = sede_filter(alias, column, glue)
+    return sql + pred, list(params) + extra
+
+def sedes_visibles() -> list[dict]:
+    """Sedes que el usuario puede elegir en formularios (solo la suya si está limitado)."""
+    pred, p = sede_filter(glue=" WHERE ", column="id")
+    return query(f"SELECT id, nombre FROM sede{pred} ORDER BY nombre", tuple(p))
+
+def _sede_de_la_sesion():
+    # Sin contexto de Streamlit (hilos de realtime, métricas, tools/) no hay límite;
+    # mientras se cargan los permisos tampoco (evita recursión con load_permissions)
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    if get_script_run_ctx(suppress_warning=True) is None or "permissions" not in st.session_state:
+        return None
+    return sede_scope()
+
+db.set_sede_provider(_sede_de_la_sesion)
 
 # -------------------------------------------
 # Auditoría (opcional)
@@ -222,7 +438,8 @@ def audit(accion: str, entidad: str, entidad_id=None, detalle: dict | None = Non
         u = st.session_state.get("user") or {}
         uid = u.get("id")
         payload = json.dumps(detalle, ensure_ascii=False) if detalle is not None else None
-        query("""
+        # execute(): sin RETURNING no hay filas que leer, y va siempre al primario
+        db.execute("""
             INSERT INTO auditoria (usuario_id, accion, entidad, entidad_id, detalle)
             VALUES (%s, %s, %s, %s, %s::jsonb)
         """, (uid, accion, entidad, entidad_id, payload))
@@ -0,0 +1,141 @@
+# app/lib/catalogo.py
+"""
+Catálogo de productos en memoria, compartido por todas las sesiones del proceso.
+
+Se carga una vez (una consulta) y se indexa por id y por nombre (lista ordenada
+para búsquedas por prefijo con bisect). Después se mantiene al día:
+  - en este proceso, con los valores que devuelven las escrituras
+    (ventas, anulaciones y edición de productos llaman a fijar_stock/actualizar/quitar);
+  - en los demás procesos, con el NOTIFY 'producto' que emite el trigger de la
+    tabla (ver realtime.py). Sin tiempo real se recarga cada CATALOGO_TTL_S.
+
+El carrito del POS se arma contra este catálogo sin ir a la BD; el stock final
+se sigue validando de forma atómica al confirmar (add_item_with_stock_guard).
+
+    from app.lib import catalogo
+    catalogo.disponibles()        # activos con stock > 0, por nombre
+    catalogo.buscar("prote")      # prefijo primero, luego "contiene"
+"""
+import bisect
+import json
+import os
+import threading
+import time
+
+from . import metrics, realtime
+from .db import query
+
+TTL_S = float(os.getenv("CATALOGO_TTL_S", "300"))  # recarga completa si no hay NOTIFY
+
+CARGAS = metrics.counter("gym_catalogo_cargas_total", "Cargas completas del catálogo de productos")
+CAMBIOS = metrics.counter("gym_catalogo_cambios_total", "Cambios aplicados al catálogo", ["origen"])
+
+_lock = threading.Lock()
+_productos: dict[int, dict] = {}
+_nombres: list[tuple[str, int]] = []   # (nombre en minúsculas, id), ordenada
+_cargado = 0.0
+
+# -------------------------------------------
+# Carga e índices
+# -------------------------------------------
+def _fila(r) -> dict:
+    return {"id": int(r["id"]), "nombre": r["nombre"], "precio": float(r["precio"]),
+            "stock": int(r["stock"]), "activo": bool(r["activo"])}
+
+def _reindexar():
+    _nombres[:] = sorted((p["nombre"].lower(), pid) for pid, p in _productos.items())
+
+def cargar():
+    global _cargado
+    rows = query("SELECT id, nombre, precio, stock, activo FROM producto", replica=False)  # ver NOTIFY
+    with _lock:
+        _productos.clear()
+        _productos.update({int(r["id"]): _fila(r) for r in rows})
+        _reindexar()
+        _cargado = time.time()
+    CARGAS.inc()
+
+def invalidar():
+    """Fuerza una recarga completa en la próxima lectura (p.ej. tras un fallo de stock)."""
+    global _cargado
+    _cargado = 0.0
+
+def _asegurar():
+    realtime.subscribe("producto", _on_producto, on_connect=cargar)
+    if not _cargado or (not realtime.running() and time.time() - _cargado >= TTL_S):
+        cargar()
+
+# -------------------------------------------
+# Lecturas (copias: las sesiones no comparten dicts mutables)
+# -------------------------------------------
+def get(producto_id) -> dict | None:
+    _asegurar()
+    with _lock:
+        p = _productos.get(int(producto_id))
+        return dict(p) if p else None
+
+def todos() -> list[dict]:
+    _asegurar()
+    with _lock:
+        return [dict(_productos[pid]) for _, pid in _nombres]
+
+def disponibles() -> list[dict]:
+    """Productos activos con stock > 0, ordenados por nombre (lo que ofrece el POS)."""
+    return [p for p in todos() if p["activo"] and p["stock"] > 0]
+
+def buscar(texto: str, limit: int | None = None) -> list[dict]:
+    """Coincidencias por prefijo (índice ordenado) seguidas de las que solo lo contienen."""
+    _asegurar()
+    t = (texto or "").strip().lower()
+    with _lock:
+        if not t:
+            ids = [pid for _, pid in _nombres]
+        else:
+            i = bisect.bisect_left(_nombres, (t, -1))
+            ids = []
+            while i < len(_nombres) and _nombres[i][0].startswith(t):
+                ids.append(_nombres[i][1])
+                i += 1
+            vistos = set(ids)
+            ids += [pid for nombre, pid in _nombres if t in nombre and pid not in vistos]
+        if limit:
+            ids = ids[:limit]
+        return [dict(_productos[pid]) for pid in ids]
+
+# -------------------------------------------
+# Cambios
+# -------------------------------------------
+def fijar_stock(producto_id, stock, origen="local"):
+    """Aplica el stock resultante de una venta/anulación (valor absoluto: idempotente)."""
+    with _lock:
+        p = _productos.get(int(producto_id))
+        if p is not None:
+            p["stock"] = int(stock)
+    CAMBIOS.inc(origen=origen)
+
+def actualizar(row, origen="local"):
+    """Inserta o reemplaza un producto (alta o edición)."""
+    p = _fila(row)
+    with _lock:
+        anterior = _productos.get(p["id"])
+        _productos[p["id"]] = p
+        if anterior is None or anterior["nombre"] != p["nombre"]:
+            _reindexar()
+    CAMBIOS.inc(origen=origen)
+
+def quitar(producto_id, origen="local"):
+    with _lock:
+        if _productos.pop(int(producto_id), None) is not None:
+            _reindexar()
+    CAMBIOS.inc(origen=origen)
+
+def _on_producto(payload: str):
+    d = json.loads(payload)
+    if d["op"] == "DELETE":
+        quitar(d["id"], origen="notify")
+    elif "nombre" in d:
+        actualizar(d, origen="notify")
+    elif d["id"] in _productos:
+        fijar_stock(d["id"], d["stock"], origen="notify")
+    else:
+        invalidar()   # producto desconocido sin datos completos: recarga en la próxima lectura
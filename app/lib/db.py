@@ -1,52 +1,674 @@
 # app/lib/db.py
 import os
+import random
+import sys
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, wait
 from contextlib import contextmanager
-from dotenv import load_dotenv
 
 import psycopg
 from psycopg.rows import dict_row
 
-# Carga variables de .env (PGHOST, PGPORT, etc.)
-load_dotenv()
+from . import metrics, query_stats
 
-def get_conn():
-    return psycopg.connect(
-        host=os.getenv("PGHOST"),
-        port=os.getenv("PGPORT"),
-        dbname=os.getenv("PGDATABASE"),
-        user=os.getenv("PGUSER"),
-        password=os.getenv("PGPASSWORD"),
-        row_factory=dict_row,  # resultados como diccionarios
-    )
+# Carga variables de .env (PGHOST, PGPORT, etc.) solo si hay un .env: sin él
+# (contenedores, CI) no se importa python-dotenv ni se recorren directorios.
+def _cargar_env():
+    ruta = os.getenv("DOTENV_PATH")
+    if not ruta:
+        raiz = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        ruta = next((p for p in (os.path.join(os.getcwd(), ".env"), os.path.join(raiz, ".env"))
+                     if os.path.isfile(p)), None)
+    if ruta and os.path.isfile(ruta):
+        from dotenv import load_dotenv
+        load_dotenv(ruta)
 
-@contextmanager
-def db_cursor(commit=False):
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            try:
-                yield cur
-                if commit:
-                    conn.commit()
-            except Exception:
-                conn.rollback()
+_cargar_env()
+
+# -------------------------------------------
+# Métricas
+# -------------------------------------------
+QUERY_SECONDS = metrics.histogram("gym_db_query_seconds", "Latencia de sentencias SQL", ["op"])
+QUERIES = metrics.counter("gym_db_queries_total", "Sentencias SQL ejecutadas", ["page", "op", "status"])
+CONNECT_SECONDS = metrics.histogram("gym_db_connect_seconds", "Tiempo de apertura de conexión")
+CONNECTIONS_OPENED = metrics.counter("gym_db_connections_opened_total", "Conexiones abiertas")
+CONNECTIONS_IN_USE = metrics.gauge("gym_db_connections_in_use", "Conexiones en uso ahora mismo")
+ROUTES = metrics.counter("gym_db_route_total", "Lecturas por destino (primary, replica, fallback)", ["destino"])
+REPLICA_LAG = metrics.gauge("gym_db_replica_lag_seconds", "Retraso de la réplica en la última verificación")
+PARALLEL_SECONDS = metrics.histogram("gym_db_parallel_seconds", "Duración total de fetch_parallel")
+PARALLEL_ERRORS = metrics.counter("gym_db_parallel_errors_total", "Consultas fallidas en fetch_parallel", ["tipo"])
+RETRIES = metrics.counter("gym_db_retries_total", "Reintentos por error transitorio", ["sqlstate"])
+BREAKER_OPEN = metrics.gauge("gym_db_breaker_open", "1 mientras el circuit breaker de la BD está abierto")
+
+def _report(rec):
+    if rec["fingerprint"] == "<connect>":
+        CONNECTIONS_OPENED.inc()
+        CONNECT_SECONDS.observe(rec["ms"] / 1000.0)
+        return
+    op = rec["fingerprint"].split(" ", 1)[0]
+    QUERY_SECONDS.observe(rec["ms"] / 1000.0, op=op)
+    QUERIES.inc(page=rec["caller"].split(":", 1)[0], op=op, status="error" if rec["error"] else "ok")
+
+query_stats.add_listener(_report)
+
+@metrics.register_collector
+@metrics.cached(30)
+def _pg_cache_hit_ratio():
+    rows = query("""
+        SELECT sum(blks_hit)::float / NULLIF(sum(blks_hit) + sum(blks_read), 0) AS ratio
+        FROM pg_stat_database WHERE datname = current_database()
+    """)
+    ratio = rows[0]["ratio"] if rows else None
+    if ratio is None:
+        return []
+    return ["# TYPE gym_pg_cache_hit_ratio gauge", f"gym_pg_cache_hit_ratio {ratio!r}"]
+
+metrics.ensure_server()
+
+class TimedCursor(psycopg.Cursor):
+    """Cursor que registra latencia, filas y origen de cada execute()."""
+
+    def execute(self, query, params=None, **kwargs):
+        t0 = time.perf_counter()
+        error = None
+        try:
+            return super().execute(query, params, **kwargs)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            ms = (time.perf_counter() - t0) * 1000.0
+            query_stats.record(query, ms, None if error else self.rowcount, params, error)
+
+# -------------------------------------------
+# Réplica de solo lectura
+# -------------------------------------------
+# Con PGHOST_RO definido, las lecturas marcadas van a la réplica (PGPORT_RO,
+# PGDATABASE_RO, PGUSER_RO y PGPASSWORD_RO heredan el valor del primario si no
+# se definen). Por defecto todo va al primario: replica=True la fuerza
+# (reportes, exportaciones, auditoría) y replica=None la usa salvo durante
+# REPLICA_STICKY_S tras una escritura de la misma sesión (leer lo recién
+# escrito; tendencias de Home). Se vuelve al primario si la réplica no conecta
+# o si su retraso supera REPLICA_MAX_LAG_S. Una sentencia que escribe nunca
+# debe pedir la réplica: en un standby falla.
+REPLICA_MAX_LAG_S = float(os.getenv("REPLICA_MAX_LAG_S", "30"))
+REPLICA_CHECK_S = float(os.getenv("REPLICA_CHECK_S", "10"))     # cada cuánto se re-mide el retraso
+REPLICA_STICKY_S = float(os.getenv("REPLICA_STICKY_S", "5"))
+
+_replica_lock = threading.Lock()
+_replica_estado = {"ok": True, "lag": 0.0, "ts": 0.0}   # última verificación
+_escrituras: dict[str, float] = {}                      # sesión -> última escritura
+
+def replica_configurada() -> bool:
+    return bool(os.getenv("PGHOST_RO"))
+
+def _params(replica: bool) -> dict:
+    def env(nombre):
+        return (os.getenv(nombre + "_RO") or os.getenv(nombre)) if replica else os.getenv(nombre)
+    return {"host": env("PGHOST"), "port": env("PGPORT"), "dbname": env("PGDATABASE"),
+            "user": env("PGUSER"), "password": env("PGPASSWORD")}
+
+def _sesion() -> str:
+    """Id de la sesión de Streamlit que ejecuta el rerun (o 'proceso' fuera de Streamlit)."""
+    if "streamlit" in sys.modules:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is not None:
+            return ctx.session_id
+    return "proceso"
+
+def _marcar_escritura():
+    ahora = time.time()
+    with _replica_lock:
+        _escrituras[_sesion()] = ahora
+        if len(_escrituras) > 1000:
+            for k in [k for k, t in _escrituras.items() if ahora - t > REPLICA_STICKY_S]:
+                del _escrituras[k]
+
+def _lee_de_replica(replica) -> bool:
+    if replica is False or not replica_configurada():
+        return False
+    if replica is None and time.time() - _escrituras.get(_sesion(), 0.0) < REPLICA_STICKY_S:
+        return False
+    return _replica_estado["ok"] or time.time() - _replica_estado["ts"] >= REPLICA_CHECK_S
+
+def _verificar_replica(conn) -> bool:
+    """Mide el retraso de la réplica (como mucho cada REPLICA_CHECK_S) y decide si usarla."""
+    if time.time() - _replica_estado["ts"] < REPLICA_CHECK_S:
+        return _replica_estado["ok"]
+    row = conn.execute("""
+        SELECT CASE WHEN NOT pg_is_in_recovery()
+                      OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+               END AS lag
+    """).fetchone()
+    lag = float(row["lag"])
+    REPLICA_LAG.set(lag)
+    with _replica_lock:
+        _replica_estado.update(ok=lag <= REPLICA_MAX_LAG_S, lag=lag, ts=time.time())
+    return _replica_estado["ok"]
+
+def _replica_caida():
+    with _replica_lock:
+        _replica_estado.update(ok=False, ts=time.time())
+
+def replica_estado() -> dict:
+    """Estado de la réplica para paneles: configurada, ok, lag (s) y antigüedad de la medición."""
+    return {"configurada": replica_configurada(), **_replica_estado}
+
+# -------------------------------------------
+# Sede de la sesión
+# -------------------------------------------
+# app.lib.auth registra un proveedor con la sede a la que está limitado el
+# usuario del rerun (None = todas). Viaja como app.sede_id en cada conexión o
+# transacción del pool: lo leen los DEFAULT de venta/pago (app_sede()) y, si se
+# aplicó db/rls.sql, las políticas de row-level security.
+_sede_proveedor = None
+
+def set_sede_provider(fn):
+    global _sede_proveedor
+    _sede_proveedor = fn
+
+def _sede() -> int | None:
+    return _sede_proveedor() if _sede_proveedor else None
+
+_DE_LA_SESION = object()   # get_conn(sede=...): por defecto, la del proveedor
+
+# -------------------------------------------
+# Timeouts, reintentos y circuit breaker
+# -------------------------------------------
+# Cada conexión lleva un statement_timeout según su clase: "interactive" (lo
+# que espera alguien en recepción), "report" (Reportes, Auditoría, procesos
+# masivos desde la UI) o "batch" (tools/, 0 = sin límite). También se acepta
+# un número de segundos.
+TIMEOUTS_S = {
+    "interactive": float(os.getenv("DB_TIMEOUT_INTERACTIVE_S", "5")),
+    "report": float(os.getenv("DB_TIMEOUT_REPORT_S", "60")),
+    "batch": float(os.getenv("DB_TIMEOUT_BATCH_S", "0")),
+}
+RETRIES_MAX = int(os.getenv("DB_RETRIES", "2"))                  # reintentos además del primer intento
+RETRY_BASE_S = float(os.getenv("DB_RETRY_BASE_S", "0.05"))
+RETRY_MAX_S = float(os.getenv("DB_RETRY_MAX_S", "1"))
+BREAKER_FALLOS = int(os.getenv("DB_BREAKER_FALLOS", "3"))         # fallos de conexión seguidos para abrir
+BREAKER_ABIERTO_S = float(os.getenv("DB_BREAKER_ABIERTO_S", "10"))
+
+# La transacción se deshizo entera: reintentar es seguro aunque escriba
+_SQLSTATE_ABORTADA = {"40001", "40P01"}   # serialization_failure, deadlock_detected
+# Conexión o servidor caídos: no se sabe si llegó a aplicarse, solo para idempotentes
+_SQLSTATE_CONEXION = {"08000", "08001", "08003", "08004", "08006", "57P01", "57P02", "57P03", "53300"}
+
+class BaseDatosNoDisponible(psycopg.OperationalError):
+    """El circuit breaker está abierto: se falla al instante sin intentar conectar."""
+
+    def __init__(self, segundos: float):
+        super().__init__(f"La base de datos no está disponible en este momento. "
+                         f"Reintenta en {max(1, round(segundos))} s.")
+
+_breaker_lock = threading.Lock()
+_breaker = {"fallos": 0, "abierto_hasta": 0.0}
+
+def _breaker_verificar():
+    restante = _breaker["abierto_hasta"] - time.time()
+    if restante > 0:
+        raise BaseDatosNoDisponible(restante)
+
+def _breaker_fallo():
+    with _breaker_lock:
+        _breaker["fallos"] += 1
+        # Tras abrirse, el primer intento pasada la ventana (semiabierto) decide: un fallo la reabre
+        if _breaker["fallos"] >= BREAKER_FALLOS:
+            _breaker["abierto_hasta"] = time.time() + BREAKER_ABIERTO_S
+            BREAKER_OPEN.set(1)
+
+def _breaker_ok():
+    if _breaker["fallos"]:
+        with _breaker_lock:
+            _breaker.update(fallos=0, abierto_hasta=0.0)
+            BREAKER_OPEN.set(0)
+
+def disponible() -> bool:
+    """False mientras el circuit breaker está abierto (la BD se considera caída)."""
+    return _breaker["abierto_hasta"] <= time.time()
+
+def _timeout_ms(timeout) -> int | None:
+    if timeout is None:
+        return None
+    segundos = TIMEOUTS_S[timeout] if isinstance(timeout, str) else float(timeout)
+    return int(segundos * 1000)
+
+def _clasificar(e) -> str | None:
+    """'abortada' (reintento siempre seguro), 'conexion' (solo idempotentes) o None."""
+    if isinstance(e, BaseDatosNoDisponible):
+        return None
+    estado = getattr(e, "sqlstate", None)
+    if estado in _SQLSTATE_ABORTADA:
+        return "abortada"
+    if estado in _SQLSTATE_CONEXION or (estado is None and isinstance(e, psycopg.OperationalError)):
+        return "conexion"
+    return None
+
+def reintentar(fn, *args, idempotente=False, **kwargs):
+    """
+    Ejecuta fn(*args, **kwargs) reintentando errores transitorios (hasta
+    DB_RETRIES veces, backoff exponencial con jitter completo). fn debe abrir
+    y cerrar su propia transacción. Serialización/deadlock se reintentan
+    siempre; los cortes de conexión solo si idempotente=True.
+    """
+    for intento in range(RETRIES_MAX + 1):
+        try:
+            return fn(*args, **kwargs)
+        except psycopg.Error as e:
+            tipo = _clasificar(e)
+            if intento == RETRIES_MAX or tipo is None or (tipo == "conexion" and not idempotente):
                 raise
+            RETRIES.inc(sqlstate=getattr(e, "sqlstate", None) or "conexion")
+            time.sleep(random.uniform(0, min(RETRY_MAX_S, RETRY_BASE_S * 2 ** intento)))
+
+def _conectar(replica: bool, timeout, sede=_DE_LA_SESION, **extra):
+    kwargs = dict(_params(replica), row_factory=dict_row, cursor_factory=TimedCursor, **extra)
+    ms = _timeout_ms(timeout)
+    sede = _sede() if sede is _DE_LA_SESION else sede
+    opciones = ([f"-c statement_timeout={ms}"] if ms else []) + ([f"-c app.sede_id={int(sede)}"] if sede else [])
+    if opciones:
+        kwargs["options"] = " ".join(opciones)
+    with query_stats.Timer() as t:
+        conn = psycopg.connect(**kwargs)  # resultados como diccionarios
+    query_stats.record("<connect>", t.ms, None)
+    return conn
+
+def get_conn(replica=False, timeout=None, sede=_DE_LA_SESION):
+    """
+    Conexión al primario, o a la réplica si replica=True y está disponible (si no, al primario).
+    timeout: clase ("interactive", "report", "batch") o segundos; None = sin statement_timeout.
+    sede: por defecto la del usuario del rerun (set_sede_provider); sede=None conecta sin
+    app.sede_id (procesos de toda la red, como el snapshot de analitica).
+    """
+    if replica and replica_configurada():
+        try:
+            conn = _conectar(True, timeout, sede, connect_timeout=3)
+            if _verificar_replica(conn):
+                ROUTES.inc(destino="replica")
+                return conn
+            conn.close()
+        except psycopg.OperationalError:
+            _replica_caida()
+        ROUTES.inc(destino="fallback")
+    _breaker_verificar()
+    try:
+        conn = _conectar(False, timeout, sede)
+    except psycopg.OperationalError:
+        _breaker_fallo()
+        raise
+    _breaker_ok()
+    return conn
+
+@contextmanager
+def db_cursor(commit=False, replica=False, timeout="interactive"):
+    """Cursor en una conexión nueva; replica=True para lecturas que toleran retraso."""
+    CONNECTIONS_IN_USE.inc()
+    try:
+        with get_conn(replica=replica, timeout=timeout) as conn:
+            with conn.cursor() as cur:
+                try:
+                    yield cur
+                    if commit:
+                        conn.commit()
+                        _marcar_escritura()
+                except Exception:
+                    conn.rollback()
+                    raise
+    finally:
+        CONNECTIONS_IN_USE.dec()
+
+def query(sql, params=None, replica=False, timeout="interactive"):
+    """
+    Lectura (se reintenta ante errores transitorios). Por defecto del primario;
+    replica=True usa la réplica si está configurada y sana (reportes) y
+    replica=None también, salvo justo después de una escritura de la sesión.
+    """
+    a_replica = _lee_de_replica(replica)
+    if not a_replica and replica_configurada():
+        ROUTES.inc(destino="primary")
 
-def query(sql, params=None):
-    with db_cursor() as cur:
-        cur.execute(sql, params or ())
-        return cur.fetchall()
+    def leer():
+        with db_cursor(replica=a_replica, timeout=timeout) as cur:
+            cur.execute(sql, params or ())
+            return cur.fetchall()
+    return reintentar(leer, idempotente=True)
 
-def execute(sql, params=None):
-    with db_cursor(commit=True) as cur:
-        cur.execute(sql, params or ())
-        return cur.rowcount
+def execute(sql, params=None, timeout="interactive"):
+    def escribir():
+        with db_cursor(commit=True, timeout=timeout) as cur:
+            cur.execute(sql, params or ())
+            return cur.rowcount
+    return reintentar(escribir)
 
-def call_sp(sp_name, params=(), commit=True):
+def call_sp(sp_name, params=(), commit=True, timeout="interactive", preparada=False):
+    """
+    SP en su propia transacción; sin commit (solo lectura) también reintenta
+    cortes de conexión. preparada=True la corre como sentencia preparada del pool.
+    """
     placeholders = ",".join(["%s"]*len(params))
     sql = f"SELECT * FROM {sp_name}({placeholders})" if params else f"SELECT * FROM {sp_name}()"
-    with db_cursor(commit=commit) as cur:
-        cur.execute(sql, params)
-        try:
+    if preparada:
+        return query_prepared(register_statement(sp_name, sql), params, commit=commit, timeout=timeout)
+
+    def llamar():
+        with db_cursor(commit=commit, timeout=timeout) as cur:
+            cur.execute(sql, params)
+            try:
+                return cur.fetchall()
+            except Exception:
+                return []
+    return reintentar(llamar, idempotente=not commit)
+
+# -------------------------------------------
+# Lecturas concurrentes
+# -------------------------------------------
+# fetch_parallel() lanza consultas independientes de una misma página a la vez,
+# cada una en su conexión de un pool (psycopg_pool, conexiones ya abiertas) y con
+# su propio statement_timeout. El render tarda lo que la consulta más lenta y
+# no la suma; una consulta que falla no tumba a las demás.
+PARALLEL_WORKERS = int(os.getenv("DB_PARALLEL_WORKERS", "8"))
+
+_pools = {}
+_pools_lock = threading.Lock()
+_executor = None
+
+def _pool(replica: bool):
+    """Pool por destino, creado al primer uso (no se paga en el arranque)."""
+    global _executor
+    destino = "replica" if replica else "primary"
+    with _pools_lock:
+        if destino not in _pools:
+            from psycopg_pool import ConnectionPool
+            _pools[destino] = ConnectionPool(
+                kwargs={**_params(replica), "row_factory": dict_row, "cursor_factory": TimedCursor,
+                        "connect_timeout": 3, "options": f"-c statement_timeout={_timeout_ms('interactive')}"},
+                min_size=1, max_size=PARALLEL_WORKERS, name=f"gym-{destino}",
+                check=ConnectionPool.check_connection, open=True,
+            )
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PARALLEL_WORKERS, thread_name_prefix="db-parallel")
+        return _pools[destino]
+
+@contextmanager
+def _conexion_pool():
+    """Conexión del pool del primario, con la contabilidad del circuit breaker."""
+    _breaker_verificar()
+    try:
+        with _pool(False).connection(timeout=3) as conn:
+            _breaker_ok()
+            yield conn
+    except psycopg.OperationalError as e:
+        if _clasificar(e) == "conexion":
+            _breaker_fallo()
+        raise
+
+class Resultados(dict):
+    """
+    Resultado de fetch_parallel: r["nombre"] devuelve las filas o relanza el
+    error de esa consulta; r.get("nombre", []) devuelve el default si falló.
+    """
+    def __getitem__(self, nombre):
+        valor = super().__getitem__(nombre)
+        if isinstance(valor, BaseException):
+            raise valor
+        return valor
+
+    def get(self, nombre, default=None):
+        valor = super().get(nombre, default)
+        return default if isinstance(valor, BaseException) else valor
+
+    @property
+    def errores(self) -> dict:
+        return {k: v for k, v in super().items() if isinstance(v, BaseException)}
+
+def _ejecutar(sql, params, timeout_ms, a_replica, ctx, sede):
+    query_stats.fijar_contexto(ctx)   # origen y perfil de la página, para stats y profiler
+    try:
+        if a_replica:
+            try:
+                with _pool(True).connection(timeout=3) as conn:
+                    if _verificar_replica(conn):
+                        ROUTES.inc(destino="replica")
+                        return _en_conexion(conn, sql, params, timeout_ms, sede)
+            except psycopg.OperationalError:   # incluye PoolTimeout
+                _replica_caida()
+            ROUTES.inc(destino="fallback")
+        elif replica_configurada():
+            ROUTES.inc(destino="primary")
+        with _conexion_pool() as conn:
+            return _en_conexion(conn, sql, params, timeout_ms, sede)
+    finally:
+        query_stats.fijar_contexto(None)
+
+_SET_LOCAL = "SELECT set_config('statement_timeout', %s, true), set_config('app.sede_id', %s, true)"
+
+def _en_conexion(conn, sql, params, timeout_ms, sede):
+    CONNECTIONS_IN_USE.inc()
+    try:
+        with conn.cursor() as cur:
+            # set_config(..., true) = SET LOCAL: solo dura esta transacción
+            cur.execute(_SET_LOCAL, (f"{timeout_ms or 0}ms", str(sede or "")))
+            cur.execute(sql, params or ())
             return cur.fetchall()
-        except Exception:
-            return []
+    finally:
+        CONNECTIONS_IN_USE.dec()
+
+def fetch_parallel(consultas: dict, timeout="interactive", replica=False) -> Resultados:
+    """
+    Ejecuta lecturas independientes en paralelo.
+
+        r = fetch_parallel({
+            "clases": ("SELECT ... WHERE estado=%s", ("programada",)),
+            "socios": ("SELECT id, nombre FROM socio LIMIT 300", None, 2.0),  # timeout propio
+        })
+        clases = r["clases"]            # relanza el error si esa consulta falló
+        socios = r.get("socios", [])    # o default
+
+    Cada valor es (sql, params) o (sql, params, timeout); timeout es una clase
+    de TIMEOUTS_S o segundos. Los errores transitorios se reintentan por
+    consulta. El enrutamiento a réplica sigue las reglas de query() y se decide
+    una vez, en el hilo de la página.
+    """
+    if not consultas:
+        return Resultados()
+    specs = {}
+    for nombre, spec in consultas.items():
+        sql, params, t = (spec, None, None) if isinstance(spec, str) else (tuple(spec) + (None, None))[:3]
+        specs[nombre] = (sql, params, _timeout_ms(t or timeout))
+
+    if not disponible():
+        error = BaseDatosNoDisponible(_breaker["abierto_hasta"] - time.time())
+        return Resultados((nombre, error) for nombre in consultas)
+
+    a_replica = _lee_de_replica(replica)
+    ctx, sede = query_stats.contexto(), _sede()   # del hilo de la página
+    t0 = time.perf_counter()
+    _pool(False)   # crea pool y executor desde el hilo de la página
+    futuros = {nombre: _executor.submit(reintentar, _ejecutar, sql, params, ms, a_replica, ctx, sede,
+                                        idempotente=True)
+               for nombre, (sql, params, ms) in specs.items()}
+    # Margen sobre el statement_timeout más largo para reintentos, pool y red (sin límite si alguna es batch)
+    limites = [ms for _, _, ms in specs.values()]
+    wait(futuros.values(), timeout=None if not all(limites) else max(limites) / 1000.0 + 5)
+
+    resultados = Resultados()
+    for nombre, fut in futuros.items():
+        if not fut.done():
+            fut.cancel()
+            error = TimeoutError(f"{nombre}: sin respuesta en {specs[nombre][2] / 1000.0:.0f} s")
+        else:
+            error = fut.exception()
+        if error is not None:
+            PARALLEL_ERRORS.inc(tipo=type(error).__name__)
+            resultados[nombre] = error
+        else:
+            resultados[nombre] = fut.result()
+    PARALLEL_SECONDS.observe(time.perf_counter() - t0)
+    return resultados
+
+# -------------------------------------------
+# Sentencias preparadas
+# -------------------------------------------
+# Las sentencias calientes (acceso, aforo, guardia de stock del POS...) se
+# registran con un nombre y corren sobre conexiones del pool con prepare=True:
+# Postgres las parsea y planifica una vez por conexión y después solo ejecuta.
+# Con conexiones nuevas por llamada (query/db_cursor) preparar no serviría.
+_sentencias: dict[str, str] = {}
+_uso_lock = threading.Lock()
+_uso: dict[str, dict] = {}                                     # nombre -> usos, preparaciones, ms
+_preparadas_en = weakref.WeakKeyDictionary()                   # conexión -> nombres ya preparados
+
+PREPARED_EXECUTIONS = metrics.counter("gym_db_prepared_executions_total", "Ejecuciones de sentencias preparadas", ["nombre"])
+PREPARED_PREPARES = metrics.counter("gym_db_prepared_prepares_total", "PREPARE por conexión del pool", ["nombre"])
+
+def register_statement(nombre: str, sql: str) -> str:
+    """Registra (idempotente) una sentencia caliente bajo `nombre`; devuelve el nombre."""
+    anterior = _sentencias.setdefault(nombre, sql)
+    if anterior != sql:
+        raise ValueError(f"La sentencia preparada '{nombre}' ya está registrada con otro SQL")
+    return nombre
+
+@contextmanager
+def pool_cursor(commit=False, timeout="interactive"):
+    """
+    Cursor sobre una conexión del pool (para usar execute_prepared). Una
+    transacción: commit=True confirma al salir; si no, se deshace.
+    """
+    CONNECTIONS_IN_USE.inc()
+    try:
+        with _conexion_pool() as conn:
+            with conn.cursor() as cur:
+                try:
+                    ms, sede = _timeout_ms(timeout), _sede()
+                    if sede or ms != _timeout_ms("interactive"):   # el pool conecta con el de "interactive"
+                        cur.execute(_SET_LOCAL, (f"{ms or 0}ms", str(sede or "")))
+                    yield cur
+                    if commit:
+                        conn.commit()
+                        _marcar_escritura()
+                    else:
+                        conn.rollback()
+                except Exception:
+                    conn.rollback()
+                    raise
+    finally:
+        CONNECTIONS_IN_USE.dec()
+
+def execute_prepared(cur, nombre: str, params=()):
+    """Ejecuta la sentencia registrada `nombre` en `cur` (de pool_cursor), preparándola si hace falta."""
+    sql = _sentencias[nombre]
+    conn = cur.connection
+    with _uso_lock:
+        hechas = _preparadas_en.setdefault(conn, set())
+        nueva = nombre not in hechas
+        hechas.add(nombre)
+    t0 = time.perf_counter()
+    try:
+        cur.execute(sql, params, prepare=True)
+    except Exception:
+        with _uso_lock:
+            hechas.discard(nombre)
+        raise
+    ms = (time.perf_counter() - t0) * 1000.0
+    with _uso_lock:
+        u = _uso.setdefault(nombre, {"usos": 0, "preparaciones": 0, "total_ms": 0.0})
+        u["usos"] += 1
+        u["preparaciones"] += nueva
+        u["total_ms"] += ms
+    PREPARED_EXECUTIONS.inc(nombre=nombre)
+    if nueva:
+        PREPARED_PREPARES.inc(nombre=nombre)
+    return cur
+
+def query_prepared(nombre: str, params=(), commit=False, timeout="interactive"):
+    """Atajo: la sentencia `nombre` en su propia transacción del pool; devuelve las filas."""
+    def correr():
+        with pool_cursor(commit=commit, timeout=timeout) as cur:
+            execute_prepared(cur, nombre, params)
+            return cur.fetchall() if cur.description else []
+    return reintentar(correr, idempotente=not commit)
+
+def prepared_stats() -> list[dict]:
+    """Uso por sentencia registrada (para Rendimiento): usos, preparaciones y ms medios."""
+    with _uso_lock:
+        out = []
+        for nombre, sql in sorted(_sentencias.items()):
+            u = _uso.get(nombre, {"usos": 0, "preparaciones": 0, "total_ms": 0.0})
+            out.append({"nombre": nombre, "usos": u["usos"], "preparaciones": u["preparaciones"],
+                        "avg_ms": round(u["total_ms"] / u["usos"], 3) if u["usos"] else None,
+                        "sql": " ".join(sql.split())[:160]})
+        return out
+
+# -------------------------------------------
+# Lecturas columnares
+# -------------------------------------------
+# Para resultados grandes que terminan en un DataFrame o en st.dataframe:
+# query_arrow() lee filas como tuplas (sin un dict por fila), con NUMERIC
+# cargado directo como float, y arma una columna tipada de Arrow por campo.
+# st.dataframe acepta la tabla Arrow tal cual (sin otra conversión) y
+# query_df() la pasa a pandas en C. pyarrow se importa al primer uso.
+_TIPOS_ARROW = None
+
+def _tipos_arrow():
+    global _TIPOS_ARROW
+    if _TIPOS_ARROW is None:
+        import pyarrow as pa
+        from psycopg.postgres import types as pg
+        _TIPOS_ARROW = {pg.get(nombre).oid: tipo for nombre, tipo in {
+            "int2": pa.int16(), "int4": pa.int32(), "int8": pa.int64(), "oid": pa.int64(),
+            "float4": pa.float32(), "float8": pa.float64(), "numeric": pa.float64(), "bool": pa.bool_(),
+            "text": pa.string(), "varchar": pa.string(), "bpchar": pa.string(), "name": pa.string(),
+            "date": pa.date32(), "timestamp": pa.timestamp("us"), "time": pa.time64("us"),
+        }.items()}
+    return _TIPOS_ARROW
+
+def _columna_arrow(valores, oid, tz):
+    import pyarrow as pa
+    if oid == psycopg.postgres.types.get("timestamptz").oid:
+        tipo = pa.timestamp("us", tz=tz)
+    else:
+        tipo = _tipos_arrow().get(oid)
+    try:
+        return pa.array(valores, type=tipo, from_pandas=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        # jsonb, arrays, intervalos...: se infiere y, si no se puede, texto
+        try:
+            return pa.array(valores)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return pa.array([None if v is None else str(v) for v in valores], type=pa.string())
+
+def query_arrow(sql, params=None, replica=False, timeout="interactive"):
+    """Como query() pero devuelve una pyarrow.Table (NUMERIC como float64, timestamptz en la zona de la sesión)."""
+    import pyarrow as pa
+    from psycopg.rows import tuple_row
+    from psycopg.types.numeric import FloatLoader
+
+    a_replica = _lee_de_replica(replica)
+    if not a_replica and replica_configurada():
+        ROUTES.inc(destino="primary")
+
+    def leer():
+        CONNECTIONS_IN_USE.inc()
+        try:
+            with get_conn(replica=a_replica, timeout=timeout) as conn:
+                with conn.cursor(row_factory=tuple_row) as cur:
+                    cur.adapters.register_loader("numeric", FloatLoader)
+                    cur.execute(sql, params or ())
+                    filas = cur.fetchall()
+                    campos = [(d.name, d.type_code) for d in cur.description or ()]
+                    tz = str(conn.info.timezone)
+        finally:
+            CONNECTIONS_IN_USE.dec()
+        columnas = list(zip(*filas)) if filas else [()] * len(campos)
+        return pa.table([_columna_arrow(list(v), oid, tz) for v, (_, oid) in zip(columnas, campos)],
+                        names=[n for n, _ in campos])
+    return reintentar(leer, idempotente=True)
+
+def query_df(sql, params=None, replica=False, timeout="interactive"):
+    """query_arrow() como DataFrame de pandas (enteros con NULL pasan a float, como en pandas)."""
+    return query_arrow(sql, params, replica=replica, timeout=timeout).to_pandas()
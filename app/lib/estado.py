@@ -0,0 +1,408 @@
+# app/lib/estado.py
+"""
+Estado compartido entre procesos, para correr varios workers de Streamlit
+detrás de un balanceador (en uno o varios hosts).
+
+Sesiones: las claves críticas de st.session_state (usuario, carrito del POS,
+último recibo) se copian a un backend compartido bajo un token aleatorio que
+el navegador guarda en la cookie de sesión gym_sid (nunca en la URL). Si el
+navegador reconecta contra otro proceso o se recarga la página, restaurar()
+lee la cookie del websocket y recupera las claves; el usuario se relee de la
+BD (si ya no existe o cambió de rol, la sesión se descarta) y los permisos se
+recalculan. Las páginas escriben esas claves con guardar()/quitar() en lugar
+de asignar st.session_state directamente.
+
+Invalidación de cachés: invalidar(ns, clave) aplica el cambio en este proceso
+y emite NOTIFY 'cache'; los demás procesos lo reciben por el hilo LISTEN de
+realtime.py, incrementan version(ns, clave) y llaman a los callbacks de
+al_invalidar(ns, fn). Sin tiempo real (REALTIME=0) solo se invalida localmente.
+
+    from app.lib import estado
+    estado.restaurar()                      # al inicio del rerun (lo hace require_login)
+    estado.guardar("venta_items", items)
+    estado.invalidar("permisos", user_id)
+
+Variables de entorno:
+    SHARED_STATE_BACKEND  sqlite (default: un archivo por host), postgres (tabla
+                          app_sesion: entre hosts) o memory (solo este proceso)
+    SHARED_STATE_PATH     archivo SQLite, creado con permisos 0600 (default:
+                          $XDG_STATE_HOME/gym/estado.sqlite3, o ~/.local/state/gym/...)
+    SHARED_STATE_TTL_S    vida de una sesión sin escrituras (default 43200 = 12 h)
+"""
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, time as hora
+from decimal import Decimal
+
+import streamlit as st
+
+from . import db, metrics, realtime
+
+log = logging.getLogger("gym.estado")
+
+BACKEND = os.getenv("SHARED_STATE_BACKEND", "sqlite").strip().lower()
+RUTA = os.getenv("SHARED_STATE_PATH") or os.path.join(
+    os.getenv("XDG_STATE_HOME") or os.path.expanduser("~/.local/state"), "gym", "estado.sqlite3")
+TTL_S = float(os.getenv("SHARED_STATE_TTL_S", "43200"))
+
+# Lo que sobrevive a un cambio de proceso; el resto de session_state es caché o UI
+CLAVES = ("user", "venta_items", "ultima_venta", "mostrar_recibo_venta", "ultimo_pago", "mostrar_recibo")
+COOKIE = "gym_sid"
+PARAM = "sid"   # versiones anteriores llevaban el token en la URL: se quita si aparece
+
+OPERACIONES = metrics.counter("gym_estado_ops_total", "Operaciones sobre el estado compartido", ["op", "backend"])
+INVALIDACIONES = metrics.counter("gym_cache_invalidaciones_total", "Invalidaciones de caché", ["ns", "origen"])
+
+# -------------------------------------------
+# Serialización (JSON con Decimal y fechas, que traen las filas de psycopg)
+# -------------------------------------------
+def _codificar(o):
+    if isinstance(o, Decimal):
+        return {"__tipo": "decimal", "v": str(o)}
+    if isinstance(o, datetime):
+        return {"__tipo": "datetime", "v": o.isoformat()}
+    if isinstance(o, date):
+        return {"__tipo": "date", "v": o.isoformat()}
+    if isinstance(o, hora):
+        return {"__tipo": "time", "v": o.isoformat()}
+    raise TypeError(f"{type(o).__name__} no se puede guardar en el estado compartido")
+
+_TIPOS = {"decimal": Decimal, "datetime": datetime.fromisoformat, "date": date.fromisoformat,
+          "time": hora.fromisoformat}
+
+def _decodificar(d):
+    t = d.get("__tipo")
+    return _TIPOS[t](d["v"]) if t in _TIPOS and len(d) == 2 else d
+
+def _a_texto(datos: dict) -> str:
+    return json.dumps(datos, default=_codificar, ensure_ascii=False)
+
+def _de_texto(texto: str) -> dict:
+    return json.loads(texto, object_hook=_decodificar)
+
+# -------------------------------------------
+# Backends
+# -------------------------------------------
+class MemoriaBackend:
+    """Solo este proceso (equivale a no compartir; útil en desarrollo y pruebas)."""
+    nombre = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datos: dict[str, tuple[str, float]] = {}
+
+    def leer(self, sid):
+        with self._lock:
+            v = self._datos.get(sid)
+        return _de_texto(v[0]) if v and v[1] > time.time() else None
+
+    def escribir(self, sid, datos, ttl):
+        with self._lock:
+            self._datos[sid] = (_a_texto(datos), time.time() + ttl)
+
+    def borrar(self, sid):
+        with self._lock:
+            self._datos.pop(sid, None)
+
+    def purgar(self):
+        ahora = time.time()
+        with self._lock:
+            for sid in [s for s, (_, exp) in self._datos.items() if exp <= ahora]:
+                del self._datos[sid]
+
+class SQLiteBackend:
+    """
+    Un archivo SQLite compartido por los procesos del host (WAL: lectores y un
+    escritor a la vez). Conexión corta por operación: sqlite3 no comparte
+    conexiones entre hilos y abrir un archivo local cuesta microsegundos.
+    """
+    nombre = "sqlite"
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        # Las sesiones valen como credenciales: carpeta y archivo solo para el
+        # usuario del proceso (SQLite crea -wal y -shm con los permisos del archivo)
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), mode=0o700, exist_ok=True)
+        os.close(os.open(ruta, os.O_RDWR | os.O_CREAT, 0o600))
+        os.chmod(ruta, 0o600)
+        with self._conn() as c:
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("CREATE TABLE IF NOT EXISTS sesion (sid TEXT PRIMARY KEY, datos TEXT NOT NULL, expira REAL NOT NULL)")
+
+    @contextmanager
+    def _conn(self):
+        c = sqlite3.connect(self.ruta, timeout=5, isolation_level=None)   # autocommit
+        try:
+            yield c
+        finally:
+            c.close()
+
+    def leer(self, sid):
+        with self._conn() as c:
+            fila = c.execute("SELECT datos FROM sesion WHERE sid = ? AND expira > ?", (sid, time.time())).fetchone()
+        return _de_texto(fila[0]) if fila else None
+
+    def escribir(self, sid, datos, ttl):
+        with self._conn() as c:
+            c.execute("INSERT INTO sesion(sid, datos, expira) VALUES (?, ?, ?) "
+                      "ON CONFLICT(sid) DO UPDATE SET datos = excluded.datos, expira = excluded.expira",
+                      (sid, _a_texto(datos), time.time() + ttl))
+
+    def borrar(self, sid):
+        with self._conn() as c:
+            c.execute("DELETE FROM sesion WHERE sid = ?", (sid,))
+
+    def purgar(self):
+        with self._conn() as c:
+            c.execute("DELETE FROM sesion WHERE expira <= ?", (time.time(),))
+
+class PostgresBackend:
+    """Tabla app_sesion (UNLOGGED, ver db/schema.sql): compartida entre hosts."""
+    nombre = "postgres"
+
+    def __init__(self):
+        db.register_statement("estado.leer", "SELECT datos::text AS datos FROM app_sesion WHERE sid = %s AND expira > now()")
+        db.register_statement("estado.escribir", """
+            INSERT INTO app_sesion(sid, datos, expira) VALUES (%s, %s::jsonb, now() + make_interval(secs => %s))
+            ON CONFLICT (sid) DO UPDATE SET datos = excluded.datos, expira = excluded.expira
+        """)
+        db.register_statement("estado.borrar", "DELETE FROM app_sesion WHERE sid = %s")
+        db.register_statement("estado.purgar", "DELETE FROM app_sesion WHERE expira <= now()")
+
+    def leer(self, sid):
+        rows = db.query_prepared("estado.leer", (sid,))
+        return _de_texto(rows[0]["datos"]) if rows else None
+
+    def escribir(self, sid, datos, ttl):
+        db.query_prepared("estado.escribir", (sid, _a_texto(datos), ttl), commit=True)
+
+    def borrar(self, sid):
+        db.query_prepared("estado.borrar", (sid,), commit=True)
+
+    def purgar(self):
+        db.query_prepared("estado.purgar", commit=True)
+
+_BACKENDS = {"memory": MemoriaBackend, "sqlite": lambda: SQLiteBackend(RUTA), "postgres": PostgresBackend}
+_backend = None
+_backend_lock = threading.Lock()
+_purgado = 0.0
+
+def backend():
+    """Backend configurado (creado al primer uso)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if BACKEND not in _BACKENDS:
+                    raise ValueError(f"SHARED_STATE_BACKEND desconocido: {BACKEND} (usa {', '.join(_BACKENDS)})")
+                _backend = _BACKENDS[BACKEND]()
+    return _backend
+
+def set_backend(b):
+    """Reemplaza el backend (otra implementación con leer/escribir/borrar/purgar)."""
+    global _backend
+    _backend = b
+
+def _op(op, fn, *args):
+    b = backend()
+    OPERACIONES.inc(op=op, backend=b.nombre)
+    return getattr(b, fn)(*args)
+
+# -------------------------------------------
+# Sesiones
+# -------------------------------------------
+_validador = None
+
+def set_validador_usuario(fn):
+    """
+    fn(user) -> user releído de la BD, o None si la sesión ya no vale (usuario
+    borrado, rol cambiado). Lo registra auth; sin validador no se restaura el usuario.
+    """
+    global _validador
+    _validador = fn
+
+def _sid() -> str | None:
+    return st.session_state.get("_estado_sid")
+
+def _peticion():
+    """Petición HTTP del websocket de esta sesión (headers y cookies), o None fuera de Streamlit."""
+    try:
+        from streamlit.runtime import Runtime
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+        cliente = Runtime.instance().get_client(ctx.session_id) if ctx else None
+        return getattr(cliente, "request", None)
+    except Exception:
+        return None
+
+def _cookie() -> str | None:
+    req = _peticion()
+    m = req.cookies.get(COOKIE) if req is not None else None
+    valor = getattr(m, "value", None)
+    return valor if isinstance(valor, str) else None
+
+def _fijar_cookie(sid: str | None):
+    """
+    Escribe (o borra, con None) la cookie desde el navegador: Streamlit no fija
+    cookies del lado del servidor. Cookie de sesión, SameSite=Strict y Secure
+    bajo https; el websocket de la próxima conexión la envía. Solo inserta el
+    iframe cuando el valor cambia respecto del que ya tiene el navegador (el que
+    envió al conectar o el último escrito), no en cada rerun.
+    """
+    if st.session_state.get("_estado_cookie", _cookie() or "") == (sid or ""):
+        return
+    st.session_state["_estado_cookie"] = sid or ""
+    import streamlit.components.v1 as components
+    valor = json.dumps(f"{COOKIE}={sid or ''}; path=/; SameSite=Strict" + ("" if sid else "; max-age=0"))
+    with st.sidebar:
+        components.html("<script>parent.document.cookie = " + valor
+                        + ' + (parent.location.protocol === "https:" ? "; Secure" : "");</script>', height=0)
+
+def _escribir():
+    global _purgado
+    sid = _sid()
+    if sid is None:
+        sid = st.session_state["_estado_sid"] = secrets.token_urlsafe(24)
+        st.session_state.pop("_estado_sin_cookie", None)
+    datos = {k: st.session_state[k] for k in CLAVES if k in st.session_state}
+    try:
+        _op("escribir", "escribir", sid, datos, TTL_S)
+        if time.time() - _purgado >= 600:
+            _purgado = time.time()
+            _op("purgar", "purgar")
+    except Exception as e:
+        # La sesión sigue viva en este proceso; solo se pierde la continuidad entre workers
+        log.warning("no se pudo guardar la sesión compartida: %s", e)
+
+def _descartar(sid: str):
+    try:
+        _op("borrar", "borrar", sid)
+    except Exception as e:
+        log.warning("no se pudo borrar la sesión compartida: %s", e)
+    st.session_state["_estado_sin_cookie"] = True
+
+def restaurar():
+    """
+    Al inicio de cada rerun: en una sesión nueva con cookie recupera las claves
+    compartidas (revalidando al usuario); en una existente fija la cookie si aún
+    no se escribió.
+    """
+    _escuchar()
+    if PARAM in st.query_params:
+        del st.query_params[PARAM]
+    sid = _sid()
+    if sid is not None:
+        _fijar_cookie(sid)
+        return
+    if st.session_state.get("_estado_sin_cookie"):
+        _fijar_cookie(None)   # tras "Salir" o una sesión descartada
+        return
+    if "_estado_leido" in st.session_state:
+        return
+    st.session_state["_estado_leido"] = True
+    sid = _cookie()
+    if not sid:
+        return
+    try:
+        datos = _op("leer", "leer", sid)
+    except Exception as e:
+        log.warning("no se pudo leer la sesión compartida: %s", e)
+        return
+    if datos is None:
+        st.session_state["_estado_sin_cookie"] = True   # vencida o cerrada en otro proceso
+        _fijar_cookie(None)
+        return
+    if "user" in datos:
+        try:
+            usuario = _validador(datos["user"]) if _validador else None
+        except Exception as e:
+            log.warning("no se pudo validar el usuario de la sesión compartida: %s", e)
+            return
+        if usuario is None:
+            _descartar(sid)
+            _fijar_cookie(None)
+            return
+        datos["user"] = usuario
+    for k, v in datos.items():
+        if k in CLAVES:
+            st.session_state[k] = v
+    st.session_state["_estado_sid"] = sid
+    _escribir()   # renueva el vencimiento
+    _fijar_cookie(sid)
+
+def guardar(clave: str, valor):
+    """st.session_state[clave] = valor, y copia al backend si la clave es compartida."""
+    st.session_state[clave] = valor
+    if clave in CLAVES:
+        _escribir()
+
+def quitar(clave: str):
+    if clave in st.session_state:
+        del st.session_state[clave]
+        if clave in CLAVES and _sid():
+            _escribir()
+
+def cerrar():
+    """Cierra la sesión compartida (logout): borra el registro y, en el próximo rerun, la cookie."""
+    sid = st.session_state.pop("_estado_sid", None)
+    if sid is not None:
+        _descartar(sid)
+
+# -------------------------------------------
+# Invalidación de cachés entre procesos
+# -------------------------------------------
+_ORIGEN = uuid.uuid4().hex[:12]          # identifica a este proceso en el payload
+_inv_lock = threading.Lock()
+_versiones: dict[tuple[str, str], int] = {}
+_callbacks: dict[str, list] = {}
+
+db.register_statement("estado.notify", "SELECT pg_notify('cache', %s)")
+
+def al_invalidar(ns: str, fn):
+    """Registra fn(clave) para las invalidaciones del espacio `ns` (de este y otros procesos)."""
+    with _inv_lock:
+        if fn not in _callbacks.get(ns, []):
+            _callbacks.setdefault(ns, []).append(fn)
+
+def version(ns: str, clave="") -> int:
+    """Contador de invalidaciones de (ns, clave): quien cachea compara contra el valor que guardó."""
+    _escuchar()
+    return _versiones.get((ns, str(clave)), 0)
+
+def _aplicar(ns: str, clave: str, origen: str):
+    with _inv_lock:
+        _versiones[(ns, clave)] = _versiones.get((ns, clave), 0) + 1
+        fns = list(_callbacks.get(ns, []))
+    INVALIDACIONES.inc(ns=ns, origen=origen)
+    for fn in fns:
+        try:
+            fn(clave)
+        except Exception as e:
+            log.warning("invalidación de '%s' falló: %s", ns, e)
+
+def invalidar(ns: str, clave=""):
+    """Invalida (ns, clave) aquí y, vía NOTIFY 'cache', en los demás procesos."""
+    clave = str(clave)
+    _aplicar(ns, clave, "local")
+    if not realtime.ENABLED:
+        return
+    try:
+        db.query_prepared("estado.notify", (json.dumps({"ns": ns, "clave": clave, "origen": _ORIGEN}),), commit=True)
+    except Exception as e:
+        log.warning("NOTIFY cache falló (%s): los demás procesos no se enteran de %s:%s", e, ns, clave)
+
+def _on_cache(payload: str):
+    d = json.loads(payload)
+    if d.get("origen") != _ORIGEN:
+        _aplicar(d["ns"], str(d.get("clave", "")), "notify")
+
+def _escuchar():
+    if realtime.ENABLED:
+        realtime.subscribe("cache", _on_cache)
@@ -0,0 +1,215 @@
+# app/lib/metrics.py
+"""
+Registro de métricas del proceso y exportador en formato de texto Prometheus/OpenMetrics.
+
+    from app.lib import metrics
+    LOGINS = metrics.counter("gym_login_total", "Intentos de login", ["result"])
+    LOGINS.inc(result="ok")
+
+El endpoint /metrics lo sirve un hilo HTTP auxiliar (uno por proceso) que se
+arranca con ensure_server() si METRICS_PORT está definido (p.ej. 9108).
+Los collectors registrados con register_collector() se evalúan en cada scrape.
+"""
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger("gym.metrics")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_registry: dict[str, "_Metric"] = {}
+_collectors = []
+
+# -------------------------------------------
+# Tipos de métrica
+# -------------------------------------------
+def _fmt_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+def _fmt_value(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, kw):
+        return tuple(str(kw.get(l, "")) for l in self.labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0) + amount
+
+    def expose(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_value(v)}" for k, v in items]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def expose(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_value(v)}" for k, v in items]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        k = self._key(labels)
+        with self._lock:
+            st = self._values.get(k)
+            if st is None:
+                st = self._values[k] = [[0] * len(self.buckets), 0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    st[0][i] += 1
+                    break
+            st[1] += value
+            st[2] += 1
+
+    def expose(self):
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        out = []
+        for k, (counts, total, n) in items:
+            acc = 0
+            for b, c in zip(self.buckets, counts):
+                acc += c
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, k, [('le', _fmt_value(b))])} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, k)} {total!r}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, k)} {n}")
+        return out
+
+def _get_or_create(cls, name, doc, labels, **kw):
+    with _lock:
+        m = _registry.get(name)
+        if m is None:
+            m = _registry[name] = cls(name, doc, labels, **kw)
+        return m
+
+def counter(name, doc, labels=()) -> Counter:
+    return _get_or_create(Counter, name, doc, labels)
+
+def gauge(name, doc, labels=()) -> Gauge:
+    return _get_or_create(Gauge, name, doc, labels)
+
+def histogram(name, doc, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, doc, labels, buckets=buckets)
+
+def register_collector(fn):
+    """fn() se llama en cada scrape; actualiza gauges o devuelve líneas extra."""
+    if fn not in _collectors:
+        _collectors.append(fn)
+    return fn
+
+# -------------------------------------------
+# Exposición
+# -------------------------------------------
+def cached(seconds: float):
+    """Decorador para collectors caros (p.ej. consultas): reutiliza el resultado `seconds` s."""
+    def deco(fn):
+        state = {"t": 0.0, "v": None}
+        def wrapper():
+            now = time.monotonic()
+            if now - state["t"] >= seconds:
+                state["v"] = fn()
+                state["t"] = now
+            return state["v"]
+        return wrapper
+    return deco
+
+def render() -> str:
+    """Texto de exposición (formato Prometheus 0.0.4)."""
+    extra = []
+    for fn in list(_collectors):
+        try:
+            lines = fn()
+            if lines:
+                extra.extend(lines)
+        except Exception as e:
+            log.warning("collector %s falló: %s", getattr(fn, "__name__", fn), e)
+    out = []
+    with _lock:
+        metrics = list(_registry.values())
+    for m in metrics:
+        out.extend(m.header())
+        out.extend(m.expose())
+    out.extend(extra)
+    return "\n".join(out) + "\n"
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+_server = None
+
+def ensure_server():
+    """Arranca (una sola vez por proceso) el hilo HTTP de /metrics si METRICS_PORT está definido."""
+    global _server
+    port = os.getenv("METRICS_PORT")
+    if not port or _server is not None:
+        return _server
+    with _lock:
+        if _server is not None:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((os.getenv("METRICS_HOST", "0.0.0.0"), int(port)), _Handler)
+        except OSError as e:
+            # Otro módulo/worker ya tiene el puerto: no es fatal para la app
+            log.warning("No se pudo abrir /metrics en :%s (%s)", port, e)
+            _server = False
+            return _server
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
@@ -0,0 +1,157 @@
+# app/lib/profiler.py
+"""
+Perfilado opcional del render de páginas (por rerun).
+
+Uso en una página:
+    from app.lib import profiler
+    profiler.start_page("Home")
+    with profiler.section("imports"):
+        import pandas as pd
+    ...
+    profiler.render_panel()   # expander solo para admin
+
+Se activa con PAGE_PROFILER=1 (o =cprofile para además capturar cProfile),
+o por sesión desde la página ⏱️ Rendimiento. Desactivado, section() no mide nada.
+Las sentencias SQL ejecutadas durante el rerun se agregan solas (vía query_stats).
+"""
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+from . import metrics, query_stats
+
+ENV_MODE = os.getenv("PAGE_PROFILER", "").strip().lower()  # "", "1", "cprofile"
+
+_local = threading.local()
+
+RERUNS = metrics.counter("gym_page_reruns_total", "Reruns de página (requests de Streamlit)", ["page"])
+RERUN_SECONDS = metrics.histogram("gym_page_rerun_seconds", "Duración de reruns perfilados", ["page"])
+
+class PageProfile:
+    __slots__ = ("page", "t0", "spans", "depth", "cprof", "total_ms")
+
+    def __init__(self, page: str, use_cprofile: bool):
+        self.page = page
+        self.t0 = time.perf_counter()
+        self.spans = []
+        self.depth = 0
+        self.total_ms = None
+        self.cprof = cProfile.Profile() if use_cprofile else None
+        if self.cprof:
+            self.cprof.enable()
+
+    def add(self, name, kind, start, ms, **extra):
+        self.spans.append({
+            "section": name, "kind": kind, "depth": self.depth,
+            "start_ms": round((start - self.t0) * 1000.0, 2), "ms": round(ms, 2), **extra,
+        })
+
+    def finish(self):
+        if self.total_ms is None:
+            self.total_ms = round((time.perf_counter() - self.t0) * 1000.0, 2)
+            if self.cprof:
+                self.cprof.disable()
+
+    def raw_profile(self) -> bytes | None:
+        """Estadísticas cProfile en formato .prof (cargable con pstats/snakeviz)."""
+        if not self.cprof:
+            return None
+        self.cprof.create_stats()
+        return marshal.dumps(self.cprof.stats)
+
+def _mode() -> str:
+    return st.session_state.get("profiler_mode", ENV_MODE)
+
+def enabled() -> bool:
+    return _mode() in ("1", "true", "on", "cprofile")
+
+def _on_query(rec):
+    prof = getattr(_local, "profile", None)
+    if prof is not None and prof.total_ms is None:
+        end = time.perf_counter()
+        prof.add(rec["fingerprint"][:80], "sql", end - rec["ms"] / 1000.0, rec["ms"], rows=rec["rows"])
+
+query_stats.add_listener(_on_query)
+# Los hilos de db.fetch_parallel heredan el perfil: sus consultas entran en la cascada
+query_stats.propagar("perfil", lambda: getattr(_local, "profile", None), lambda p: setattr(_local, "profile", p))
+
+def start_page(page: str):
+    """Cuenta el rerun e inicia su perfil (si el profiler está activo)."""
+    RERUNS.inc(page=page)
+    prev = getattr(_local, "profile", None)
+    if prev is not None:
+        prev.finish()
+    _local.profile = PageProfile(page, _mode() == "cprofile") if enabled() else None
+    return _local.profile
+
+@contextmanager
+def section(name: str, kind: str = "code"):
+    """Mide un bloque de la página. kind: code | imports | auth | dataframe | render | sql."""
+    prof = getattr(_local, "profile", None)
+    if prof is None:
+        yield
+        return
+    t = time.perf_counter()
+    prof.depth += 1
+    try:
+        yield
+    finally:
+        prof.depth -= 1
+        prof.add(name, kind, t, (time.perf_counter() - t) * 1000.0)
+
+def render_panel():
+    """Expander (solo admin) con la cascada del rerun y descargas del perfil."""
+    prof = getattr(_local, "profile", None)
+    if prof is None:
+        return
+    prof.finish()
+    _local.profile = None
+    RERUN_SECONDS.observe(prof.total_ms / 1000.0, page=prof.page)
+    u = st.session_state.get("user") or {}
+    if str(u.get("rol") or "").lower() != "admin":
+        return
+
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    spans = sorted(prof.spans, key=lambda s: s["start_ms"])
+    with st.expander(f"⏱️ Perfil de render — {prof.page}: {prof.total_ms:.0f} ms"):
+        if spans:
+            df = pd.DataFrame(spans)
+            df["label"] = [f"{'  ' * s['depth']}{s['section']}" for s in spans]
+            fig = go.Figure(go.Bar(
+                y=df["label"], x=df["ms"], base=df["start_ms"], orientation="h",
+                marker_color=df["kind"].map({"sql": "#f59e0b", "dataframe": "#10b981",
+                                             "render": "#3b82f6", "imports": "#a855f7",
+                                             "auth": "#ef4444"}).fillna("#64748b"),
+                hovertext=df["kind"],
+            ))
+            fig.update_yaxes(autorange="reversed")
+            fig.update_layout(height=max(240, 22 * len(df)), margin=dict(l=10, r=10, t=10, b=10),
+                              xaxis_title="ms desde el inicio del rerun")
+            st.plotly_chart(fig, use_container_width=True)
+            por_tipo = df[df["depth"] == 0].groupby("kind")["ms"].sum().sort_values(ascending=False)
+            resumen = [f"{k}: {v:.0f} ms" for k, v in por_tipo.items()]
+            resumen.append(f"SQL total: {df.loc[df['kind'] == 'sql', 'ms'].sum():.0f} ms")
+            st.caption(" · ".join(resumen))
+            st.dataframe(df.drop(columns=["label"]), use_container_width=True, hide_index=True)
+
+        c1, c2 = st.columns(2)
+        c1.download_button("⬇️ Spans (JSON)",
+                           data=json.dumps({"page": prof.page, "total_ms": prof.total_ms, "spans": spans}, default=str),
+                           file_name=f"perfil_{prof.page}.json", mime="application/json")
+        raw = prof.raw_profile()
+        if raw:
+            c2.download_button("⬇️ cProfile (.prof)", data=raw,
+                               file_name=f"perfil_{prof.page}.prof", mime="application/octet-stream")
+            buf = io.StringIO()
+            pstats.Stats(prof.cprof, stream=buf).sort_stats("cumulative").print_stats(25)
+            st.code(buf.getvalue(), language="text")
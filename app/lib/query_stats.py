@@ -0,0 +1,251 @@
+# app/lib/query_stats.py
+"""
+Registro en memoria de latencias SQL por proceso.
+
+Cada sentencia ejecutada vía app.lib.db queda en un ring buffer (últimas N)
+y en un histograma por *fingerprint* (SQL normalizado sin literales).
+Las sentencias que superan SLOW_QUERY_MS se escriben como JSON en el slow log
+y, opcionalmente, se muestrea su EXPLAIN (ANALYZE, BUFFERS): solo de lecturas
+puras y en un hilo aparte, sin alargar la petición que ya fue lenta.
+
+Variables de entorno:
+    SLOW_QUERY_MS            umbral en ms (default 500)
+    SLOW_QUERY_LOG           archivo JSONL del slow log (default: solo logger)
+    SLOW_QUERY_EXPLAIN_RATE  fracción 0..1 de lentas a las que se hace EXPLAIN (default 0)
+    QUERY_STATS_BUFFER       tamaño del ring buffer (default 2000)
+"""
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0"))
+BUFFER_SIZE = int(os.getenv("QUERY_STATS_BUFFER", "2000"))
+SAMPLES_PER_FINGERPRINT = 1000
+EXPLAIN_QUEUE = 20   # EXPLAIN pendientes; con la cola llena la lenta se registra sin plan
+
+_lock = threading.Lock()
+_recent = deque(maxlen=BUFFER_SIZE)
+_stats: dict[str, dict] = {}
+_listeners = []
+
+slow_log = logging.getLogger("gym.slow_query")
+if os.getenv("SLOW_QUERY_LOG") and not slow_log.handlers:
+    _h = logging.FileHandler(os.getenv("SLOW_QUERY_LOG"), encoding="utf-8")
+    _h.setFormatter(logging.Formatter("%(message)s"))
+    slow_log.addHandler(_h)
+    slow_log.setLevel(logging.INFO)
+
+# -------------------------------------------
+# Normalización y origen
+# -------------------------------------------
+_RE_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_PARAM = re.compile(r"%s|%\(\w+\)s")
+_RE_INLIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_SPACES = re.compile(r"\s+")
+
+def fingerprint(sql) -> str:
+    """SQL normalizado: sin comentarios, literales ni parámetros, en minúsculas."""
+    s = sql if isinstance(sql, str) else str(sql)
+    s = _RE_COMMENT.sub(" ", s)
+    s = _RE_STRING.sub("?", s)
+    s = _RE_PARAM.sub("?", s)
+    s = _RE_NUMBER.sub("?", s)
+    s = _RE_INLIST.sub("(?)", s)
+    return _RE_SPACES.sub(" ", s).strip().rstrip(";").lower()
+
+_LIB_DIR = os.path.dirname(os.path.abspath(__file__))
+_hilo = threading.local()   # origen heredado por hilos de trabajo (db.fetch_parallel)
+_propagados: dict[str, tuple] = {}   # nombre -> (leer, fijar): estado por hilo que también se hereda
+
+def caller() -> str:
+    """Primer frame fuera de app/lib: 'página.py:función:línea'."""
+    origen = getattr(_hilo, "origen", None)
+    if origen:
+        return origen
+    f = sys._getframe(1)
+    while f is not None:
+        fname = f.f_code.co_filename
+        if not fname.startswith(_LIB_DIR) and "contextlib" not in fname:
+            return f"{os.path.basename(fname)}:{f.f_code.co_name}:{f.f_lineno}"
+        f = f.f_back
+    return "?"
+
+def propagar(nombre: str, leer, fijar):
+    """
+    Registra estado por hilo (p.ej. el perfil de la página en curso) que los
+    hilos de trabajo heredan junto con el origen: leer() en el hilo de la
+    página, fijar(valor) en el de trabajo (y fijar(None) al terminar).
+    """
+    _propagados[nombre] = (leer, fijar)
+
+def contexto() -> dict:
+    """Lo que un hilo de trabajo hereda del hilo de la página: origen y estado propagado."""
+    return {"origen": caller(), **{n: leer() for n, (leer, _) in _propagados.items()}}
+
+def fijar_contexto(ctx: dict | None):
+    """Aplica en este hilo un contexto() tomado de otro (None lo limpia)."""
+    ctx = ctx or {}
+    _hilo.origen = ctx.get("origen")
+    for n, (_, fijar) in _propagados.items():
+        fijar(ctx.get(n))
+
+# -------------------------------------------
+# Registro
+# -------------------------------------------
+def record(sql, elapsed_ms: float, rows: int | None, params=None, error: str | None = None):
+    """Registra una ejecución. Llamado por app.lib.db en cada sentencia."""
+    fp = fingerprint(sql)
+    rec = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "fingerprint": fp,
+        "ms": round(elapsed_ms, 3),
+        "rows": rows,
+        "caller": caller(),
+        "error": error,
+    }
+    with _lock:
+        _recent.append(rec)
+        st = _stats.get(fp)
+        if st is None:
+            st = _stats[fp] = {
+                "calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0,
+                "samples": deque(maxlen=SAMPLES_PER_FINGERPRINT), "callers": set(),
+            }
+        st["calls"] += 1
+        st["total_ms"] += elapsed_ms
+        st["max_ms"] = max(st["max_ms"], elapsed_ms)
+        st["rows"] += rows or 0
+        st["samples"].append(elapsed_ms)
+        st["callers"].add(rec["caller"].rsplit(":", 1)[0])
+        if error:
+            st["errors"] += 1
+
+    for fn in _listeners:
+        fn(rec)
+    if elapsed_ms >= SLOW_QUERY_MS:
+        _log_slow(sql, params, rec)
+    return rec
+
+def add_listener(fn):
+    """Suscribe fn(rec) a cada ejecución registrada (p.ej. el profiler de páginas)."""
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+def _log_slow(sql, params, rec):
+    entry = dict(rec, sql=sql if isinstance(sql, str) else str(sql))
+    if EXPLAIN_RATE > 0 and random.random() < EXPLAIN_RATE and _is_read_only(entry["sql"]):
+        try:
+            _pendientes.put_nowait((entry, params))
+            _iniciar_explainer()
+            return   # el hilo lo escribe con el plan
+        except queue.Full:
+            entry["plan"] = {"error": "cola de EXPLAIN llena"}
+    _escribir_slow(entry)
+
+def _escribir_slow(entry):
+    slow_log.warning(json.dumps(entry, ensure_ascii=False, default=str))
+
+def _is_read_only(sql: str) -> bool:
+    # EXPLAIN ANALYZE ejecuta la sentencia: solo SELECT sin escrituras, bloqueos ni efectos
+    s = fingerprint(sql)
+    return s.startswith(("select", "with")) and not re.search(
+        r"\b(insert|update|delete|merge|for (?:no key )?update|for (?:key )?share|sp_\w+|nextval|setval|"
+        r"pg_notify|pg_advisory\w*)\b", s)
+
+_pendientes: queue.Queue = queue.Queue(maxsize=EXPLAIN_QUEUE)
+_explainer = {"hilo": None}
+_explainer_lock = threading.Lock()
+
+def _iniciar_explainer():
+    with _explainer_lock:
+        if _explainer["hilo"] is None:
+            _explainer["hilo"] = threading.Thread(target=_explicar_pendientes, name="slow-explain", daemon=True)
+            _explainer["hilo"].start()
+
+def _explicar_pendientes():
+    while True:
+        entry, params = _pendientes.get()
+        entry["plan"] = _explain(entry["sql"], params)
+        _escribir_slow(entry)
+
+def _explain(sql: str, params):
+    from .db import get_conn  # import diferido: db importa este módulo
+    try:
+        with get_conn(timeout="report") as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params or ())
+                plan = cur.fetchone()
+                conn.rollback()
+                return next(iter(plan.values())) if isinstance(plan, dict) else plan[0]
+    except Exception as e:
+        return {"error": str(e)}
+
+# -------------------------------------------
+# Consulta de estadísticas
+# -------------------------------------------
+def _percentile(sorted_vals, p):
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * p
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+def summary(order_by: str = "p95_ms", limit: int = 50) -> list[dict]:
+    """Top de sentencias por latencia (p50/p95/p99 sobre las últimas muestras)."""
+    with _lock:
+        items = [(fp, dict(st, samples=sorted(st["samples"]), callers=sorted(st["callers"])))
+                 for fp, st in _stats.items()]
+    out = []
+    for fp, st in items:
+        s = st["samples"]
+        out.append({
+            "fingerprint": fp,
+            "calls": st["calls"],
+            "errors": st["errors"],
+            "p50_ms": round(_percentile(s, 0.50), 2),
+            "p95_ms": round(_percentile(s, 0.95), 2),
+            "p99_ms": round(_percentile(s, 0.99), 2),
+            "max_ms": round(st["max_ms"], 2),
+            "total_ms": round(st["total_ms"], 1),
+            "avg_rows": round(st["rows"] / st["calls"], 1) if st["calls"] else 0,
+            "callers": ", ".join(st["callers"]),
+        })
+    out.sort(key=lambda r: r.get(order_by, 0), reverse=True)
+    return out[:limit]
+
+def recent(limit: int = 200, slow_only: bool = False) -> list[dict]:
+    with _lock:
+        rows = list(_recent)
+    if slow_only:
+        rows = [r for r in rows if r["ms"] >= SLOW_QUERY_MS]
+    return rows[-limit:][::-1]
+
+def reset():
+    with _lock:
+        _recent.clear()
+        _stats.clear()
+
+class Timer:
+    """Cronómetro simple: `with Timer() as t: ...; t.ms`."""
+    __slots__ = ("t0", "ms")
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        self.ms = 0.0
+        return self
+
+    def __exit__(self, *exc):
+        self.ms = (time.perf_counter() - self.t0) * 1000.0
+        return False
@@ -0,0 +1,182 @@
+# app/lib/realtime.py
+"""
+Eventos en vivo vía LISTEN/NOTIFY (un hilo escucha por proceso).
+
+Los procedimientos de acceso emiten NOTIFY 'aforo' con {"sede_id", "aforo"};
+el hilo mantiene en memoria el aforo por sede y las páginas lo leen desde un
+fragmento con refresco periódico, sin consultas por cada espectador.
+
+    from app.lib import realtime
+    realtime.aforo_por_sede()   # {sede_id: {"nombre": ..., "aforo": n}}
+
+Otros módulos pueden suscribirse a sus propios canales con subscribe().
+Variables de entorno:
+    REALTIME            0 para desactivar (las páginas vuelven a consultar la BD)
+    REALTIME_RESYNC_S   cada cuántos segundos se re-lee el snapshot completo (default 60)
+    AFORO_REFRESH_S     cada cuántos segundos se redibujan los fragmentos de aforo (default 3)
+    AFORO_FALLBACK_S    sin LISTEN, cada cuántos segundos se re-lee el aforo de la BD (default 30)
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from psycopg import sql
+
+from . import metrics
+from .db import get_conn, query
+
+log = logging.getLogger("gym.realtime")
+
+ENABLED = os.getenv("REALTIME", "1").strip().lower() not in ("0", "false", "off", "no")
+RESYNC_S = float(os.getenv("REALTIME_RESYNC_S", "60"))
+REFRESH_S = float(os.getenv("AFORO_REFRESH_S", "3"))  # refresco de los fragmentos de aforo
+FALLBACK_S = float(os.getenv("AFORO_FALLBACK_S", "30"))
+
+NOTIFICATIONS = metrics.counter("gym_notify_received_total", "Notificaciones LISTEN recibidas", ["channel"])
+RECONNECTS = metrics.counter("gym_notify_reconnects_total", "Reconexiones del hilo LISTEN")
+
+_lock = threading.Lock()
+_handlers: dict[str, list] = {}       # canal -> [callback(payload: str)]
+_on_connect: dict[str, list] = {}     # canal -> [fn()] para re-sincronizar tras (re)conectar
+_thread = None
+_listening = set()
+
+# -------------------------------------------
+# Hilo LISTEN
+# -------------------------------------------
+def subscribe(channel: str, callback, on_connect=None):
+    """Registra callback(payload) para un canal NOTIFY y arranca el hilo si hace falta."""
+    with _lock:
+        if callback not in _handlers.get(channel, []):
+            _handlers.setdefault(channel, []).append(callback)
+            if on_connect:
+                _on_connect.setdefault(channel, []).append(on_connect)
+    _ensure_thread()
+
+def _ensure_thread():
+    global _thread
+    if not ENABLED:
+        return
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return
+        _thread = threading.Thread(target=_loop, name="pg-listen", daemon=True)
+        _thread.start()
+
+def running() -> bool:
+    return ENABLED and _thread is not None and _thread.is_alive() and bool(_listening)
+
+def _resync(channels):
+    for ch in channels:
+        for fn in list(_on_connect.get(ch, [])):
+            try:
+                fn()
+            except Exception as e:
+                log.warning("re-sincronización de '%s' falló: %s", ch, e)
+
+def _loop():
+    espera = 1.0
+    while True:
+        try:
+            with get_conn() as conn:
+                conn.autocommit = True
+                _listening.clear()
+                ultimo_resync = time.monotonic()
+                while True:
+                    with _lock:
+                        nuevos = set(_handlers) - _listening
+                    for ch in nuevos:
+                        conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(ch)))
+                        _listening.add(ch)
+                    if nuevos:
+                        _resync(nuevos)   # snapshot después de LISTEN: no se pierden cambios
+                    espera = 1.0
+                    for n in conn.notifies(timeout=1.0):
+                        NOTIFICATIONS.inc(channel=n.channel)
+                        for cb in list(_handlers.get(n.channel, [])):
+                            try:
+                                cb(n.payload)
+                            except Exception as e:
+                                log.warning("handler de '%s' falló: %s", n.channel, e)
+                    if time.monotonic() - ultimo_resync >= RESYNC_S:
+                        _resync(set(_listening))
+                        ultimo_resync = time.monotonic()
+        except Exception as e:
+            _listening.clear()
+            RECONNECTS.inc()
+            log.warning("LISTEN desconectado (%s); reintento en %.0fs", e, espera)
+            time.sleep(espera)
+            espera = min(espera * 2, 30.0)
+
+# -------------------------------------------
+# Aforo en vivo
+# -------------------------------------------
+_aforo: dict[int, dict] = {}
+_aforo_ts = 0.0
+_aforo_leido = 0.0                    # monotonic de la última lectura completa desde la BD
+_recarga = threading.Lock()           # una sola recarga de respaldo por proceso
+
+def _cargar_aforo():
+    global _aforo_ts, _aforo_leido
+    rows = query("""
+        SELECT s.id, s.nombre, COUNT(a.id) AS aforo
+        FROM sede s
+        LEFT JOIN acceso a ON a.sede_id = s.id AND a.fecha_salida IS NULL
+        GROUP BY s.id, s.nombre
+    """, replica=False)  # snapshot tras LISTEN: debe ser del primario
+    with _lock:
+        _aforo.clear()
+        _aforo.update({r["id"]: {"nombre": r["nombre"], "aforo": int(r["aforo"])} for r in rows})
+        _aforo_ts = time.time()
+        _aforo_leido = time.monotonic()
+
+def _on_aforo(payload: str):
+    global _aforo_ts
+    d = json.loads(payload)
+    sid = int(d["sede_id"])
+    with _lock:
+        sede = _aforo.setdefault(sid, {"nombre": f"Sede {sid}", "aforo": 0})
+        sede["aforo"] = int(d["aforo"])
+        _aforo_ts = time.time()
+
+def _respaldo():
+    """Sin LISTEN: re-lee el aforo de la BD como mucho cada FALLBACK_S, una vez por proceso.
+
+    Mientras tanto los fragmentos sirven el último mapa conocido en vez de consultar
+    en cada refresco de cada espectador. Solo espera a la recarga si aún no hay mapa.
+    """
+    global _aforo_leido
+    if _aforo_ts and time.monotonic() - _aforo_leido < FALLBACK_S:
+        return
+    if not _recarga.acquire(blocking=not _aforo_ts):
+        return  # otro espectador ya está recargando: se sirve el mapa anterior
+    try:
+        if not _aforo_ts or time.monotonic() - _aforo_leido >= FALLBACK_S:
+            _cargar_aforo()
+    except Exception as e:
+        log.warning("lectura de respaldo del aforo falló: %s", e)
+        _aforo_leido = time.monotonic()  # se reintenta tras FALLBACK_S, no en cada refresco
+    finally:
+        _recarga.release()
+
+def aforo_por_sede() -> dict[int, dict] | None:
+    """Copia del aforo por sede, o None si el modo en vivo está desactivado o no hay datos.
+
+    Si el hilo LISTEN está caído devuelve el último mapa conocido, refrescado desde la BD
+    cada FALLBACK_S (ver running() para distinguirlo del dato en vivo).
+    """
+    if not ENABLED:
+        return None
+    subscribe("aforo", _on_aforo, on_connect=_cargar_aforo)
+    if not running():
+        _respaldo()
+    if not _aforo_ts:
+        return None
+    with _lock:
+        return {k: dict(v) for k, v in _aforo.items()}
+
+def aforo_actualizado() -> float:
+    """Epoch del último cambio recibido (o del último snapshot)."""
+    return _aforo_ts
@@ -0,0 +1,316 @@
+# app/lib/recibos.py
+"""
+Recibos de venta y de pago (HTML para pantalla/descarga, PDF y ZIP en lote).
+
+Las plantillas se compilan una vez al importar (string.Template) y comparten
+la misma hoja de estilos. Los recibos renderizados se guardan en una caché LRU
+por (tipo, id) — una venta o un pago no cambian después de registrados —, así
+que reimprimir no vuelve a consultar la BD ni a renderizar. Si uno cambia
+(anulación), invalidar() lo saca de la caché de todos los procesos (estado.py).
+
+    from app.lib import recibos
+    recibos.html("venta", 123, atendido_por=email)
+    recibos.lote("pago", recibos.ids_del_dia("pago", date.today()), formato="pdf")
+
+El PDF es texto monoespaciado (Courier, una página de 80 mm por recibo) generado
+sin dependencias externas, pensado para impresoras de tickets y contabilidad.
+Variables de entorno:
+    RECIBOS_CACHE_MAX   recibos en caché por proceso (default 5000)
+    RECIBOS_WORKERS     hilos para carga/render en lote (default 4)
+"""
+import html as _html
+import io
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from string import Template
+
+from . import estado, metrics
+from .db import query
+
+CACHE_MAX = int(os.getenv("RECIBOS_CACHE_MAX", "5000"))
+WORKERS = int(os.getenv("RECIBOS_WORKERS", "4"))
+LOTE_CHUNK = 250      # ids por consulta en lote
+TIPOS = ("venta", "pago")
+
+CACHE = metrics.counter("gym_recibos_cache_total", "Búsquedas en la caché de recibos", ["resultado"])
+
+# -------------------------------------------
+# Plantillas (compiladas al importar)
+# -------------------------------------------
+CSS = """
+body { font-family: 'Courier New', monospace; max-width: 400px; margin: 0 auto; padding: 20px; background: white; color: black; }
+.header { text-align: center; border-bottom: 2px solid #333; padding-bottom: 10px; margin-bottom: 15px; }
+.gym-name { font-size: 18px; font-weight: bold; margin-bottom: 5px; }
+.recibo-title { font-size: 16px; font-weight: bold; margin-top: 10px; }
+.info-row { display: flex; justify-content: space-between; margin: 8px 0; padding: 2px 0; }
+.label { font-weight: bold; min-width: 120px; }
+.value { text-align: right; flex: 1; }
+.separator { border-bottom: 1px dashed #666; margin: 15px 0; height: 1px; }
+.total { font-size: 18px; font-weight: bold; text-align: center; padding: 10px; border: 2px solid #333; margin: 15px 0; }
+.footer { text-align: center; font-size: 12px; margin-top: 20px; border-top: 1px solid #333; padding-top: 10px; }
+.numero-recibo { text-align: center; font-size: 14px; margin: 10px 0; }
+.items-table { width: 100%; border-collapse: collapse; margin: 15px 0; }
+.items-table th { border-bottom: 1px solid #000; padding: 8px 0; text-align: left; }
+.items-table th:nth-child(2), .items-table td:nth-child(2) { text-align: center; }
+.items-table th:nth-child(3), .items-table th:nth-child(4), .items-table td:nth-child(3), .items-table td:nth-child(4) { text-align: right; }
+.items-table td { border-bottom: 1px dashed #ccc; padding: 8px 0; }
+.atendido { margin-top: 10px; font-size: 10px; }
+@media print { body { margin: 0; padding: 10px; } }
+"""
+
+_ATENDIDO = "<!--atendido-->"   # se completa al servir: la caché no depende del usuario
+
+_PAGINA = Template("""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>$titulo</title><style>$css</style></head>
+<body>
+<div class="header">$cabecera<div class="recibo-title">$titulo</div></div>
+<div class="numero-recibo"><strong>N° $numero</strong></div>
+$filas
+<div class="separator"></div>
+$detalle
+<div class="total">TOTAL: S/ $total</div>
+<div class="separator"></div>
+<div class="footer">$pie<div class="atendido">Atendido por: """ + _ATENDIDO + """</div></div>
+</body></html>""")
+
+_FILA = Template('<div class="info-row"><span class="label">$label:</span><span class="value">$valor</span></div>')
+
+_TABLA = Template("""<table class="items-table">
+<thead><tr><th>Producto</th><th>Cant</th><th>P.Unit</th><th>Subtotal</th></tr></thead>
+<tbody>$items</tbody>
+</table>
+<div class="separator"></div>""")
+
+_ITEM = Template("<tr><td>$nombre</td><td>$cantidad</td><td>S/ $precio</td><td>S/ $subtotal</td></tr>")
+
+_CABECERA = {
+    "venta": '<div class="gym-name">🏪 TIENDA</div>',
+    "pago": '<div class="gym-name">🏋️ GYM MANAGER</div><div>RUC: 20123456789</div>',
+}
+_PIE = {
+    "venta": "<div>¡Gracias por su compra!</div>",
+    "pago": "<div>¡Gracias por tu pago!</div><div>Conserva este recibo como comprobante</div>",
+}
+
+def _e(v) -> str:
+    return _html.escape("" if v is None else str(v))
+
+def _fecha(v) -> str:
+    return v.strftime("%d/%m/%Y %H:%M") if isinstance(v, datetime) else str(v)
+
+def render_venta(venta: dict, items: list[dict]) -> str:
+    filas = [_FILA.substitute(label="Fecha", valor=_e(_fecha(venta["fecha"]))),
+             _FILA.substitute(label="Cliente", valor=_e(venta.get("socio") or "-"))]
+    tabla = _TABLA.substitute(items="".join(
+        _ITEM.substitute(nombre=_e(it["nombre"]), cantidad=int(it["cantidad"]),
+                         precio=f"{float(it['precio_unitario']):.2f}", subtotal=f"{float(it['subtotal']):.2f}")
+        for it in items))
+    return _PAGINA.substitute(css=CSS, titulo="RECIBO DE VENTA", cabecera=_CABECERA["venta"],
+                              numero=f"{int(venta['id']):06d}", filas="\n".join(filas), detalle=tabla,
+                              total=f"{float(venta['total']):,.2f}", pie=_PIE["venta"])
+
+def render_pago(pago: dict) -> str:
+    filas = [("Fecha", _fecha(pago["fecha"])), ("Cliente", pago.get("socio")),
+             ("Concepto", pago.get("concepto")), ("Medio de Pago", pago.get("medio"))]
+    if pago.get("ref_externa"):
+        filas.append(("Referencia", pago["ref_externa"]))
+    return _PAGINA.substitute(css=CSS, titulo="RECIBO DE PAGO", cabecera=_CABECERA["pago"],
+                              numero=f"{int(pago['id']):06d}",
+                              filas="\n".join(_FILA.substitute(label=l, valor=_e(v)) for l, v in filas),
+                              detalle="", total=f"{float(pago['monto']):,.2f}", pie=_PIE["pago"])
+
+# -------------------------------------------
+# Texto monoespaciado (PDF)
+# -------------------------------------------
+ANCHO = 40
+
+def _par(izq, der) -> str:
+    der = str(der)
+    return f"{str(izq)[:ANCHO - len(der) - 1]:<{ANCHO - len(der)}}{der}"
+
+def texto_venta(venta: dict, items: list[dict], atendido_por="Sistema") -> list[str]:
+    out = ["TIENDA".center(ANCHO), "RECIBO DE VENTA".center(ANCHO), f"N° {int(venta['id']):06d}".center(ANCHO), "",
+           _par("Fecha:", _fecha(venta["fecha"])), _par("Cliente:", venta.get("socio") or "-"), "-" * ANCHO]
+    for it in items:
+        out.append(str(it["nombre"])[:ANCHO])
+        out.append(_par(f"  {int(it['cantidad'])} x {float(it['precio_unitario']):.2f}", f"{float(it['subtotal']):.2f}"))
+    out += ["-" * ANCHO, _par("TOTAL S/", f"{float(venta['total']):,.2f}"), "",
+            "¡Gracias por su compra!".center(ANCHO), f"Atendido por: {atendido_por}"[:ANCHO]]
+    return out
+
+def texto_pago(pago: dict, atendido_por="Sistema") -> list[str]:
+    out = ["GYM MANAGER".center(ANCHO), "RUC: 20123456789".center(ANCHO), "RECIBO DE PAGO".center(ANCHO),
+           f"N° {int(pago['id']):06d}".center(ANCHO), "",
+           _par("Fecha:", _fecha(pago["fecha"])), _par("Cliente:", pago.get("socio") or "-"),
+           "Concepto:", f"  {pago.get('concepto') or ''}"[:ANCHO], _par("Medio:", pago.get("medio") or "")]
+    if pago.get("ref_externa"):
+        out.append(_par("Referencia:", pago["ref_externa"]))
+    out += ["-" * ANCHO, _par("TOTAL S/", f"{float(pago['monto']):,.2f}"), "",
+            "¡Gracias por tu pago!".center(ANCHO), f"Atendido por: {atendido_por}"[:ANCHO]]
+    return out
+
+def pdf(paginas: list[list[str]], font_size=9) -> bytes:
+    """PDF mínimo: una página de 80 mm por elemento de `paginas` (líneas en Courier)."""
+    leading = font_size + 3
+    ancho = 226.77  # 80 mm
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for lineas in paginas:
+        alto = 2 * 14 + leading * max(len(lineas), 1)
+        texto = b"".join(b"(" + _pdf_str(l) + b") Tj T* " for l in lineas)
+        stream = (b"BT /F1 %d Tf %d TL 6 %.2f Td " % (font_size, leading, alto - 14 - font_size)) + texto + b"ET"
+        objs.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objs.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %d] /Resources << /Font << /F1 3 0 R >> >> "
+                    b"/Contents %d 0 R >>" % (ancho, alto, len(objs)))
+        kids.append(len(objs))
+    objs[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, o in enumerate(objs, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % i + o + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1))
+    out.write(b"".join(b"%010d 00000 n \n" % off for off in offsets))
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref))
+    return out.getvalue()
+
+def _pdf_str(s: str) -> bytes:
+    b = s.encode("cp1252", errors="replace")
+    return b.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+# -------------------------------------------
+# Datos (en lote: una consulta por tipo de fila para N recibos)
+# -------------------------------------------
+def _cargar(tipo, ids) -> dict[int, dict]:
+    """{id: {"cab": dict, "items": [..]}} para los ids existentes."""
+    ids = [int(i) for i in ids]
+    if tipo == "pago":
+        rows = query("""
+            SELECT p.id, p.fecha, s.nombre AS socio, p.concepto, p.medio, p.monto, p.ref_externa
+            FROM pago p JOIN socio s ON s.id = p.socio_id
+            WHERE p.id = ANY(%s)
+        """, (ids,))
+        return {r["id"]: {"cab": r, "items": []} for r in rows}
+    cabs = query("""
+        SELECT v.id, v.fecha, v.total, COALESCE(s.nombre, '-') AS socio
+        FROM venta v LEFT JOIN socio s ON s.id = v.socio_id
+        WHERE v.id = ANY(%s)
+    """, (ids,))
+    out = {r["id"]: {"cab": r, "items": []} for r in cabs}
+    for it in query("""
+        SELECT vi.venta_id, p.nombre, vi.cantidad,
+               COALESCE(vi.precio_unitario, vi.precio) AS precio_unitario,
+               COALESCE(vi.subtotal, vi.precio * vi.cantidad) AS subtotal
+        FROM venta_item vi JOIN producto p ON p.id = vi.producto_id
+        WHERE vi.venta_id = ANY(%s)
+        ORDER BY vi.venta_id, vi.id
+    """, (ids,)):
+        out[it["venta_id"]]["items"].append(it)
+    return out
+
+def ids_del_dia(tipo, dia: date, sede_id=None) -> list[int]:
+    """Ids de ventas/pagos del día (solo de `sede_id` si se indica: ver auth.sede_scope)."""
+    tabla = {"venta": "venta", "pago": "pago"}[tipo]
+    desde = datetime.combine(dia, time.min)
+    sql, params = f"SELECT id FROM {tabla} WHERE fecha >= %s AND fecha < %s", [desde, desde + timedelta(days=1)]
+    if sede_id is not None:
+        sql += " AND sede_id = %s"
+        params.append(sede_id)
+    rows = query(sql + " ORDER BY id", tuple(params))
+    return [r["id"] for r in rows]
+
+# -------------------------------------------
+# Caché LRU por (tipo, id)
+# -------------------------------------------
+_lock = threading.Lock()
+_cache: "OrderedDict[tuple[str, int], dict]" = OrderedDict()
+
+def _guardar(tipo, rid, datos):
+    datos["html"] = render_venta(datos["cab"], datos["items"]) if tipo == "venta" else render_pago(datos["cab"])
+    with _lock:
+        _cache[(tipo, rid)] = datos
+        _cache.move_to_end((tipo, rid))
+        while len(_cache) > CACHE_MAX:
+            _cache.popitem(last=False)
+    return datos
+
+def _obtener(tipo, ids) -> dict[int, dict]:
+    """Entradas de caché para `ids`, cargando y renderizando solo las que faltan."""
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo de recibo desconocido: {tipo}")
+    out, faltan = {}, []
+    with _lock:
+        for rid in ids:
+            d = _cache.get((tipo, int(rid)))
+            if d is None:
+                faltan.append(int(rid))
+            else:
+                _cache.move_to_end((tipo, int(rid)))
+                out[int(rid)] = d
+    CACHE.inc(len(out), resultado="hit")
+    if faltan:
+        CACHE.inc(len(faltan), resultado="miss")
+        for rid, datos in _cargar(tipo, faltan).items():
+            out[rid] = _guardar(tipo, rid, datos)
+    return out
+
+def _quitar(clave):
+    tipo, rid = clave.split(":")
+    with _lock:
+        _cache.pop((tipo, int(rid)), None)
+
+estado.al_invalidar("recibo", _quitar)
+
+def invalidar(tipo, rid):
+    """Saca el recibo de la caché de este y de los demás procesos."""
+    estado.invalidar("recibo", f"{tipo}:{int(rid)}")
+
+def _servir(datos, atendido_por) -> str:
+    return datos["html"].replace(_ATENDIDO, _e(atendido_por or "Sistema"), 1)
+
+def html(tipo, rid, atendido_por=None) -> str | None:
+    """HTML del recibo (None si no existe)."""
+    datos = _obtener(tipo, [rid]).get(int(rid))
+    return _servir(datos, atendido_por) if datos else None
+
+def html_venta(venta, items, atendido_por=None) -> str:
+    """Renderiza con datos ya en memoria (recién confirmada) y deja el recibo en caché."""
+    return _servir(_guardar("venta", int(venta["id"]), {"cab": dict(venta), "items": list(items)}), atendido_por)
+
+def html_pago(pago, atendido_por=None) -> str:
+    return _servir(_guardar("pago", int(pago["id"]), {"cab": dict(pago), "items": []}), atendido_por)
+
+# -------------------------------------------
+# Lotes (ZIP de HTML o un PDF) con un pool de hilos
+# -------------------------------------------
+def lote(tipo, ids, formato="zip", atendido_por=None, workers=None) -> bytes:
+    """Recibos de `ids` en un ZIP (un HTML por recibo) o en un único PDF, en el orden dado."""
+    ids = [int(i) for i in ids]
+    chunks = [ids[i:i + LOTE_CHUNK] for i in range(0, len(ids), LOTE_CHUNK)]
+
+    def trabajo(chunk):
+        datos = _obtener(tipo, chunk)
+        if formato == "pdf":
+            fn = (lambda d: texto_venta(d["cab"], d["items"], atendido_por or "Sistema")) if tipo == "venta" \
+                else (lambda d: texto_pago(d["cab"], atendido_por or "Sistema"))
+            return [(rid, fn(datos[rid])) for rid in chunk if rid in datos]
+        return [(rid, _servir(datos[rid], atendido_por)) for rid in chunk if rid in datos]
+
+    with ThreadPoolExecutor(max_workers=workers or WORKERS, thread_name_prefix="recibos") as pool:
+        partes = [r for parte in pool.map(trabajo, chunks) for r in parte]
+
+    if formato == "pdf":
+        return pdf([lineas for _, lineas in partes])
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        for rid, contenido in partes:
+            z.writestr(f"recibo_{tipo}_{rid:06d}.html", contenido)
+    return buf.getvalue()
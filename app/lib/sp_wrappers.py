@@ -1,32 +1,151 @@
-from .db import call_sp
+import time
+from datetime import date
+
+from . import metrics, realtime
+from .db import call_sp, db_cursor, query, query_prepared, register_statement, reintentar
+
+SP_SECONDS = metrics.histogram("gym_sp_seconds", "Latencia de procedimientos almacenados", ["sp"])
+SP_CALLS = metrics.counter("gym_sp_calls_total", "Llamadas a procedimientos almacenados", ["sp", "status"])
+AFORO = metrics.gauge("gym_aforo_actual", "Personas dentro por sede", ["sede"])
+VENTAS_MINUTO = metrics.gauge("gym_ventas_ultimo_minuto", "Ventas registradas en el último minuto")
+VENTAS_MONTO_MINUTO = metrics.gauge("gym_ventas_monto_ultimo_minuto", "Monto vendido en el último minuto (S/)")
+PAGOS_MONTO = metrics.counter("gym_pagos_monto_total", "Monto de pagos registrados vía SP (S/)", ["medio"])
+
+register_statement("socio.recientes", "SELECT id, nombre FROM socio ORDER BY id DESC LIMIT %s")
+
+def _sp(sp_name, params=(), commit=True, timeout="interactive", preparada=False):
+    t0 = time.perf_counter()
+    status = "error"
+    try:
+        rows = call_sp(sp_name, params, commit=commit, timeout=timeout, preparada=preparada)
+        status = str(rows[0].get("status", "OK")) if rows else "OK"
+        return rows
+    finally:
+        SP_SECONDS.observe(time.perf_counter() - t0, sp=sp_name)
+        SP_CALLS.inc(sp=sp_name, status=status)
 
 def alta_socio(dni, nombre, email, telefono):
-    return call_sp("sp_alta_socio", (dni, nombre, email, telefono))
+    return _sp("sp_alta_socio", (dni, nombre, email, telefono))
 
 def crear_membresia(socio_id, plan_id, fecha_inicio):
-    return call_sp("sp_crear_membresia", (socio_id, plan_id, fecha_inicio))
+    return _sp("sp_crear_membresia", (socio_id, plan_id, fecha_inicio))
 
 def registrar_pago(socio_id, concepto, monto, medio, ref_externa):
-    return call_sp("sp_registrar_pago", (socio_id, concepto, monto, medio, ref_externa))
+    rows = _sp("sp_registrar_pago", (socio_id, concepto, monto, medio, ref_externa))
+    if rows and rows[0].get("status") == "OK":
+        PAGOS_MONTO.inc(float(monto), medio=medio)
+    return rows
 
 def publicar_clase(sede_id, nombre, fecha_hora, capacidad):
-    return call_sp("sp_publicar_clase", (sede_id, nombre, fecha_hora, capacidad))
+    return _sp("sp_publicar_clase", (sede_id, nombre, fecha_hora, capacidad))
 
 def reservar_clase(socio_id, clase_id):
-    return call_sp("sp_reservar_clase", (socio_id, clase_id))
+    return _sp("sp_reservar_clase", (socio_id, clase_id))
 
 def checkin_clase(reserva_id):
-    return call_sp("sp_checkin_clase", (reserva_id,))
+    return _sp("sp_checkin_clase", (reserva_id,))
 
 def registrar_acceso(socio_id, sede_id):
-    return call_sp("sp_registrar_acceso", (socio_id, sede_id))
+    return _sp("sp_registrar_acceso", (socio_id, sede_id), preparada=True)  # camino caliente
 
 def registrar_salida(acceso_id):
-    return call_sp("sp_registrar_salida", (acceso_id,))
+    return _sp("sp_registrar_salida", (acceso_id,), preparada=True)
+
+def congelar_membresia(membresia_id, desde=None, dias=None, motivo=None):
+    return _sp("sp_congelar_membresia", (membresia_id, desde or date.today(), dias, motivo))
+
+def descongelar_membresia(membresia_id, fecha=None):
+    return _sp("sp_descongelar_membresia", (membresia_id, fecha or date.today()))
+
+def congelar_sede(sede_id, desde, dias=None, motivo=None, dias_actividad=60):
+    return _sp("sp_congelar_sede", (sede_id, desde, dias, motivo, dias_actividad), timeout="report")
+
+def descongelar_sede(sede_id, fecha=None):
+    return _sp("sp_descongelar_sede", (sede_id, fecha or date.today()), timeout="report")
+
+def reactivar_congeladas():
+    """Vuelve a 'activa' las membresías cuyo congelamiento de período fijo ya terminó."""
+    return _sp("sp_reactivar_congeladas", timeout="batch")
+
+def renovar_membresias(membresia_ids, medio="Efectivo", con_pago=True, dry_run=False):
+    """
+    Renovación masiva (sp_renovar_membresias) en una transacción.
+    Con dry_run=True ejecuta lo mismo y hace ROLLBACK: sirve de vista previa exacta.
+    Devuelve (filas, resumen).
+    """
+    t0 = time.perf_counter()
+    status = "error"
+    def renovar():
+        with db_cursor(commit=not dry_run, timeout="report") as cur:
+            cur.execute("SELECT * FROM sp_renovar_membresias(%s, %s, %s)", (list(membresia_ids), medio, con_pago))
+            rows = cur.fetchall()
+            if dry_run:
+                cur.connection.rollback()
+            return rows
+
+    try:
+        rows = reintentar(renovar)   # una transacción: se repite solo si Postgres la abortó
+        status = "DRY_RUN" if dry_run else "OK"
+    finally:
+        SP_SECONDS.observe(time.perf_counter() - t0, sp="sp_renovar_membresias")
+        SP_CALLS.inc(sp="sp_renovar_membresias", status=status)
+    por_plan = {}
+    for r in rows:
+        p = por_plan.setdefault(r["plan"], {"membresias": 0, "monto": 0.0})
+        p["membresias"] += 1
+        p["monto"] += float(r["monto"]) if con_pago else 0.0
+    if con_pago and not dry_run:
+        for r in rows:
+            PAGOS_MONTO.inc(float(r["monto"]), medio=medio)
+    resumen = {
+        "solicitadas": len(set(membresia_ids)),
+        "renovadas": len(rows),
+        "omitidas": len(set(membresia_ids)) - len(rows),
+        "pagos": sum(1 for r in rows if r["pago_id"]),
+        "monto_total": round(sum(p["monto"] for p in por_plan.values()), 2),
+        "por_plan": por_plan,
+        "dry_run": dry_run,
+    }
+    return rows, resumen
 
 def aforo_actual(sede_id):
-    rows = call_sp("sp_aforo_actual", (sede_id,))
-    return rows[0]["sp_aforo_actual"] if rows else 0
+    rows = _sp("sp_aforo_actual", (sede_id,), commit=False, preparada=True)  # solo lectura
+    valor = rows[0]["sp_aforo_actual"] if rows else 0
+    AFORO.set(valor, sede=sede_id)
+    return valor
+
+def socios_recientes(limit=300):
+    """Selector de socios de Accesos y Ventas (los más recientes primero)."""
+    return query_prepared("socio.recientes", (limit,))
+
+def kpis(sede_id=None):
+    return _sp("sp_kpis", (sede_id,), commit=False)  # solo lectura
+
+def rollup_ocupacion(desde=None):
+    """Recalcula ocupacion_hora desde la marca de agua (o desde `desde`)."""
+    return _sp("sp_rollup_ocupacion", (desde,), timeout="batch")
 
-def kpis():
-    return call_sp("sp_kpis")
+# -------------------------------------------
+# Métricas de negocio leídas en cada scrape (cacheadas para no cargar la BD)
+# -------------------------------------------
+@metrics.register_collector
+@metrics.cached(15)
+def _negocio():
+    vivo = realtime.aforo_por_sede()
+    if vivo is not None:
+        for sid, v in vivo.items():
+            AFORO.set(v["aforo"], sede=sid)
+    else:
+        for r in query("""
+            SELECT s.id, COUNT(a.id) AS dentro
+            FROM sede s
+            LEFT JOIN acceso a ON a.sede_id = s.id AND a.fecha_salida IS NULL
+            GROUP BY s.id
+        """):
+            AFORO.set(r["dentro"], sede=r["id"])
+    v = query("""
+        SELECT COUNT(*) AS n, COALESCE(SUM(total), 0)::float AS monto
+        FROM venta WHERE fecha >= now() - interval '1 minute'
+    """)[0]
+    VENTAS_MINUTO.set(v["n"])
+    VENTAS_MONTO_MINUTO.set(v["monto"])
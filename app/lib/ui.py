@@ -18,3 +18,31 @@ def load_base_css():
 
 def badge(text: str, color: str = ""):
     st.markdown(f'<span class="badge {color}">{text}</span>', unsafe_allow_html=True)
+
+def fragment(run_every=None):
+    """
+    Decorador de fragmento (rerun parcial) compatible con varias versiones de Streamlit:
+    st.fragment (>=1.37), st.experimental_fragment (1.33-1.36) o, si no existe,
+    una función normal que se ejecuta con la página completa.
+    """
+    deco = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+    if deco is None:
+        return lambda fn: fn
+    return deco(run_every=run_every)
+
+def lazy_tabs(labels, key, default=0):
+    """
+    Sustituto de st.tabs que solo ejecuta la sección visible: st.tabs corre el
+    cuerpo de todas las pestañas en cada rerun. Devuelve un booleano por etiqueta
+    (True solo para la activa), así que `with tab_x:` pasa a ser `if tab_x:`.
+    Usa st.segmented_control (>=1.40) o un radio horizontal. Si lo que está por
+    encima es caro, llamarlo dentro de una función con @fragment() para que al
+    cambiar de sección solo se re-ejecute el fragmento.
+    """
+    control = getattr(st, "segmented_control", None)
+    if control is not None:
+        sel = control("Sección", labels, default=labels[default], key=key, label_visibility="collapsed")
+        sel = sel or labels[default]  # segmented_control permite deseleccionar
+    else:
+        sel = st.radio("Sección", labels, index=default, key=key, horizontal=True, label_visibility="collapsed")
+    return [sel == label for label in labels]
@@ -1,12 +1,11 @@
 import streamlit as st
 from datetime import date, datetime, time, timedelta
-from io import StringIO
-import csv
-
-from app.lib.auth import require_perm, has_permission
-from app.lib.db import query, db_cursor
-from app.lib.ui import load_base_css
+from app.lib.auth import require_perm, has_permission, add_sede_scope
+from app.lib.db import query, query_df, db_cursor
+from app.lib.ui import load_base_css, lazy_tabs
+from app.lib import estado, profiler, recibos
 
+profiler.start_page("Pagos")
 st.set_page_config(page_title="Pagos", page_icon="💳", layout="wide")
 load_base_css()
 st.title("💳 Pagos")
@@ -16,13 +15,12 @@ require_perm("payments_read")
 # ------------------ Helpers ------------------
 MEDIOS = ["Efectivo", "Tarjeta", "Transferencia", "Yape", "Plin", "POS", "Otro"]
 
-def to_csv(rows, headers):
-    sio = StringIO()
-    writer = csv.DictWriter(sio, fieldnames=headers)
-    writer.writeheader()
-    for r in rows:
-        writer.writerow({k: r.get(k) for k in headers})
-    return sio.getvalue()
+def etiquetas(df, *cols):
+    """{id: "#id | col | ..."} armado por columnas del DataFrame, sin recorrer filas en Python."""
+    txt = "#" + df["id"].astype(str)
+    for c in cols:
+        txt = txt + " | " + ("S/ " + df[c].map("{:.2f}".format) if c == "monto" else df[c].astype(str))
+    return dict(zip(df["id"].tolist(), txt.tolist()))
 
 def auditoria(cur, accion, entidad, entidad_id=None, detalle=None):
     """Audita si la tabla auditoria existe (opcional)."""
@@ -37,149 +35,12 @@ def auditoria(cur, accion, entidad, entidad_id=None, detalle=None):
         # si no existe la tabla o falla, no romper el flujo
         pass
 
-def generar_recibo_html(pago_data):
-    """Genera HTML para el recibo de pago"""
-    fecha_formato = pago_data['fecha'].strftime('%d/%m/%Y %H:%M') if isinstance(pago_data['fecha'], datetime) else pago_data['fecha']
-    
-    html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="utf-8">
-        <style>
-            body {{
-                font-family: 'Courier New', monospace;
-                max-width: 400px;
-                margin: 0 auto;
-                padding: 20px;
-                background: white;
-                color: black;
-            }}
-            .header {{
-                text-align: center;
-                border-bottom: 2px solid #333;
-                padding-bottom: 10px;
-                margin-bottom: 15px;
-            }}
-            .gym-name {{
-                font-size: 18px;
-                font-weight: bold;
-                margin-bottom: 5px;
-            }}
-            .recibo-title {{
-                font-size: 16px;
-                font-weight: bold;
-                margin-top: 10px;
-            }}
-            .info-row {{
-                display: flex;
-                justify-content: space-between;
-                margin: 8px 0;
-                padding: 2px 0;
-            }}
-            .label {{
-                font-weight: bold;
-                min-width: 120px;
-            }}
-            .value {{
-                text-align: right;
-                flex: 1;
-            }}
-            .separator {{
-                border-bottom: 1px dashed #666;
-                margin: 15px 0;
-                height: 1px;
-            }}
-            .total {{
-                font-size: 18px;
-                font-weight: bold;
-                text-align: center;
-                padding: 10px;
-                border: 2px solid #333;
-                margin: 15px 0;
-            }}
-            .footer {{
-                text-align: center;
-                font-size: 12px;
-                margin-top: 20px;
-                border-top: 1px solid #333;
-                padding-top: 10px;
-            }}
-            .numero-recibo {{
-                text-align: center;
-                font-size: 14px;
-                margin: 10px 0;
-            }}
-            @media print {{
-                body {{ 
-                    margin: 0;
-                    padding: 10px;
-                }}
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <div class="gym-name">🏋️ GYM MANAGER</div>
-            <div>RUC: 20123456789</div>
-            <div class="recibo-title">RECIBO DE PAGO</div>
-        </div>
-        
-        <div class="numero-recibo">
-            <strong>N° {pago_data['id']:06d}</strong>
-        </div>
-        
-        <div class="info-row">
-            <span class="label">Fecha:</span>
-            <span class="value">{fecha_formato}</span>
-        </div>
-        
-        <div class="info-row">
-            <span class="label">Cliente:</span>
-            <span class="value">{pago_data['socio']}</span>
-        </div>
-        
-        <div class="info-row">
-            <span class="label">Concepto:</span>
-            <span class="value">{pago_data['concepto']}</span>
-        </div>
-        
-        <div class="info-row">
-            <span class="label">Medio de Pago:</span>
-            <span class="value">{pago_data['medio']}</span>
-        </div>
-        
-        {f'''<div class="info-row">
-            <span class="label">Referencia:</span>
-            <span class="value">{pago_data['ref_externa']}</span>
-        </div>''' if pago_data.get('ref_externa') else ''}
-        
-        <div class="separator"></div>
-        
-        <div class="total">
-            TOTAL: S/ {pago_data['monto']:,.2f}
-        </div>
-        
-        <div class="separator"></div>
-        
-        <div class="footer">
-            <div>¡Gracias por tu pago!</div>
-            <div>Conserva este recibo como comprobante</div>
-            <div style="margin-top: 10px; font-size: 10px;">
-                Atendido por: {st.session_state.get('user', {}).get('email', 'Sistema')}
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    return html
-
 def mostrar_recibo_interactivo(pago_data):
     """Muestra el recibo en la interfaz de Streamlit"""
     st.success("✅ Pago registrado exitosamente")
     
     # Generar el HTML del recibo
-    recibo_html = generar_recibo_html(pago_data)
+    recibo_html = recibos.html_pago(pago_data, st.session_state.get('user', {}).get('email'))
     
     # Mostrar el recibo en un contenedor especial
     st.markdown("### 🧾 Recibo Generado")
@@ -209,17 +70,15 @@ def mostrar_recibo_interactivo(pago_data):
         # Botón para limpiar y hacer otro pago
         if st.button("➕ Registrar Nuevo Pago", use_container_width=True):
             # Limpiar el estado del recibo
-            if 'mostrar_recibo' in st.session_state:
-                del st.session_state['mostrar_recibo']
-            if 'ultimo_pago' in st.session_state:
-                del st.session_state['ultimo_pago']
+            estado.quitar('mostrar_recibo')
+            estado.quitar('ultimo_pago')
             st.rerun()
 
 # ------------------ Tabs ------------------
-tab_nuevo, tab_listado = st.tabs(["➕ Registrar pago", "📋 Listado / Anular"])
+tab_nuevo, tab_listado = lazy_tabs(["➕ Registrar pago", "📋 Listado / Anular"], key="pagos_tab")
 
 # ================== NUEVO PAGO ==================
-with tab_nuevo:
+if tab_nuevo:
     if not has_permission("payments_create"):
         st.info("No tienes permiso para registrar pagos.")
     else:
@@ -256,10 +115,11 @@ with tab_nuevo:
                         ts = datetime.combine(f_pago, t_pago)
                         with db_cursor(commit=True) as cur:
                             cur.execute("""
-                                INSERT INTO pago (socio_id, concepto, monto, medio, ref_externa, fecha)
-                                VALUES (%s, %s, %s, %s, %s, %s)
+                                INSERT INTO pago (socio_id, concepto, monto, medio, ref_externa, fecha, sede_id)
+                                VALUES (%s, %s, %s, %s, %s, %s, %s)
                                 RETURNING id
-                            """, (socio["id"], concepto.strip(), monto, medio, (ref or None), ts))
+                            """, (socio["id"], concepto.strip(), monto, medio, (ref or None), ts,
+                                  (st.session_state.get("user") or {}).get("sede_id")))
                             pid = cur.fetchone()["id"]
                             auditoria(cur,
                                       accion="crear_pago",
@@ -279,8 +139,8 @@ with tab_nuevo:
                         }
                         
                         # Guardar en session state y activar vista de recibo
-                        st.session_state['ultimo_pago'] = pago_data
-                        st.session_state['mostrar_recibo'] = True
+                        estado.guardar("ultimo_pago", pago_data)
+                        estado.guardar("mostrar_recibo", True)
                         
                         # Rerun para mostrar el recibo
                         st.rerun()
@@ -289,7 +149,7 @@ with tab_nuevo:
                         st.error(f"No se pudo registrar el pago: {e}")
 
 # ================== LISTADO ==================
-with tab_listado:
+if tab_listado:
     st.subheader("Búsqueda")
     c1, c2, c3, c4 = st.columns(4)
     with c1:
@@ -329,52 +189,46 @@ with tab_listado:
         sql += " AND p.medio = %s"
         params.append(q_medio)
 
+    sql, params = add_sede_scope(sql, params, alias="p")
     sql += " ORDER BY p.fecha DESC, p.id DESC LIMIT %s"
     params.append(limite)
 
+    # Listado columnar (query_df): total, tabla y CSV sin materializar un dict por fila
     try:
-        rows = query(sql, tuple(params))
+        pagos = query_df(sql, tuple(params))
     except Exception as e:
         st.error(f"Error consultando pagos: {e}")
-        rows = []
+        pagos = None
+    hay_pagos = pagos is not None and not pagos.empty
 
     # Totales del periodo filtrado
-    total = sum(r["monto"] for r in rows) if rows else 0
+    total = float(pagos["monto"].sum()) if hay_pagos else 0
     st.metric("Total en el periodo (S/)", f"{total:,.2f}")
 
-    if rows:
-        st.dataframe(rows, use_container_width=True)
+    if hay_pagos:
+        st.dataframe(pagos, use_container_width=True)
 
         # Exportar CSV
-        csv_data = to_csv(rows, headers=["id", "fecha", "socio", "concepto", "medio", "monto", "ref_externa"])
+        csv_data = pagos.to_csv(index=False)
         st.download_button("⬇️ Exportar CSV", data=csv_data, file_name="pagos.csv", mime="text/csv")
 
         # Sección para regenerar recibos
         st.divider()
         st.markdown("### 🧾 Regenerar Recibo")
+        et_recibo = etiquetas(pagos, "fecha", "socio", "monto", "concepto")
         sel_recibo = st.selectbox(
             "Selecciona el pago para regenerar su recibo",
-            rows,
-            format_func=lambda r: f"#{r['id']} | {r['fecha']} | {r['socio']} | S/ {r['monto']} | {r['concepto']}"
+            list(et_recibo),
+            format_func=et_recibo.get
         )
         
         if st.button("📄 Generar Recibo"):
-            pago_data = {
-                'id': sel_recibo['id'],
-                'fecha': sel_recibo['fecha'],
-                'socio': sel_recibo['socio'],
-                'concepto': sel_recibo['concepto'],
-                'medio': sel_recibo['medio'],
-                'monto': sel_recibo['monto'],
-                'ref_externa': sel_recibo['ref_externa']
-            }
-            
-            recibo_html = generar_recibo_html(pago_data)
+            recibo_html = recibos.html("pago", sel_recibo, st.session_state.get('user', {}).get('email'))
             
             st.download_button(
                 label="📄 Descargar Recibo",
                 data=recibo_html,
-                file_name=f"recibo_{pago_data['id']:06d}.html",
+                file_name=f"recibo_{sel_recibo:06d}.html",
                 mime="text/html"
             )
             
@@ -382,8 +236,27 @@ with tab_listado:
             with st.expander("👁️ Vista Previa del Recibo"):
                 st.components.v1.html(recibo_html, height=400, scrolling=True)
 
+        # Recibos en lote (contabilidad): todos los pagos filtrados en un PDF o ZIP
+        st.markdown("### 🗂️ Recibos en lote")
+        cl1, cl2 = st.columns([1, 2])
+        with cl1:
+            formato = st.radio("Formato", ["PDF", "ZIP (HTML)"], horizontal=True, key="pagos_lote_formato")
+        with cl2:
+            st.caption(f"{len(pagos)} pagos del listado filtrado. Los recibos ya generados salen de caché.")
+        if st.button("📦 Generar lote"):
+            fmt = "pdf" if formato == "PDF" else "zip"
+            with st.spinner("Generando recibos..."):
+                data = recibos.lote("pago", pagos["id"].tolist(), formato=fmt,
+                                    atendido_por=st.session_state.get('user', {}).get('email'))
+            st.download_button(
+                label=f"⬇️ Descargar {formato}",
+                data=data,
+                file_name=f"recibos_pagos_{desde:%Y%m%d}_{hasta:%Y%m%d}.{fmt}",
+                mime="application/pdf" if fmt == "pdf" else "application/zip"
+            )
+
     # Anular / reversar
-    if rows:
+    if hay_pagos:
         # Verificar permisos para reversar
         puede_reversar = False
         try:
@@ -394,34 +267,30 @@ with tab_listado:
         if puede_reversar:
             st.divider()
             st.markdown("### Anular / Reversar pago")
+            et_pago = etiquetas(pagos, "fecha", "socio", "monto", "medio", "concepto")
             sel = st.selectbox(
                 "Selecciona el pago",
-                rows,
-                format_func=lambda r: f"#{r['id']} | {r['fecha']} | {r['socio']} | S/ {r['monto']} | {r['medio']} | {r['concepto']}"
+                list(et_pago),
+                format_func=et_pago.get
             )
+            concepto = pagos.loc[pagos["id"] == sel, "concepto"].iat[0]
             motivo = st.text_input("Motivo de anulación (se registrará en auditoría)")
             if st.button("🧾 Generar reverso (asiento negativo)"):
                 try:
                     with db_cursor(commit=True) as cur:
                         # crear contrapartida negativa (no borramos historial)
                         cur.execute("""
-                            INSERT INTO pago (socio_id, concepto, monto, medio, ref_externa, fecha)
-                            VALUES (
-                                (SELECT socio_id FROM pago WHERE id=%s),
-                                %s,
-                                -(SELECT monto FROM pago WHERE id=%s),
-                                'anulacion',
-                                %s,
-                                now()
-                            )
+                            INSERT INTO pago (socio_id, concepto, monto, medio, ref_externa, fecha, sede_id)
+                            SELECT socio_id, %s, -monto, 'anulacion', %s, now(), sede_id
+                            FROM pago WHERE id=%s
                             RETURNING id
-                        """, (sel["id"], f"ANULACIÓN #{sel['id']}: {motivo or sel['concepto']}", sel["id"], f"reversa de #{sel['id']}"))
+                        """, (f"ANULACIÓN #{sel}: {motivo or concepto}", f"reversa de #{sel}", sel))
                         rid = cur.fetchone()["id"]
                         auditoria(cur,
                                   accion="reverso_pago",
                                   entidad="pago",
                                   entidad_id=rid,
-                                  detalle=f'{{"reversa_de": {sel["id"]}}}')
+                                  detalle=f'{{"reversa_de": {sel}}}')
                     st.success(f"Pago reversado con asiento #{rid}")
                     st.rerun()
                 except Exception as e:
@@ -430,3 +299,5 @@ with tab_listado:
             st.info("No tienes permiso para anular/reversar pagos.")
     else:
         st.info("No se encontraron pagos en el periodo seleccionado.")
+
+profiler.render_panel()
@@ -0,0 +1,59 @@
+import os
+import streamlit as st
+from app.lib.auth import require_role
+from app.lib import query_stats, profiler, db
+from app.lib.ui import load_base_css
+
+profiler.start_page("Rendimiento")
+st.set_page_config(page_title="Rendimiento", page_icon="⏱️", layout="wide")
+load_base_css()
+st.title("⏱️ Rendimiento SQL")
+require_role("admin")
+
+st.caption(
+    f"Estadísticas en memoria de este proceso. Umbral de lentas: {query_stats.SLOW_QUERY_MS:.0f} ms "
+    f"(SLOW_QUERY_MS) · muestreo EXPLAIN: {query_stats.EXPLAIN_RATE:.0%} (SLOW_QUERY_EXPLAIN_RATE)"
+)
+rep = db.replica_estado()
+if rep["configurada"]:
+    estado = "🟢 en uso" if rep["ok"] else "🔴 fuera de servicio (lecturas al primario)"
+    st.caption(f"Réplica de lectura ({os.getenv('PGHOST_RO')}): {estado} · retraso {rep['lag']:.1f} s "
+               f"(máx. {db.REPLICA_MAX_LAG_S:.0f} s, REPLICA_MAX_LAG_S)")
+st.caption("Timeouts (s): " + " · ".join(f"{k} {v:g}" for k, v in db.TIMEOUTS_S.items())
+           + f" (0 = sin límite) · circuit breaker: {'🟢 cerrado' if db.disponible() else '🔴 abierto'}")
+
+c1, c2, c3 = st.columns([1, 1, 2])
+with c1:
+    orden = st.selectbox("Ordenar por", ["p95_ms", "p99_ms", "p50_ms", "total_ms", "calls", "max_ms"])
+with c2:
+    limite = st.selectbox("Top", [20, 50, 100], index=0)
+with c3:
+    st.write("")
+    if st.button("🧹 Reiniciar estadísticas"):
+        query_stats.reset()
+        st.rerun()
+
+top = query_stats.summary(order_by=orden, limit=limite)
+if top:
+    st.dataframe(top, use_container_width=True, hide_index=True)
+else:
+    st.info("Aún no hay sentencias registradas en este proceso.")
+
+st.subheader("Ejecuciones recientes")
+solo_lentas = st.checkbox("Solo lentas", value=True)
+st.dataframe(query_stats.recent(limit=200, slow_only=solo_lentas), use_container_width=True, hide_index=True)
+
+st.subheader("Sentencias preparadas")
+st.caption("Sentencias calientes registradas con db.register_statement: se preparan una vez por conexión del pool.")
+st.dataframe(db.prepared_stats(), use_container_width=True, hide_index=True)
+
+st.divider()
+st.subheader("Perfilado de páginas")
+modos = {"Apagado": "", "Secciones": "1", "Secciones + cProfile": "cprofile"}
+actual = st.session_state.get("profiler_mode", profiler.ENV_MODE)
+modo = st.radio("Modo para esta sesión", list(modos), horizontal=True,
+                index=list(modos.values()).index(actual) if actual in modos.values() else 0)
+st.session_state["profiler_mode"] = modos[modo]
+st.caption("Con el perfilado activo, cada página instrumentada muestra al final un expander con la cascada del rerun.")
+
+profiler.render_panel()
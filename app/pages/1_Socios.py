@@ -2,17 +2,19 @@ import streamlit as st
 from app.lib.auth import require_login
 from app.lib.db import query, execute
 from app.lib.sp_wrappers import alta_socio
-from app.lib.ui import load_base_css, badge
+from app.lib.ui import load_base_css, badge, lazy_tabs
+from app.lib import profiler
 
+profiler.start_page("Socios")
 st.set_page_config(page_title="Socios", page_icon="👤", layout="wide")
 load_base_css()
 st.title("👤 Socios")
 
 require_login()
 
-tab_listar, tab_crear, tab_editar = st.tabs(["📋 Listar / Buscar", "➕ Crear", "✏️ Editar / Eliminar"])
+tab_listar, tab_crear, tab_editar = lazy_tabs(["📋 Listar / Buscar", "➕ Crear", "✏️ Editar / Eliminar"], key="socios_tab")
 
-with tab_listar:
+if tab_listar:
     c1, c2 = st.columns([2,1])
     with c1:
         q = st.text_input("🔎 Buscar por nombre o email", "")
@@ -31,7 +33,7 @@ with tab_listar:
     st.dataframe(rows, use_container_width=True)
     st.caption("Tip: usa el buscador para filtrar.")
 
-with tab_crear:
+if tab_crear:
     st.subheader("Alta de socio")
     with st.form("f_alta"):
         c1, c2 = st.columns(2)
@@ -55,7 +57,7 @@ with tab_crear:
             else:
                 st.error(f"{r.get('message')} (code {r.get('code')})")
 
-with tab_editar:
+if tab_editar:
     st.subheader("Editar / Eliminar")
     socios = query("SELECT id, nombre, email FROM socio ORDER BY id DESC LIMIT 300")
     if not socios:
@@ -88,3 +90,5 @@ with tab_editar:
                 execute("DELETE FROM socio WHERE id=%s", (s["id"],))
                 st.success("Eliminado")
                 st.rerun()
+
+profiler.render_panel()
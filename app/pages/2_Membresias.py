@@ -1,20 +1,26 @@
 import streamlit as st
-from datetime import date
-from app.lib.auth import require_login
+from datetime import date, timedelta
+from app.lib.auth import require_login, has_permission, audit, sedes_visibles
 from app.lib.db import query, execute
-from app.lib.sp_wrappers import crear_membresia, registrar_pago
-from app.lib.ui import load_base_css, badge
+from app.lib.sp_wrappers import (crear_membresia, registrar_pago, renovar_membresias, congelar_membresia,
+                                 descongelar_membresia, congelar_sede, descongelar_sede)
+from app.lib.ui import load_base_css, badge, lazy_tabs
+from app.lib import profiler
 
+profiler.start_page("Membresias")
 st.set_page_config(page_title="Membresías", page_icon="💳", layout="wide")
 load_base_css()
 st.title("💳 Membresías")
 
 require_login()
 
-tab_planes, tab_asignar, tab_listado = st.tabs(["🗂️ Planes (CRUD)", "➕ Asignar membresía", "📋 Listado de membresías"])
+tab_planes, tab_asignar, tab_renovar, tab_congelar, tab_listado = lazy_tabs(
+    ["🗂️ Planes (CRUD)", "➕ Asignar membresía", "🔁 Renovación masiva", "❄️ Congelamientos", "📋 Listado de membresías"],
+    key="membresias_tab",
+)
 
 # --- CRUD de Planes ---
-with tab_planes:
+if tab_planes:
     st.subheader("Planes")
     with st.expander("➕ Crear plan"):
         with st.form("f_plan"):
@@ -69,7 +75,7 @@ with tab_planes:
                 st.rerun()
 
 # --- Asignación de Membresías ---
-with tab_asignar:
+if tab_asignar:
     st.subheader("Asignar miembros a un plan")
     socios = query("SELECT id, nombre FROM socio ORDER BY id DESC LIMIT 400")
     planes = query("SELECT id, nombre, precio_mensual FROM membresia_plan ORDER BY nombre")
@@ -86,8 +92,147 @@ with tab_asignar:
     else:
         st.info("Necesitas al menos 1 socio y 1 plan.")
 
+# --- Renovación masiva ---
+if tab_renovar:
+    st.subheader("Renovar membresías por lote")
+    if not (has_permission("membership_assign") and has_permission("payments_create")):
+        st.info("Necesitas permisos para asignar membresías y registrar pagos.")
+    else:
+        planes_r = query("SELECT id, nombre FROM membresia_plan ORDER BY nombre")
+        c1, c2, c3 = st.columns([2, 2, 1])
+        with c1:
+            rango = st.date_input("Vencen entre", value=(date.today(), date.today() + timedelta(days=15)))
+        with c2:
+            planes_sel = st.multiselect("Planes", planes_r, default=planes_r, format_func=lambda p: p["nombre"])
+        with c3:
+            medio = st.selectbox("Medio de pago", ["Efectivo", "Tarjeta", "Transferencia", "Yape", "Plin", "POS", "Otro"])
+        incluir_vencidas = st.checkbox("Incluir vencidas (estado 'vencida')", value=False)
+        con_pago = st.checkbox("Registrar el pago de cada renovación", value=True)
+
+        if isinstance(rango, tuple) and len(rango) == 2 and planes_sel:
+            estados = ["activa", "vencida"] if incluir_vencidas else ["activa"]
+            ids = [r["id"] for r in query("""
+                SELECT id FROM membresia m
+                WHERE (m.estado = ANY(%s) OR (m.estado = 'congelada' AND m.congelada_hasta <= CURRENT_DATE))
+                  AND fecha_fin BETWEEN %s AND %s AND plan_id = ANY(%s)
+            """, (estados, rango[0], rango[1], [p["id"] for p in planes_sel]))]
+            st.caption(f"{len(ids):,} membresías en el filtro (se renueva una por socio, la más reciente sin renovar)")
+
+            # La vista previa vale solo para la selección con la que se calculó
+            clave = (tuple(sorted(ids)), medio, con_pago)
+            if st.session_state.get("renovacion_preview", (clave,))[0] != clave:
+                st.session_state.pop("renovacion_preview", None)
+
+            b1, b2 = st.columns(2)
+            if b1.button("👀 Vista previa", disabled=not ids):
+                st.session_state["renovacion_preview"] = (clave, renovar_membresias(ids, medio, con_pago, dry_run=True))
+            if b2.button("✅ Confirmar renovación", type="primary", disabled=not ids):
+                rows, resumen = renovar_membresias(ids, medio, con_pago)
+                st.session_state.pop("renovacion_preview", None)
+                audit("renovacion_masiva", "membresia", None,
+                      {k: resumen[k] for k in ("renovadas", "pagos", "monto_total")} | {"medio": medio})
+                st.success(f"Renovadas {resumen['renovadas']:,} membresías · {resumen['pagos']:,} pagos · "
+                           f"S/ {resumen['monto_total']:,.2f}")
+                if resumen["omitidas"]:
+                    st.info(f"{resumen['omitidas']:,} omitidas (ya renovadas o más de una por socio).")
+
+            prev = st.session_state.get("renovacion_preview")
+            if prev:
+                import pandas as pd  # solo esta vista lo usa
+                rows, resumen = prev[1]
+                st.markdown(f"**Vista previa:** {resumen['renovadas']:,} renovaciones · {resumen['pagos']:,} pagos · "
+                            f"S/ {resumen['monto_total']:,.2f} · {resumen['omitidas']:,} omitidas")
+                st.dataframe(pd.DataFrame([{"plan": k, **v} for k, v in resumen["por_plan"].items()]),
+                             use_container_width=True, hide_index=True)
+                st.dataframe(pd.DataFrame(rows).drop(columns=["membresia_id", "pago_id"], errors="ignore").head(500),
+                             use_container_width=True, hide_index=True)
+        else:
+            st.info("Elige un rango de fechas y al menos un plan.")
+
+# --- Congelamientos ---
+def _resultado(r):
+    (st.success if r.get("status") == "OK" else st.error)(r.get("message"))
+
+if tab_congelar:
+    if not has_permission("membership_assign"):
+        st.info("No tienes permiso para congelar membresías.")
+    else:
+        st.subheader("Congelar una membresía")
+        activas = query("""
+            SELECT m.id, s.nombre AS socio, p.nombre AS plan, m.fecha_fin, p.max_congelamiento,
+                   COALESCE((SELECT SUM(c.dias) FROM membresia_congelamiento c WHERE c.membresia_id = m.id), 0) AS usados
+            FROM membresia m
+            JOIN socio s ON s.id = m.socio_id
+            JOIN membresia_plan p ON p.id = m.plan_id
+            -- un congelamiento fijo ya cumplido se puede volver a congelar (sp_reactivar_congeladas)
+            WHERE (m.estado = 'activa' OR (m.estado = 'congelada' AND m.congelada_hasta <= CURRENT_DATE)) AND m.fecha_fin >= CURRENT_DATE
+            ORDER BY m.id DESC LIMIT 300
+        """)
+        if activas:
+            mem = st.selectbox("Membresía", activas, format_func=lambda m: (
+                f"{m['id']} - {m['socio']} · {m['plan']} · vence {m['fecha_fin']} · "
+                f"quedan {m['max_congelamiento'] - m['usados']} días"))
+            c1, c2, c3 = st.columns([1, 1, 2])
+            with c1:
+                desde = st.date_input("Desde", value=date.today(), key="cong_desde")
+            with c2:
+                dias = st.number_input("Días (0 = sin fecha de fin)", min_value=0, value=0, step=1)
+            with c3:
+                motivo = st.text_input("Motivo", key="cong_motivo")
+            if st.button("❄️ Congelar"):
+                r = congelar_membresia(mem["id"], desde, int(dias) or None, motivo or None)[0]
+                _resultado(r)
+                if r.get("status") == "OK":
+                    audit("congelar_membresia", "membresia", mem["id"], {"desde": str(desde), "dias": int(dias) or None})
+
+        st.subheader("Congeladas")
+        congeladas = query("""
+            SELECT m.id, s.nombre AS socio, c.desde, c.hasta, c.motivo, se.nombre AS sede_cierre, m.fecha_fin
+            FROM membresia_congelamiento c
+            JOIN membresia m ON m.id = c.membresia_id
+            JOIN socio s ON s.id = m.socio_id
+            LEFT JOIN sede se ON se.id = c.sede_id
+            WHERE NOT c.cerrado AND (c.hasta IS NULL OR c.hasta > CURRENT_DATE)
+            ORDER BY c.desde DESC LIMIT 300
+        """)
+        if congeladas:
+            st.dataframe(congeladas, use_container_width=True, hide_index=True)
+            sel = st.selectbox("Descongelar", congeladas, format_func=lambda m: f"{m['id']} - {m['socio']} (desde {m['desde']})")
+            if st.button("🔥 Descongelar hoy"):
+                r = descongelar_membresia(sel["id"])[0]
+                _resultado(r)
+                if r.get("status") == "OK":
+                    audit("descongelar_membresia", "membresia", sel["id"], {"dias": r.get("dias")})
+        else:
+            st.caption("No hay membresías congeladas.")
+
+        st.subheader("Cierre de sede")
+        st.caption("Congela de una vez las membresías activas de los socios cuyo último acceso (60 días) fue en la sede.")
+        sedes = sedes_visibles()
+        if sedes:
+            c1, c2, c3 = st.columns([2, 1, 1])
+            with c1:
+                sede = st.selectbox("Sede", sedes, format_func=lambda x: x["nombre"])
+            with c2:
+                desde_s = st.date_input("Cierre desde", value=date.today(), key="sede_desde")
+            with c3:
+                dias_s = st.number_input("Días de cierre (0 = hasta reabrir)", min_value=0, value=0, step=1)
+            motivo_s = st.text_input("Motivo del cierre", value="Cierre de sede")
+            b1, b2 = st.columns(2)
+            if b1.button("❄️ Congelar sede", type="primary"):
+                r = congelar_sede(sede["id"], desde_s, int(dias_s) or None, motivo_s or None)[0]
+                _resultado(r)
+                if r.get("status") == "OK":
+                    audit("congelar_sede", "sede", sede["id"], {"desde": str(desde_s), "dias": int(dias_s) or None,
+                                                                "motivo": motivo_s or None, "congeladas": r.get("congeladas")})
+            if b2.button("🔥 Reabrir sede (descongelar)"):
+                r = descongelar_sede(sede["id"])[0]
+                _resultado(r)
+                if r.get("status") == "OK":
+                    audit("descongelar_sede", "sede", sede["id"], {"descongeladas": r.get("descongeladas")})
+
 # --- Listado y gestión rápida ---
-with tab_listado:
+if tab_listado:
     st.subheader("Membresías activas")
     mem = query("""
       SELECT m.id, s.nombre AS socio, p.nombre AS plan, m.fecha_inicio, m.fecha_fin, m.estado
@@ -97,3 +242,5 @@ with tab_listado:
       ORDER BY m.id DESC LIMIT 300
     """)
     st.dataframe(mem, use_container_width=True)
+
+profiler.render_panel()
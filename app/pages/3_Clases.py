@@ -1,21 +1,23 @@
 import streamlit as st
 from datetime import datetime, time as dtime
-from app.lib.auth import require_login
-from app.lib.db import query, execute
+from app.lib.auth import require_login, sede_filter, sedes_visibles
+from app.lib.db import query, execute, fetch_parallel
 from app.lib.sp_wrappers import publicar_clase, reservar_clase, checkin_clase
-from app.lib.ui import load_base_css, badge
+from app.lib.ui import load_base_css, badge, lazy_tabs
+from app.lib import profiler
 
+profiler.start_page("Clases")
 st.set_page_config(page_title="Clases", page_icon="📆", layout="wide")
 load_base_css()
 st.title("📆 Clases y Reservas")
 
 require_login()
 
-tab_publicar, tab_listar, tab_reservas = st.tabs(["➕ Publicar", "🗂️ Listar / Editar", "📝 Reservas / Check-in"])
+tab_publicar, tab_listar, tab_reservas = lazy_tabs(["➕ Publicar", "🗂️ Listar / Editar", "📝 Reservas / Check-in"], key="clases_tab")
 
-with tab_publicar:
+if tab_publicar:
     st.subheader("Crear nueva clase")
-    sedes = query("SELECT id, nombre FROM sede ORDER BY id")
+    sedes = sedes_visibles()
     if not sedes:
         st.warning("Crea sedes primero (seed).")
     else:
@@ -29,19 +31,20 @@ with tab_publicar:
             r = publicar_clase(sede["id"], nombre, dt, cap)[0]
             st.success(f"{r.get('message')} (ID {r.get('clase_id')})" if r.get("status")=="OK" else r.get("message"))
 
-with tab_listar:
+if tab_listar:
     st.subheader("Clases próximas")
     q = st.text_input("Buscar por nombre de clase")
-    params = ()
-    sql = """
+    pred, params = sede_filter("c")
+    sql = f"""
       SELECT c.id, c.nombre, s.nombre AS sede, c.fecha_hora, c.capacidad, c.estado
       FROM clase c JOIN sede s ON s.id=c.sede_id
+      WHERE TRUE{pred}
     """
     if q.strip():
-        sql += "WHERE c.nombre ILIKE %s "
-        params = (f"%{q}%",)
+        sql += "AND c.nombre ILIKE %s "
+        params.append(f"%{q}%")
     sql += "ORDER BY c.fecha_hora DESC LIMIT 300"
-    cl = query(sql, params)
+    cl = query(sql, tuple(params))
     st.dataframe(cl, use_container_width=True)
 
     if cl:
@@ -59,18 +62,36 @@ with tab_listar:
                 upd = c4.form_submit_button("💾 Guardar")
                 delb = c5.form_submit_button("🗑️ Eliminar", type="primary")
             if upd:
-                execute("UPDATE clase SET nombre=%s, capacidad=%s, estado=%s WHERE id=%s", (nombre, cap, estado, sel["id"]))
+                pred, p = sede_filter()
+                execute("UPDATE clase SET nombre=%s, capacidad=%s, estado=%s WHERE id=%s" + pred, (nombre, cap, estado, sel["id"], *p))
                 st.success("Clase actualizada")
                 st.rerun()
             if delb:
-                execute("DELETE FROM clase WHERE id=%s", (sel["id"],))
+                pred, p = sede_filter()
+                execute("DELETE FROM clase WHERE id=%s" + pred, (sel["id"], *p))
                 st.success("Clase eliminada")
                 st.rerun()
 
-with tab_reservas:
+if tab_reservas:
     st.subheader("Reservar / Check-in")
-    clases = query("SELECT id, nombre, fecha_hora FROM clase WHERE estado='programada' ORDER BY fecha_hora DESC LIMIT 200")
-    socios = query("SELECT id, nombre FROM socio ORDER BY id DESC LIMIT 300")
+    pred, p = sede_filter("c")
+    sql_pendientes = (f"""
+      SELECT r.id, r.clase_id, r.socio_id, r.estado, c.nombre as clase
+      FROM reserva r JOIN clase c ON c.id=r.clase_id
+      WHERE r.estado='confirmada'{pred}
+      ORDER BY r.id DESC LIMIT 200
+    """, tuple(p))
+    # Las tres listas son independientes: se consultan a la vez
+    datos = fetch_parallel({
+        "clases": (f"SELECT c.id, c.nombre, c.fecha_hora FROM clase c WHERE c.estado='programada'{pred} "
+                   "ORDER BY c.fecha_hora DESC LIMIT 200", tuple(p)),
+        "socios": "SELECT id, nombre FROM socio ORDER BY id DESC LIMIT 300",
+        "pendientes": sql_pendientes,
+    })
+    for nombre, error in datos.errores.items():
+        st.error(f"No se pudo cargar {nombre}: {error}")
+    clases = datos.get("clases", [])
+    socios = datos.get("socios", [])
     if clases and socios:
         c1, c2 = st.columns(2)
         with c1:
@@ -80,21 +101,20 @@ with tab_reservas:
         if st.button("Reservar clase"):
             r = reservar_clase(sc["id"], cl["id"])[0]
             st.success(f"Reserva ID {r.get('reserva_id')}" if r.get("status")=="OK" else r.get("message"))
-    else:
+            if r.get("status") == "OK":
+                datos["pendientes"] = query(*sql_pendientes)   # incluir la reserva recién creada
+    elif "clases" not in datos.errores and "socios" not in datos.errores:
         st.info("Se necesitan clases programadas y socios.")
 
     st.divider()
     st.subheader("Pendientes de asistencia")
-    resv = query("""
-      SELECT r.id, r.clase_id, r.socio_id, r.estado, c.nombre as clase
-      FROM reserva r JOIN clase c ON c.id=r.clase_id
-      WHERE r.estado='confirmada'
-      ORDER BY r.id DESC LIMIT 200
-    """)
+    resv = datos.get("pendientes", [])
     if resv:
         sel = st.selectbox("Reserva", resv, format_func=lambda x: f"Res {x['id']} ({x['clase']}, socio {x['socio_id']})")
         if st.button("Marcar asistencia"):
             r = checkin_clase(sel["id"])[0]
             st.success("Asistencia registrada" if r.get("status")=="OK" else r.get("message"))
-    else:
+    elif "pendientes" not in datos.errores:
         st.info("No hay reservas confirmadas recientes.")
+
+profiler.render_panel()
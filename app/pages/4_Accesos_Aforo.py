@@ -1,26 +1,40 @@
 import streamlit as st
-from app.lib.auth import require_login
+from datetime import datetime
+from app.lib.auth import require_login, sedes_visibles
 from app.lib.db import query
-from app.lib.sp_wrappers import registrar_acceso, registrar_salida, aforo_actual
-from app.lib.ui import load_base_css
+from app.lib.sp_wrappers import registrar_acceso, registrar_salida, aforo_actual, socios_recientes
+from app.lib.ui import load_base_css, fragment
+from app.lib import profiler, realtime
 
+profiler.start_page("Accesos_Aforo")
 st.set_page_config(page_title="Accesos y Aforo", page_icon="🚪", layout="wide")
 load_base_css()
 st.title("🚪 Accesos y Aforo")
 
 require_login()
 
-sedes = query("SELECT id, nombre FROM sede ORDER BY id")
+sedes = sedes_visibles()  # un usuario limitado a una sede solo ve la suya
 if not sedes:
     st.warning("Crea sedes (seed).")
     st.stop()
 
 sede = st.selectbox("Sede", sedes, format_func=lambda x: f"{x['id']} - {x['nombre']}")
 
+@fragment(run_every=realtime.REFRESH_S if realtime.ENABLED else None)
+def panel_aforo(sede_id):
+    # Lee el mapa en memoria del hilo LISTEN: sin consultas por espectador
+    vivo = realtime.aforo_por_sede()
+    if vivo is not None and sede_id in vivo:
+        st.metric("Personas dentro", vivo[sede_id]["aforo"])
+        hora = f"{datetime.fromtimestamp(realtime.aforo_actualizado()):%H:%M:%S}"
+        st.caption(f"🟢 En vivo · {hora}" if realtime.running() else f"🟡 Sin conexión en vivo · dato de las {hora}")
+    else:
+        st.metric("Personas dentro", aforo_actual(sede_id))
+
 c1, c2 = st.columns(2)
 with c1:
     st.subheader("Aforo actual")
-    st.metric("Personas dentro", aforo_actual(sede["id"]))
+    panel_aforo(sede["id"])
 with c2:
     st.subheader("Accesos abiertos")
     abiertos = query(
@@ -31,7 +45,7 @@ with c2:
 
 st.divider()
 st.subheader("➕ Registrar acceso de socio")
-socios = query("SELECT id, nombre FROM socio ORDER BY id DESC LIMIT 300")
+socios = socios_recientes(300)
 if socios:
     sc = st.selectbox("Socio", socios, format_func=lambda x: f"{x['id']} - {x['nombre']}")
     if st.button("Entrada"):
@@ -46,3 +60,5 @@ if abiertos:
     if st.button("Salida"):
         r = registrar_salida(sel["id"])[0]
         st.success("Salida registrada" if r.get("status")=="OK" else r.get("message"))
+
+profiler.render_panel()
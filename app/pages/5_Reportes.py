@@ -1,17 +1,64 @@
-import streamlit as st, pandas as pd, plotly.express as px
-from app.lib.auth import require_login
-from app.lib.db import query
+import os
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+import streamlit as st
+from app.lib.auth import require_login, has_permission, sede_filter, sede_scope, sedes_visibles
+from app.lib.db import query, query_df
+from app.lib.sp_wrappers import rollup_ocupacion
 from app.lib.ui import load_base_css
+from app.lib import profiler
 
+profiler.start_page("Reportes")
 st.set_page_config(page_title="Reportes", page_icon="📊", layout="wide")
 load_base_css()
 st.title("📊 Reportes")
 
 require_login()
 
+# Después del login: analitica carga pandas, pyarrow y (si está) duckdb
+with profiler.section("imports", "imports"):
+    import pandas as pd
+    import plotly.express as px
+    from app.lib import analitica
+
+# Con snapshots de analítica (Parquet + DuckDB/pandas) los reportes de ingresos,
+# productos y visitas no consultan la BD; sin ellos, ingresos diarios va a la réplica
+usar_analitica = analitica.disponible()
+
+def reporte(fn, *args):
+    """Reporte de analítica, o None si falla (snapshot dañado o a medias): el resto de la página sigue."""
+    try:
+        return fn(*args)
+    except Exception as e:
+        st.error(f"No se pudo calcular el reporte ({fn.__name__}): {e}")
+        return None
+
+sede_rep = sede_scope()
+c1, c2 = st.columns([3, 1])
+with c1:
+    if usar_analitica:
+        st.caption(f"Analítica sobre snapshot del {analitica.actualizado().astimezone(ZoneInfo(analitica.APP_TZ)):%d/%m/%Y %H:%M} "
+                   f"· motor {analitica.motor()} · lo posterior aparece en el próximo snapshot")
+    elif analitica.ENABLED:
+        st.caption("Sin snapshot de analítica: genera uno para ver ingresos por mes, mix de productos y frecuencia de visitas "
+                   "(`python -m tools.snapshot_analitica`).")
+with c2:
+    if analitica.ENABLED and has_permission("reports_view") and st.button("🔄 Actualizar snapshot"):
+        try:
+            with st.spinner("Copiando a Parquet..."):
+                copiadas = analitica.snapshot()
+            st.toast(f"Snapshot actualizado ({sum(copiadas.values())} filas leídas)")
+            usar_analitica = True
+        except Exception as e:
+            st.error(f"No se pudo actualizar el snapshot: {e}")
+
 st.subheader("Ingresos por día (últimos 60)")
-rows = query("SELECT date(fecha) as dia, sum(monto) as ingresos FROM pago GROUP BY 1 ORDER BY 1 DESC LIMIT 60")
-df = pd.DataFrame(rows)
+df = reporte(analitica.ingresos_por_dia, 60, sede_rep) if usar_analitica else None
+if df is None:
+    # Reportes: lecturas pesadas que toleran retraso -> réplica (si está configurada) y timeout "report"
+    pred, ps = sede_filter(glue=" WHERE ")
+    df = query_df(f"SELECT date(fecha) as dia, sum(monto) as ingresos FROM pago{pred} GROUP BY 1 ORDER BY 1 DESC LIMIT 60",
+                  tuple(ps), replica=True, timeout="report")
 if not df.empty:
     fig = px.line(df.sort_values("dia"), x="dia", y="ingresos", markers=True, title="Ingresos diarios")
     st.plotly_chart(fig, use_container_width=True)
@@ -19,8 +66,117 @@ if not df.empty:
 else:
     st.info("No hay pagos registrados.")
 
+if usar_analitica:
+    nombres_sede = {s["id"]: s["nombre"] for s in sedes_visibles()}
+
+    st.subheader("Ingresos por mes")
+    c1, c2 = st.columns(2)
+    with c1:
+        desglose = st.radio("Desglose", ["Medio", "Sede"], horizontal=True)
+    with c2:
+        meses = st.selectbox("Meses", [6, 12, 24], index=1)
+    mensual = reporte(analitica.ingresos_por_mes, meses, sede_rep)
+    if mensual is not None and mensual.empty:
+        st.info("Sin pagos en el período.")
+    elif mensual is not None:
+        if desglose == "Sede":
+            mensual["grupo"] = mensual["sede_id"].map(lambda i: "Sin sede" if pd.isna(i) else nombres_sede.get(int(i), f"Sede {int(i)}"))
+        else:
+            mensual["grupo"] = mensual["medio"]
+        tabla = mensual.groupby(["mes", "grupo"], as_index=False)["ingresos"].sum()
+        fig = px.bar(tabla, x="mes", y="ingresos", color="grupo", labels={"grupo": desglose, "mes": "Mes"})
+        fig.update_layout(margin=dict(l=10, r=10, t=10, b=10), height=360)
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(tabla.pivot(index="mes", columns="grupo", values="ingresos").fillna(0).sort_index(ascending=False),
+                     use_container_width=True)
+
+    c1, c2 = st.columns(2)
+    with c1:
+        st.subheader("Mix de productos")
+        dias_mix = st.selectbox("Período", [7, 30, 90, 365], index=1, format_func=lambda d: f"Últimos {d} días", key="mix_dias")
+        mix = reporte(analitica.mix_productos, dias_mix, sede_rep)
+        if mix is not None and mix.empty:
+            st.info("Sin ventas en el período.")
+        elif mix is not None:
+            fig = px.bar(mix.head(15).iloc[::-1], x="ingresos", y="producto", orientation="h", text="pct")
+            fig.update_layout(margin=dict(l=10, r=10, t=10, b=10), height=420)
+            st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(mix, use_container_width=True, hide_index=True)
+    with c2:
+        st.subheader("Frecuencia de visitas")
+        dias_vis = st.selectbox("Período", [7, 30, 90], index=1, format_func=lambda d: f"Últimos {d} días", key="vis_dias")
+        freq = reporte(analitica.frecuencia_visitas, dias_vis, sede_rep)
+        if freq is not None and not freq["socios"].sum():
+            st.info("Sin accesos en el período.")
+        elif freq is not None:
+            fig = px.bar(freq, x="visitas", y="socios", text="pct", labels={"visitas": "Visitas por socio"})
+            fig.update_layout(margin=dict(l=10, r=10, t=10, b=10), height=420)
+            st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(freq, use_container_width=True, hide_index=True)
+
+    if sede_rep is None:   # las membresías no tienen sede
+        st.subheader("Membresías activas por plan")
+        planes = reporte(analitica.membresias_por_plan)
+        if planes is not None:
+            st.dataframe(planes, use_container_width=True, hide_index=True)
+
+st.subheader("Ocupación por día y hora")
+# Lee solo el rollup ocupacion_hora (ver sp_rollup_ocupacion / tools/rollup_ocupacion.py)
+APP_TZ = os.getenv("APP_TZ", "America/Lima")
+DIAS = ["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"]
+estado = query("SELECT hasta FROM rollup_estado WHERE nombre = 'ocupacion_hora'")
+c1, c2, c3, c4 = st.columns([2, 1, 1, 1])
+with c1:
+    sedes = sedes_visibles()
+    opciones = sedes if len(sedes) == 1 else [None] + sedes   # limitado a una sede: sin "Todas"
+    sede_sel = st.selectbox("Sede", opciones, format_func=lambda s: "Todas" if s is None else s["nombre"])
+with c2:
+    semanas = st.selectbox("Últimas semanas", [4, 8, 12, 26, 52], index=1)
+with c3:
+    medida = st.selectbox("Medida", ["Ocupación media", "Pico", "Entradas"])
+with c4:
+    st.write("")
+    if has_permission("reports_view") and st.button("🔄 Actualizar rollup"):
+        r = rollup_ocupacion()[0]
+        st.toast(f"{r['message']} ({r['horas']} filas)")
+        estado = query("SELECT hasta FROM rollup_estado WHERE nombre = 'ocupacion_hora'")
+
+if not estado:
+    st.info("El rollup de ocupación aún no se ha generado (python -m tools.rollup_ocupacion).")
+else:
+    hasta = estado[0]["hasta"]
+    desde = hasta - timedelta(weeks=semanas)
+    col = {"Ocupación media": "ocupacion_media", "Pico": "ocupacion_max", "Entradas": "entradas"}[medida]
+    sql = f"""
+        SELECT (hora AT TIME ZONE %s)::date AS dia,
+               EXTRACT(HOUR FROM hora AT TIME ZONE %s)::int AS h,
+               SUM({col})::float AS valor
+        FROM ocupacion_hora
+        WHERE hora >= %s AND hora < %s
+    """
+    params = [APP_TZ, APP_TZ, desde, hasta]
+    if sede_sel:
+        sql += " AND sede_id = %s"
+        params.append(sede_sel["id"])
+    occ = query_df(sql + " GROUP BY 1, 2", tuple(params), replica=True, timeout="report")
+    if occ.empty:
+        st.info("Sin datos de ocupación en el período.")
+    else:
+        # Horas sin fila = 0 personas: se promedia sobre todos los días del período
+        dias = pd.Series(pd.date_range(occ["dia"].min(), occ["dia"].max(), freq="D").dayofweek).value_counts()
+        occ["dow"] = pd.to_datetime(occ["dia"]).dt.dayofweek
+        mapa = occ.groupby(["dow", "h"])["valor"].sum().unstack(fill_value=0.0)
+        mapa = mapa.reindex(index=range(7), columns=range(24), fill_value=0.0).div(dias.reindex(range(7)).fillna(1), axis=0)
+        fig = px.imshow(mapa.round(1), x=[f"{h:02d}h" for h in range(24)], y=DIAS, aspect="auto",
+                        color_continuous_scale="YlOrRd", labels=dict(color=medida), text_auto=".0f")
+        fig.update_layout(margin=dict(l=10, r=10, t=10, b=10), height=360)
+        st.plotly_chart(fig, use_container_width=True)
+        st.caption(f"Promedio por día · {medida.lower()} · rollup hasta {hasta.astimezone(ZoneInfo(APP_TZ)):%d/%m/%Y %H:%M} · zona {APP_TZ}")
+
 st.subheader("Exportar socios")
-socios = query("SELECT id, dni, nombre, email, telefono, estado, fecha_alta FROM socio ORDER BY id DESC")
-df2 = pd.DataFrame(socios)
+df2 = query_df("SELECT id, dni, nombre, email, telefono, estado, fecha_alta FROM socio ORDER BY id DESC",
+               replica=True, timeout="report")
 st.download_button("Descargar CSV", data=df2.to_csv(index=False), file_name="socios.csv", mime="text/csv")
 st.dataframe(df2.head(200), use_container_width=True)
+
+profiler.render_panel()
@@ -1,23 +1,22 @@
-import streamlit as st, hashlib
-from app.lib.auth import require_role
+import streamlit as st
+from app.lib.auth import require_role, hash_password
 from app.lib.db import query, execute
-from app.lib.ui import load_base_css
+from app.lib.ui import load_base_css, lazy_tabs
+from app.lib import estado, profiler
 
+profiler.start_page("Usuarios")
 st.set_page_config(page_title="Usuarios", page_icon="👥", layout="wide")
 load_base_css()
 st.title("👥 Administración de Usuarios")
 require_role("admin")
 
-def sha256(s: str) -> str:
-    return hashlib.sha256(s.encode("utf-8")).hexdigest()
-
 roles = ["admin", "recepcion", "entrenador", "finanzas"]
 sedes = query("SELECT id, nombre FROM sede ORDER BY id")
 sede_opts = {s["nombre"]: s["id"] for s in sedes} if sedes else {}
 
-tab_crear, tab_listar = st.tabs(["➕ Crear", "📋 Listar / Editar / Eliminar"])
+tab_crear, tab_listar = lazy_tabs(["➕ Crear", "📋 Listar / Editar / Eliminar"], key="usuarios_tab")
 
-with tab_crear:
+if tab_crear:
     with st.form("f_user_new"):
         c1, c2 = st.columns(2)
         with c1:
@@ -34,13 +33,13 @@ with tab_crear:
             try:
                 execute(
                     "INSERT INTO app_user(email, password_hash, rol, sede_id) VALUES (%s,%s,%s,%s)",
-                    (email, sha256(password), rol, sede_opts.get(sede_nombre))
+                    (email, hash_password(password), rol, sede_opts.get(sede_nombre))
                 )
                 st.success("Usuario creado")
             except Exception as e:
                 st.error(f"No se pudo crear: {e}")
 
-with tab_listar:
+if tab_listar:
     users = query("""
         SELECT u.id, u.email, u.rol, u.sede_id, s.nombre AS sede, u.created_at
         FROM app_user u LEFT JOIN sede s ON s.id=u.sede_id
@@ -68,8 +67,9 @@ with tab_listar:
             delb = c5.form_submit_button("🗑️ Eliminar", type="primary")
         if upd:
             if nueva_pw:
-                execute("UPDATE app_user SET password_hash=%s WHERE id=%s", (sha256(nueva_pw), sel["id"]))
+                execute("UPDATE app_user SET password_hash=%s WHERE id=%s", (hash_password(nueva_pw), sel["id"]))
             execute("UPDATE app_user SET rol=%s, sede_id=%s WHERE id=%s", (rol_new, sede_opts.get(sede_new), sel["id"]))
+            estado.invalidar("permisos", sel["id"])   # sus sesiones abiertas recargan rol y sede
             st.success("Actualizado")
             st.rerun()
         if delb:
@@ -78,5 +78,8 @@ with tab_listar:
                 st.error("No puedes eliminar tu propio usuario.")
             else:
                 execute("DELETE FROM app_user WHERE id=%s", (sel["id"],))
+                estado.invalidar("permisos", sel["id"])
                 st.success("Eliminado")
                 st.rerun()
+
+profiler.render_panel()
@@ -1,35 +1,33 @@
 import streamlit as st
 from app.lib.auth import require_perm, has_permission
-from app.lib.db import query, execute
-from app.lib.ui import load_base_css
+from app.lib.db import db_cursor
+from app.lib.ui import load_base_css, lazy_tabs
+from app.lib import profiler, catalogo
 
+profiler.start_page("Productos")
 st.set_page_config(page_title="Productos", page_icon="🛒", layout="wide")
 load_base_css()
 st.title("🛒 Productos")
 
 require_perm("products_manage")
 
-tab_listar, tab_crear, tab_editar = st.tabs(["📋 Listar/Buscar", "➕ Crear", "✏️ Editar/Eliminar"])
+tab_listar, tab_crear, tab_editar = lazy_tabs(["📋 Listar/Buscar", "➕ Crear", "✏️ Editar/Eliminar"], key="productos_tab")
 
-with tab_listar:
+if tab_listar:
     c1, c2 = st.columns([2,1])
     with c1:
         q = st.text_input("🔎 Buscar por nombre", "")
     with c2:
         limit = st.selectbox("Límite", [50, 100, 200, 500], index=1)
 
-    params = ()
-    sql = "SELECT id, nombre, precio, stock, activo FROM producto "
+    # Catálogo en memoria: prefijo primero y luego "contiene"; sin filtro, los más nuevos
     if q.strip():
-        sql += "WHERE nombre ILIKE %s "
-        params = (f"%{q}%",)
-    sql += "ORDER BY id DESC LIMIT %s"
-    params = params + (limit,)
-
-    rows = query(sql, params)
+        rows = catalogo.buscar(q, limit)
+    else:
+        rows = sorted(catalogo.todos(), key=lambda p: p["id"], reverse=True)[:limit]
     st.dataframe(rows, use_container_width=True)
 
-with tab_crear:
+if tab_crear:
     st.subheader("Crear producto")
     with st.form("f_prod_new"):
         c1, c2, c3 = st.columns(3)
@@ -46,20 +44,24 @@ with tab_crear:
             st.error("Nombre es obligatorio")
         else:
             try:
-                execute("INSERT INTO producto(nombre, precio, stock, activo) VALUES (%s,%s,%s,%s)",
-                        (nombre.strip(), precio, stock, activo))
+                with db_cursor(commit=True) as cur:
+                    cur.execute("INSERT INTO producto(nombre, precio, stock, activo) VALUES (%s,%s,%s,%s) "
+                                "RETURNING id, nombre, precio, stock, activo",
+                                (nombre.strip(), precio, stock, activo))
+                    nuevo = cur.fetchone()
+                catalogo.actualizar(nuevo)
                 st.success("Producto creado")
             except Exception as e:
                 st.error(f"No se pudo crear: {e}")
 
-with tab_editar:
+if tab_editar:
     st.subheader("Editar/Eliminar")
-    prods = query("SELECT id, nombre FROM producto ORDER BY id DESC LIMIT 300")
+    prods = sorted(catalogo.todos(), key=lambda p: p["id"], reverse=True)[:300]
     if not prods:
         st.info("No hay productos.")
     else:
         sel = st.selectbox("Producto", prods, format_func=lambda p: f"{p['id']} - {p['nombre']}")
-        p = query("SELECT id, nombre, precio, stock, activo FROM producto WHERE id=%s", (sel["id"],))[0]
+        p = catalogo.get(sel["id"]) or sel
         with st.form("f_prod_edit"):
             c1, c2, c3 = st.columns(3)
             with c1:
@@ -73,11 +75,22 @@ with tab_editar:
             upd = c4.form_submit_button("💾 Guardar")
             delb = c5.form_submit_button("🗑️ Eliminar", type="primary")
         if upd:
-            execute("UPDATE producto SET nombre=%s, precio=%s, stock=%s, activo=%s WHERE id=%s",
-                    (nombre.strip(), precio, stock, activo, p["id"]))
+            # El stock del formulario sale del catálogo en memoria (puede estar atrasado):
+            # se aplica solo lo que cambió el usuario, sin pisar las ventas de mientras
+            with db_cursor(commit=True) as cur:
+                cur.execute("UPDATE producto SET nombre=%s, precio=%s, stock=stock + %s, activo=%s WHERE id=%s "
+                            "RETURNING id, nombre, precio, stock, activo",
+                            (nombre.strip(), precio, int(stock) - int(p["stock"]), activo, p["id"]))
+                fila = cur.fetchone()
+            if fila:
+                catalogo.actualizar(fila)
             st.success("Producto actualizado")
             st.rerun()
         if delb:
-            execute("DELETE FROM producto WHERE id=%s", (p["id"],))
+            with db_cursor(commit=True) as cur:
+                cur.execute("DELETE FROM producto WHERE id=%s", (p["id"],))
+            catalogo.quitar(p["id"])
             st.success("Producto eliminado")
             st.rerun()
+
+profiler.render_panel()
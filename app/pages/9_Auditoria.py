@@ -1,9 +1,11 @@
 import streamlit as st
 from datetime import date, timedelta
 from app.lib.auth import require_perm
-from app.lib.db import query
+from app.lib.db import query_arrow
 from app.lib.ui import load_base_css
+from app.lib import profiler
 
+profiler.start_page("Auditoria")
 st.set_page_config(page_title="Auditoría", page_icon="📑", layout="wide")
 load_base_css()
 st.title("📑 Auditoría")
@@ -20,14 +22,19 @@ with c3:
 with c4:
     tabla = st.text_input("Tabla (contiene)")
 
-limit = st.selectbox("Límite", [50, 100, 200, 500], index=1)
+c5, c6 = st.columns([3, 1])
+with c5:
+    jpath = st.text_input("Filtro JSONPath sobre detalle", placeholder='$ ? (@.medio == "Efectivo" && @.monto > 100)')
+with c6:
+    limit = st.selectbox("Límite", [50, 100, 200, 500], index=1)
 
+# Rango semiabierto sobre fecha (sin castear la columna) para aprovechar el índice BRIN
 sql = """
-SELECT id, fecha, actor, accion, tabla, detalle
+SELECT id, fecha, actor, accion, tabla, detalle::text AS detalle
 FROM auditoria_v
-WHERE fecha::date BETWEEN %s AND %s
+WHERE fecha >= %s AND fecha < %s
 """
-params = [desde, hasta]
+params = [desde, hasta + timedelta(days=1)]
 
 if actor.strip():
     sql += " AND actor ILIKE %s"
@@ -35,9 +42,20 @@ if actor.strip():
 if tabla.strip():
     sql += " AND tabla ILIKE %s"
     params.append(f"%{tabla}%")
+if jpath.strip():
+    # @? usa el índice GIN jsonb_path_ops de auditoria.detalle
+    sql += " AND detalle @? %s::jsonpath"
+    params.append(jpath.strip())
 
 sql += " ORDER BY fecha DESC, id DESC LIMIT %s"
 params.append(limit)
 
-rows = query(sql, tuple(params))
+# Tabla Arrow directa a st.dataframe: sin pasar por dicts ni pandas
+try:
+    rows = query_arrow(sql, tuple(params), replica=True, timeout="report")
+except Exception as e:
+    st.error(f"Error consultando auditoría (¿JSONPath válido?): {e}")
+    rows = []
 st.dataframe(rows, use_container_width=True)
+
+profiler.render_panel()
@@ -34,6 +34,217 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Un congelamiento de período fijo termina solo: llegado congelada_hasta la membresía
+-- vuelve a 'activa' (fecha_fin ya se extendió al congelar) y el período queda cerrado.
+-- La llaman los SP que escriben membresías (solo sobre sus ids) y, para el resto,
+-- tools/congelamientos.py desde cron. Las lecturas aplican la misma regla por fechas.
+CREATE OR REPLACE FUNCTION sp_reactivar_congeladas(p_membresia_ids BIGINT[] DEFAULT NULL)
+RETURNS TABLE(status TEXT, code INT, message TEXT, reactivadas INT) AS $$
+DECLARE v_n INT;
+BEGIN
+  WITH upd AS (
+    UPDATE membresia m
+       SET estado = 'activa', congelada_desde = NULL, congelada_hasta = NULL
+     WHERE m.estado = 'congelada' AND m.congelada_hasta <= CURRENT_DATE
+       AND (p_membresia_ids IS NULL OR m.id = ANY(p_membresia_ids))
+    RETURNING m.id
+  ), cierre AS (
+    UPDATE membresia_congelamiento c SET cerrado = TRUE
+      FROM upd WHERE c.membresia_id = upd.id AND NOT c.cerrado
+    RETURNING 1
+  )
+  SELECT COUNT(*) INTO v_n FROM upd;
+  status := 'OK'; code := 0; message := format('%s membresías reactivadas', v_n); reactivadas := v_n; RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Renovación masiva: por cada membresía origen (una por socio, la de fecha_fin más
+-- reciente y aún no renovada) crea la membresía siguiente y, si p_con_pago, su pago.
+-- Todo en una sentencia set-based; la vista previa es la misma llamada + ROLLBACK.
+-- Antes se bloquea la fila socio de cada renovado (en orden de id, sin deadlocks): dos
+-- renovaciones concurrentes del mismo socio se serializan y la segunda ve en el NOT EXISTS
+-- la membresía ya creada. (DISTINCT ON no admite FOR UPDATE y bloquear solo el origen no
+-- alcanza si se piden dos membresías distintas del mismo socio.)
+CREATE OR REPLACE FUNCTION sp_renovar_membresias(p_membresia_ids BIGINT[], p_medio TEXT DEFAULT 'Efectivo',
+                                                 p_con_pago BOOLEAN DEFAULT TRUE)
+RETURNS TABLE(origen_id BIGINT, socio_id BIGINT, plan TEXT, fecha_inicio DATE, fecha_fin DATE,
+              monto NUMERIC, membresia_id BIGINT, pago_id BIGINT) AS $$
+#variable_conflict use_column
+BEGIN
+  PERFORM 1 FROM socio s
+   WHERE s.id IN (SELECT m.socio_id FROM membresia m WHERE m.id = ANY(p_membresia_ids))
+   ORDER BY s.id FOR NO KEY UPDATE;
+  PERFORM sp_reactivar_congeladas(p_membresia_ids);
+  RETURN QUERY
+  WITH src AS (
+    SELECT DISTINCT ON (m.socio_id) m.id, m.socio_id, m.plan_id, p.nombre, p.duracion_dias,
+           GREATEST(m.fecha_fin + 1, CURRENT_DATE) AS ini,
+           ROUND(p.precio_mensual * p.duracion_dias / 30.0, 2) AS monto
+    FROM membresia m
+    JOIN membresia_plan p ON p.id = m.plan_id
+    WHERE m.id = ANY(p_membresia_ids)
+      AND m.estado IN ('activa', 'vencida')
+      AND NOT EXISTS (SELECT 1 FROM membresia n
+                      WHERE n.socio_id = m.socio_id AND n.fecha_inicio > m.fecha_fin)
+    ORDER BY m.socio_id, m.fecha_fin DESC
+  ), nuevas AS (
+    INSERT INTO membresia(socio_id, plan_id, fecha_inicio, fecha_fin, estado)
+    SELECT s.socio_id, s.plan_id, s.ini, s.ini + s.duracion_dias, 'activa' FROM src s
+    RETURNING membresia.id, membresia.socio_id
+  ), pagos AS (
+    INSERT INTO pago(socio_id, concepto, monto, medio)
+    SELECT s.socio_id, 'Renovación ' || s.nombre, s.monto, p_medio FROM src s WHERE p_con_pago
+    RETURNING pago.id, pago.socio_id
+  )
+  SELECT s.id, s.socio_id, s.nombre, s.ini, s.ini + s.duracion_dias, s.monto, n.id, pg.id
+  FROM src s
+  JOIN nuevas n ON n.socio_id = s.socio_id
+  LEFT JOIN pagos pg ON pg.socio_id = s.socio_id
+  ORDER BY s.socio_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Congelar membresía. Con p_dias el período es fijo y fecha_fin se extiende ya; sin
+-- p_dias queda abierto y se extiende al descongelar. Nunca supera max_congelamiento del plan.
+CREATE OR REPLACE FUNCTION sp_congelar_membresia(p_membresia_id BIGINT, p_desde DATE DEFAULT CURRENT_DATE,
+                                                 p_dias INT DEFAULT NULL, p_motivo TEXT DEFAULT NULL)
+RETURNS TABLE(status TEXT, code INT, message TEXT, congelamiento_id BIGINT) AS $$
+DECLARE v_estado TEXT; v_fin DATE; v_max INT; v_usados INT; v_id BIGINT;
+BEGIN
+  IF p_dias IS NOT NULL AND p_dias <= 0 THEN
+    status := 'ERROR'; code := 400; message := 'Los días de congelamiento deben ser positivos'; RETURN NEXT; RETURN;
+  END IF;
+  PERFORM sp_reactivar_congeladas(ARRAY[p_membresia_id]);
+  SELECT m.estado, m.fecha_fin, p.max_congelamiento INTO v_estado, v_fin, v_max
+    FROM membresia m JOIN membresia_plan p ON p.id = m.plan_id
+    WHERE m.id = p_membresia_id FOR UPDATE OF m;
+  IF NOT FOUND THEN
+    status := 'ERROR'; code := 404; message := 'Membresía no existe'; RETURN NEXT; RETURN;
+  END IF;
+  IF v_estado <> 'activa' OR v_fin < p_desde THEN
+    status := 'ERROR'; code := 409; message := 'Solo se congelan membresías activas y vigentes'; RETURN NEXT; RETURN;
+  END IF;
+  SELECT COALESCE(SUM(dias), 0) INTO v_usados FROM membresia_congelamiento WHERE membresia_id = p_membresia_id;
+  IF v_usados >= v_max OR p_dias > v_max - v_usados THEN
+    status := 'ERROR'; code := 409;
+    message := format('Quedan %s de %s días de congelamiento', GREATEST(v_max - v_usados, 0), v_max);
+    RETURN NEXT; RETURN;
+  END IF;
+  INSERT INTO membresia_congelamiento(membresia_id, desde, hasta, dias, motivo)
+  VALUES (p_membresia_id, p_desde, p_desde + p_dias, p_dias, p_motivo)
+  RETURNING id INTO v_id;
+  UPDATE membresia
+     SET estado = 'congelada', congelada_desde = p_desde, congelada_hasta = p_desde + p_dias,
+         fecha_fin = fecha_fin + COALESCE(p_dias, 0)
+   WHERE id = p_membresia_id;
+  status := 'OK'; code := 0;
+  message := CASE WHEN p_dias IS NULL THEN 'Membresía congelada (abierta)'
+                  ELSE format('Membresía congelada %s días', p_dias) END;
+  congelamiento_id := v_id; RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Descongelar: cierra el período con los días reales (tope: lo que queda del máximo) y
+-- ajusta fecha_fin. Un período fijo descongelado antes de tiempo devuelve los días no usados.
+CREATE OR REPLACE FUNCTION sp_descongelar_membresia(p_membresia_id BIGINT, p_fecha DATE DEFAULT CURRENT_DATE)
+RETURNS TABLE(status TEXT, code INT, message TEXT, dias INT) AS $$
+#variable_conflict use_column
+DECLARE v_c membresia_congelamiento%ROWTYPE; v_max INT; v_otros INT; v_dias INT;
+BEGIN
+  SELECT * INTO v_c FROM membresia_congelamiento
+    WHERE membresia_id = p_membresia_id AND NOT cerrado FOR UPDATE;
+  IF NOT FOUND THEN
+    status := 'ERROR'; code := 404; message := 'La membresía no está congelada'; dias := 0; RETURN NEXT; RETURN;
+  END IF;
+  SELECT p.max_congelamiento INTO v_max
+    FROM membresia m JOIN membresia_plan p ON p.id = m.plan_id WHERE m.id = p_membresia_id;
+  SELECT COALESCE(SUM(c.dias), 0) INTO v_otros FROM membresia_congelamiento c
+    WHERE c.membresia_id = p_membresia_id AND c.id <> v_c.id;
+  v_dias := LEAST(GREATEST(p_fecha - v_c.desde, 0), COALESCE(v_c.dias, v_max), GREATEST(v_max - v_otros, 0));
+  UPDATE membresia_congelamiento SET hasta = v_c.desde + v_dias, dias = v_dias, cerrado = TRUE WHERE id = v_c.id;
+  UPDATE membresia
+     SET estado = 'activa', congelada_desde = NULL, congelada_hasta = NULL,
+         fecha_fin = fecha_fin - COALESCE(v_c.dias, 0) + v_dias
+   WHERE id = p_membresia_id;
+  status := 'OK'; code := 0; message := format('Descongelada: %s días de congelamiento', v_dias);
+  dias := v_dias; RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Congelamiento masivo por cierre de sede: socios cuyo último acceso (en p_dias_actividad
+-- días) fue en la sede. Un solo UPDATE + INSERT set-based; omite a quien no tenga días.
+CREATE OR REPLACE FUNCTION sp_congelar_sede(p_sede_id BIGINT, p_desde DATE, p_dias INT DEFAULT NULL,
+                                            p_motivo TEXT DEFAULT NULL, p_dias_actividad INT DEFAULT 60)
+RETURNS TABLE(status TEXT, code INT, message TEXT, congeladas INT) AS $$
+DECLARE v_n INT;
+BEGIN
+  IF p_dias IS NOT NULL AND p_dias <= 0 THEN
+    status := 'ERROR'; code := 400; message := 'Los días de congelamiento deben ser positivos'; congeladas := 0;
+    RETURN NEXT; RETURN;
+  END IF;
+  PERFORM sp_reactivar_congeladas();
+  WITH ultimo AS (
+    SELECT DISTINCT ON (a.socio_id) a.socio_id, a.sede_id
+    FROM acceso a
+    WHERE a.fecha_entrada >= CURRENT_DATE - p_dias_actividad
+    ORDER BY a.socio_id, a.fecha_entrada DESC
+  ), cand AS (
+    SELECT m.id
+    FROM membresia m
+    JOIN ultimo u ON u.socio_id = m.socio_id AND u.sede_id = p_sede_id
+    JOIN membresia_plan p ON p.id = m.plan_id
+    LEFT JOIN (SELECT membresia_id, SUM(dias) AS usados FROM membresia_congelamiento GROUP BY 1) c
+           ON c.membresia_id = m.id
+    WHERE m.estado = 'activa' AND m.fecha_fin >= p_desde
+      AND p.max_congelamiento - COALESCE(c.usados, 0) >= GREATEST(COALESCE(p_dias, 1), 1)
+  ), upd AS (
+    UPDATE membresia m
+       SET estado = 'congelada', congelada_desde = p_desde, congelada_hasta = p_desde + p_dias,
+           fecha_fin = m.fecha_fin + COALESCE(p_dias, 0)
+      FROM cand WHERE m.id = cand.id
+    RETURNING m.id
+  ), ins AS (
+    INSERT INTO membresia_congelamiento(membresia_id, desde, hasta, dias, motivo, sede_id)
+    SELECT upd.id, p_desde, p_desde + p_dias, p_dias, p_motivo, p_sede_id FROM upd
+    RETURNING 1
+  )
+  SELECT COUNT(*) INTO v_n FROM ins;
+  status := 'OK'; code := 0; message := format('%s membresías congeladas', v_n); congeladas := v_n; RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Reapertura de sede: descongela en bloque lo que congeló sp_congelar_sede
+CREATE OR REPLACE FUNCTION sp_descongelar_sede(p_sede_id BIGINT, p_fecha DATE DEFAULT CURRENT_DATE)
+RETURNS TABLE(status TEXT, code INT, message TEXT, descongeladas INT) AS $$
+DECLARE v_n INT;
+BEGIN
+  WITH abiertos AS (
+    SELECT c.id, c.membresia_id, c.desde, c.dias AS previstos,
+           LEAST(GREATEST(p_fecha - c.desde, 0), COALESCE(c.dias, p.max_congelamiento),
+                 GREATEST(p.max_congelamiento - COALESCE(o.usados, 0), 0))::int AS dias
+    FROM membresia_congelamiento c
+    JOIN membresia m ON m.id = c.membresia_id
+    JOIN membresia_plan p ON p.id = m.plan_id
+    LEFT JOIN (SELECT membresia_id, SUM(dias) AS usados FROM membresia_congelamiento
+               WHERE cerrado GROUP BY 1) o ON o.membresia_id = c.membresia_id
+    WHERE c.sede_id = p_sede_id AND NOT c.cerrado
+  ), cierre AS (
+    UPDATE membresia_congelamiento c
+       SET hasta = a.desde + a.dias, dias = a.dias, cerrado = TRUE
+      FROM abiertos a WHERE c.id = a.id
+    RETURNING c.id
+  ), upd AS (
+    UPDATE membresia m
+       SET estado = 'activa', congelada_desde = NULL, congelada_hasta = NULL,
+           fecha_fin = m.fecha_fin - COALESCE(a.previstos, 0) + a.dias
+      FROM abiertos a WHERE m.id = a.membresia_id
+    RETURNING m.id
+  )
+  SELECT COUNT(*) INTO v_n FROM upd;
+  status := 'OK'; code := 0; message := format('%s membresías descongeladas', v_n); descongeladas := v_n; RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+
 -- Registrar pago
 CREATE OR REPLACE FUNCTION sp_registrar_pago(p_socio_id BIGINT, p_concepto TEXT, p_monto NUMERIC, p_medio TEXT, p_ref TEXT)
 RETURNS TABLE(status TEXT, code INT, message TEXT, pago_id BIGINT) AS $$
@@ -89,30 +300,80 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Aviso de aforo (se entrega al hacer COMMIT; las notificaciones iguales en una
+-- misma transacción se agrupan en una sola)
+CREATE OR REPLACE FUNCTION fn_notificar_aforo(p_sede_id BIGINT)
+RETURNS VOID AS $$
+BEGIN
+  PERFORM pg_notify('aforo', json_build_object(
+    'sede_id', p_sede_id,
+    'aforo', (SELECT COUNT(*) FROM acceso WHERE sede_id = p_sede_id AND fecha_salida IS NULL)
+  )::text);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Aviso de cambios de producto para el catálogo en memoria (app/lib/catalogo.py).
+-- Si solo cambió el stock (ventas/anulaciones) se envía {"op","id","stock"};
+-- en altas/ediciones la fila completa y en bajas {"op","id"}.
+CREATE OR REPLACE FUNCTION fn_notificar_producto()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    PERFORM pg_notify('producto', json_build_object('op', TG_OP, 'id', OLD.id)::text);
+    RETURN OLD;
+  END IF;
+  IF TG_OP = 'UPDATE' AND (NEW.nombre, NEW.precio, NEW.activo) IS NOT DISTINCT FROM (OLD.nombre, OLD.precio, OLD.activo) THEN
+    PERFORM pg_notify('producto', json_build_object('op', TG_OP, 'id', NEW.id, 'stock', NEW.stock)::text);
+  ELSE
+    PERFORM pg_notify('producto', json_build_object(
+      'op', TG_OP, 'id', NEW.id, 'nombre', NEW.nombre, 'precio', NEW.precio,
+      'stock', NEW.stock, 'activo', NEW.activo)::text);
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tg_producto_notificar ON producto;
+CREATE TRIGGER tg_producto_notificar
+AFTER INSERT OR UPDATE OR DELETE ON producto
+FOR EACH ROW EXECUTE FUNCTION fn_notificar_producto();
+
 -- Registrar acceso (aforo)
+-- Emite NOTIFY 'aforo' {"sede_id", "aforo"} para las pantallas en vivo (app/lib/realtime.py)
 CREATE OR REPLACE FUNCTION sp_registrar_acceso(p_socio_id BIGINT, p_sede_id BIGINT)
 RETURNS TABLE(status TEXT, code INT, message TEXT, acceso_id BIGINT) AS $$
-DECLARE v_activo INT; v_id BIGINT;
+DECLARE v_activo INT; v_congelada INT; v_id BIGINT;
 BEGIN
-  SELECT COUNT(*) INTO v_activo FROM membresia
-    WHERE socio_id = p_socio_id AND estado='activa' AND fecha_fin >= CURRENT_DATE;
+  -- Un congelamiento solo bloquea dentro de [congelada_desde, congelada_hasta): misma consulta
+  SELECT COUNT(*) FILTER (WHERE estado = 'activa'
+                             OR CURRENT_DATE < congelada_desde OR CURRENT_DATE >= congelada_hasta),
+         COUNT(*) FILTER (WHERE estado = 'congelada')
+    INTO v_activo, v_congelada
+    FROM membresia
+    WHERE socio_id = p_socio_id AND estado IN ('activa', 'congelada') AND fecha_fin >= CURRENT_DATE;
   IF v_activo = 0 THEN
-    status := 'ERROR'; code := 403; message := 'Membresía no activa'; acceso_id := NULL; RETURN;
+    status := 'ERROR'; code := 403;
+    message := CASE WHEN v_congelada > 0 THEN 'Membresía congelada' ELSE 'Membresía no activa' END;
+    acceso_id := NULL; RETURN NEXT; RETURN;
   END IF;
   INSERT INTO acceso(socio_id, sede_id) VALUES (p_socio_id, p_sede_id) RETURNING id INTO v_id;
-  status := 'OK'; code := 0; message := 'Acceso registrado'; acceso_id := v_id; RETURN;
+  PERFORM fn_notificar_aforo(p_sede_id);
+  status := 'OK'; code := 0; message := 'Acceso registrado'; acceso_id := v_id; RETURN NEXT;
 END;
 $$ LANGUAGE plpgsql;
 
 -- Registrar salida
 CREATE OR REPLACE FUNCTION sp_registrar_salida(p_acceso_id BIGINT)
 RETURNS TABLE(status TEXT, code INT, message TEXT) AS $$
+DECLARE v_sede BIGINT;
 BEGIN
-  UPDATE acceso SET fecha_salida = now() WHERE id = p_acceso_id AND fecha_salida IS NULL;
+  UPDATE acceso SET fecha_salida = now() WHERE id = p_acceso_id AND fecha_salida IS NULL
+  RETURNING sede_id INTO v_sede;
   IF NOT FOUND THEN
-    status := 'ERROR'; code := 404; message := 'Acceso no encontrado/ya cerrado'; RETURN;
+    status := 'ERROR'; code := 404; message := 'Acceso no encontrado/ya cerrado'; RETURN NEXT; RETURN;
   END IF;
-  status := 'OK'; code := 0; message := 'Salida registrada'; RETURN;
+  PERFORM fn_notificar_aforo(v_sede);
+  status := 'OK'; code := 0; message := 'Salida registrada'; RETURN NEXT;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -126,13 +387,82 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
--- KPIs simples (socios, membresías activas, accesos hoy)
-CREATE OR REPLACE FUNCTION sp_kpis()
+-- Rollup de ocupación por hora (incremental desde la marca de agua 'ocupacion_hora')
+-- Cada acceso es un intervalo [entrada, salida); los abiertos o muy largos se cortan en
+-- p_max_estadia. Se recalculan las horas completas de [desde, hasta) con generate_series
+-- (media) y un barrido de eventos +1/-1 (pico).
+CREATE OR REPLACE FUNCTION sp_rollup_ocupacion(p_desde TIMESTAMPTZ DEFAULT NULL,
+                                               p_max_estadia INTERVAL DEFAULT '4 hours')
+RETURNS TABLE(status TEXT, code INT, message TEXT, horas INT) AS $$
+DECLARE v_desde TIMESTAMPTZ; v_hasta TIMESTAMPTZ; v_n INT;
+BEGIN
+  v_hasta := date_trunc('hour', now());
+  v_desde := date_trunc('hour', COALESCE(
+    p_desde,
+    (SELECT r.hasta FROM rollup_estado r WHERE r.nombre = 'ocupacion_hora'),
+    (SELECT MIN(fecha_entrada) FROM acceso),
+    v_hasta));
+  IF v_desde >= v_hasta THEN
+    status := 'OK'; code := 0; message := 'Sin horas nuevas'; horas := 0; RETURN NEXT; RETURN;
+  END IF;
+
+  DELETE FROM ocupacion_hora WHERE hora >= v_desde AND hora < v_hasta;
+
+  WITH iv AS (
+    SELECT a.sede_id, a.fecha_entrada AS ini,
+           LEAST(COALESCE(a.fecha_salida, v_hasta), a.fecha_entrada + p_max_estadia, v_hasta) AS fin
+    FROM acceso a
+    WHERE a.fecha_entrada < v_hasta AND a.fecha_entrada >= v_desde - p_max_estadia
+  ), hs AS (
+    SELECT iv.sede_id, h.h AS hora,
+           EXTRACT(EPOCH FROM LEAST(iv.fin, h.h + interval '1 hour') - GREATEST(iv.ini, h.h)) / 3600.0 AS frac,
+           (iv.ini >= h.h)::int AS entrada,
+           (iv.ini < h.h)::int AS al_inicio
+    FROM iv
+    CROSS JOIN LATERAL generate_series(date_trunc('hour', GREATEST(iv.ini, v_desde)),
+                                       iv.fin - interval '1 microsecond', interval '1 hour') AS h(h)
+    WHERE iv.fin > iv.ini AND iv.fin > v_desde
+  ), ev AS (
+    SELECT sede_id, GREATEST(ini, v_desde) AS t, 1 AS d FROM iv WHERE iv.fin > v_desde AND iv.fin > iv.ini
+    UNION ALL
+    SELECT sede_id, fin, -1 FROM iv WHERE iv.fin > v_desde AND iv.fin > iv.ini AND iv.fin < v_hasta
+  ), pico AS (
+    SELECT sede_id, date_trunc('hour', t) AS hora, MAX(n) AS maximo
+    FROM (SELECT sede_id, t, SUM(d) OVER (PARTITION BY sede_id ORDER BY t, d ROWS UNBOUNDED PRECEDING) AS n
+          FROM ev) x
+    GROUP BY 1, 2
+  )
+  INSERT INTO ocupacion_hora(sede_id, hora, ocupacion_media, ocupacion_max, entradas)
+  SELECT hs.sede_id, hs.hora, ROUND(SUM(hs.frac)::numeric, 2),
+         GREATEST(SUM(hs.al_inicio), MAX(p.maximo))::int, SUM(hs.entrada)
+  FROM hs
+  LEFT JOIN pico p ON p.sede_id = hs.sede_id AND p.hora = hs.hora
+  WHERE hs.hora < v_hasta
+  GROUP BY hs.sede_id, hs.hora;
+  GET DIAGNOSTICS v_n = ROW_COUNT;
+
+  INSERT INTO rollup_estado(nombre, hasta) VALUES ('ocupacion_hora', v_hasta)
+  ON CONFLICT (nombre) DO UPDATE SET hasta = EXCLUDED.hasta, actualizado = now();
+
+  status := 'OK'; code := 0;
+  message := format('Ocupación %s → %s', to_char(v_desde, 'YYYY-MM-DD HH24:MI'), to_char(v_hasta, 'YYYY-MM-DD HH24:MI'));
+  horas := v_n; RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+-- KPIs simples (socios, membresías activas, accesos hoy). Con p_sede_id los accesos
+-- son solo de esa sede; socios y membresías son de toda la red.
+DROP FUNCTION IF EXISTS sp_kpis();
+CREATE OR REPLACE FUNCTION sp_kpis(p_sede_id BIGINT DEFAULT NULL)
 RETURNS TABLE(socios INT, membresias_activas INT, accesos_hoy INT) AS $$
 BEGIN
   socios := (SELECT COUNT(*) FROM socio);
-  membresias_activas := (SELECT COUNT(*) FROM membresia WHERE estado='activa' AND fecha_fin >= CURRENT_DATE);
-  accesos_hoy := (SELECT COUNT(*) FROM acceso WHERE fecha_entrada::date = CURRENT_DATE);
+  membresias_activas := (SELECT COUNT(*) FROM membresia
+                         WHERE (estado = 'activa' OR (estado = 'congelada' AND congelada_hasta <= CURRENT_DATE))
+                           AND fecha_fin >= CURRENT_DATE);
+  accesos_hoy := (SELECT COUNT(*) FROM acceso
+                  WHERE fecha_entrada >= CURRENT_DATE AND fecha_entrada < CURRENT_DATE + 1
+                    AND (p_sede_id IS NULL OR sede_id = p_sede_id));
   RETURN NEXT;
 END;
 $$ LANGUAGE plpgsql;
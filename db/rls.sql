@@ -0,0 +1,24 @@
+-- Aislamiento por sede con row-level security (opcional).
+-- Aplicar después de schema.sql:   psql -f db/rls.sql
+-- Las sesiones con app.sede_id (usuarios sin 'all_sedes') solo ven y escriben
+-- filas de su sede; sin app.sede_id (admin, gerencia, tools/) no hay filtro.
+-- FORCE aplica las políticas también al dueño de las tablas (el usuario de la app);
+-- los superusuarios y roles BYPASSRLS las ignoran siempre: la app debe conectar
+-- con un rol normal. Las páginas filtran además por sede_id de forma explícita,
+-- que es lo que permite usar los índices (sede_id, fecha).
+-- Filas sin sede: venta y pago anteriores a la columna sede_id quedan con NULL y un
+-- usuario limitado no las ve (NULL = app_sede() no es verdadero); sí las ve quien no
+-- tiene app.sede_id. Si se conoce la sede de origen, asignarla antes de aplicar esto,
+-- p.ej. con una sola sede:  UPDATE venta SET sede_id = 1 WHERE sede_id IS NULL;  (ídem pago)
+-- Para desactivarlo: ALTER TABLE <t> NO FORCE ROW LEVEL SECURITY; ALTER TABLE <t> DISABLE ROW LEVEL SECURITY;
+
+DO $$
+DECLARE t TEXT;
+BEGIN
+  FOREACH t IN ARRAY ARRAY['clase', 'acceso', 'venta', 'pago'] LOOP
+    EXECUTE format('ALTER TABLE %I ENABLE ROW LEVEL SECURITY', t);
+    EXECUTE format('ALTER TABLE %I FORCE ROW LEVEL SECURITY', t);
+    EXECUTE format('DROP POLICY IF EXISTS sede_aislada ON %I', t);
+    EXECUTE format('CREATE POLICY sede_aislada ON %I USING (app_sede() IS NULL OR sede_id = app_sede())', t);
+  END LOOP;
+END $$;
@@ -1,4 +1,5 @@
 CREATE EXTENSION IF NOT EXISTS pgcrypto;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Sedes
 CREATE TABLE IF NOT EXISTS sede (
@@ -6,6 +7,13 @@ CREATE TABLE IF NOT EXISTS sede (
   nombre TEXT NOT NULL UNIQUE
 );
 
+-- Sede a la que está limitada la sesión (app.sede_id, lo fija app.lib.db para
+-- usuarios sin 'all_sedes'). NULL = sin límite: admin, gerencia y tools/.
+-- La usan los DEFAULT de venta/pago y las políticas opcionales de db/rls.sql.
+CREATE OR REPLACE FUNCTION app_sede() RETURNS BIGINT LANGUAGE sql STABLE AS $$
+  SELECT NULLIF(current_setting('app.sede_id', true), '')::bigint
+$$;
+
 -- Usuarios (para login y roles)
 CREATE TABLE IF NOT EXISTS app_user (
   id BIGSERIAL PRIMARY KEY,
@@ -46,10 +54,32 @@ CREATE TABLE IF NOT EXISTS membresia (
   plan_id BIGINT NOT NULL REFERENCES membresia_plan(id),
   fecha_inicio DATE NOT NULL,
   fecha_fin DATE NOT NULL,
-  estado TEXT NOT NULL DEFAULT 'activa' -- activa, vencida, congelada, cancelada
+  estado TEXT NOT NULL DEFAULT 'activa', -- activa, vencida, congelada, cancelada
+  congelada_desde DATE,  -- congelamiento vigente (copia de membresia_congelamiento para
+  congelada_hasta DATE   -- validar accesos sin consultas extra); hasta NULL = abierto
 );
+ALTER TABLE membresia ADD COLUMN IF NOT EXISTS congelada_desde DATE;
+ALTER TABLE membresia ADD COLUMN IF NOT EXISTS congelada_hasta DATE;
 CREATE INDEX IF NOT EXISTS ix_membresia_socio ON membresia(socio_id);
 CREATE INDEX IF NOT EXISTS ix_membresia_estado ON membresia(estado);
+-- Congelamientos de período fijo ya cumplidos (sp_reactivar_congeladas)
+CREATE INDEX IF NOT EXISTS ix_membresia_congelada_hasta ON membresia(congelada_hasta) WHERE estado = 'congelada';
+
+-- Períodos de congelamiento (ver sp_congelar_membresia / sp_descongelar_membresia)
+CREATE TABLE IF NOT EXISTS membresia_congelamiento (
+  id BIGSERIAL PRIMARY KEY,
+  membresia_id BIGINT NOT NULL REFERENCES membresia(id) ON DELETE CASCADE,
+  desde DATE NOT NULL,
+  hasta DATE,                        -- NULL mientras esté abierto (sin fecha de fin)
+  dias INT,                          -- días descontados del máximo del plan
+  motivo TEXT,
+  sede_id BIGINT REFERENCES sede(id) ON DELETE SET NULL,  -- si vino de un cierre de sede
+  cerrado BOOLEAN NOT NULL DEFAULT FALSE,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_congelamiento_membresia ON membresia_congelamiento(membresia_id);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_congelamiento_abierto ON membresia_congelamiento(membresia_id) WHERE NOT cerrado;
+CREATE INDEX IF NOT EXISTS ix_congelamiento_sede_abierto ON membresia_congelamiento(sede_id) WHERE NOT cerrado;
 
 -- Pagos
 CREATE TABLE IF NOT EXISTS pago (
@@ -59,10 +89,13 @@ CREATE TABLE IF NOT EXISTS pago (
   monto NUMERIC(10,2) NOT NULL,
   medio TEXT NOT NULL, -- efectivo, tarjeta, transferencia
   ref_externa TEXT,
-  fecha TIMESTAMPTZ NOT NULL DEFAULT now()
+  fecha TIMESTAMPTZ NOT NULL DEFAULT now(),
+  sede_id BIGINT REFERENCES sede(id) ON DELETE SET NULL DEFAULT app_sede()  -- NULL en pagos anteriores
 );
+ALTER TABLE pago ADD COLUMN IF NOT EXISTS sede_id BIGINT REFERENCES sede(id) ON DELETE SET NULL DEFAULT app_sede();
 CREATE INDEX IF NOT EXISTS ix_pago_socio ON pago(socio_id);
 CREATE INDEX IF NOT EXISTS ix_pago_fecha ON pago(fecha);
+CREATE INDEX IF NOT EXISTS ix_pago_sede_fecha ON pago(sede_id, fecha);
 
 -- Clases
 CREATE TABLE IF NOT EXISTS clase (
@@ -74,6 +107,7 @@ CREATE TABLE IF NOT EXISTS clase (
   estado TEXT NOT NULL DEFAULT 'programada' -- programada, cancelada, realizada
 );
 CREATE INDEX IF NOT EXISTS ix_clase_fecha ON clase(fecha_hora);
+CREATE INDEX IF NOT EXISTS ix_clase_sede_fecha ON clase(sede_id, fecha_hora);
 
 -- Reservas
 CREATE TABLE IF NOT EXISTS reserva (
@@ -94,22 +128,61 @@ CREATE TABLE IF NOT EXISTS acceso (
   fecha_entrada TIMESTAMPTZ NOT NULL DEFAULT now(),
   fecha_salida TIMESTAMPTZ
 );
-CREATE INDEX IF NOT EXISTS ix_acceso_sede ON acceso(sede_id);
+-- Los compuestos (sede_id, ...) cubren las búsquedas solo por sede
+DROP INDEX IF EXISTS ix_acceso_sede;
 CREATE INDEX IF NOT EXISTS ix_acceso_abiertos ON acceso(sede_id, fecha_salida);
+CREATE INDEX IF NOT EXISTS ix_acceso_sede_entrada ON acceso(sede_id, fecha_entrada);
+-- fecha_entrada crece con el id: BRIN para las ventanas del rollup de ocupación
+CREATE INDEX IF NOT EXISTS ix_acceso_entrada_brin ON acceso USING brin(fecha_entrada);
+
+-- Ocupación por sede y hora (rollup incremental de acceso, ver sp_rollup_ocupacion)
+CREATE TABLE IF NOT EXISTS ocupacion_hora (
+  sede_id BIGINT NOT NULL REFERENCES sede(id) ON DELETE CASCADE,
+  hora TIMESTAMPTZ NOT NULL,                 -- inicio de la hora
+  ocupacion_media NUMERIC(10,2) NOT NULL,    -- persona-horas dentro de la hora
+  ocupacion_max INT NOT NULL,                -- pico simultáneo dentro de la hora
+  entradas INT NOT NULL,
+  PRIMARY KEY (sede_id, hora)
+);
+
+-- Riesgo de abandono por socio (lo recalcula tools/churn.py en batch)
+CREATE TABLE IF NOT EXISTS socio_riesgo (
+  socio_id BIGINT PRIMARY KEY REFERENCES socio(id) ON DELETE CASCADE,
+  riesgo NUMERIC(5,4) NOT NULL,              -- probabilidad estimada 0..1
+  nivel TEXT NOT NULL,                       -- bajo, medio, alto
+  visitas_30d INT NOT NULL,
+  visitas_90d INT NOT NULL,
+  tendencia NUMERIC(6,2),                    -- visitas 30d / promedio mensual 90d
+  dias_sin_visita INT,
+  dias_desde_pago INT,
+  brecha_pago NUMERIC(8,1),                  -- días de atraso vs. su intervalo habitual
+  asistencia_clases NUMERIC(4,2),            -- asistió / reservas pasadas (90d)
+  calculado TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_socio_riesgo_riesgo ON socio_riesgo(riesgo DESC);
+
+-- Marcas de agua de procesos incrementales
+CREATE TABLE IF NOT EXISTS rollup_estado (
+  nombre TEXT PRIMARY KEY,
+  hasta TIMESTAMPTZ NOT NULL,
+  actualizado TIMESTAMPTZ NOT NULL DEFAULT now()
+);
 
 -- Productos / Ventas (simplificado)
 CREATE TABLE IF NOT EXISTS producto (
   id BIGSERIAL PRIMARY KEY,
   nombre TEXT NOT NULL UNIQUE,
   precio NUMERIC(10,2) NOT NULL,
-  stock INT NOT NULL DEFAULT 0
+  stock INT NOT NULL DEFAULT 0,
+  activo BOOLEAN NOT NULL DEFAULT TRUE
 );
 
 CREATE TABLE IF NOT EXISTS venta (
   id BIGSERIAL PRIMARY KEY,
   socio_id BIGINT REFERENCES socio(id) ON DELETE SET NULL,
   fecha TIMESTAMPTZ NOT NULL DEFAULT now(),
-  total NUMERIC(10,2) NOT NULL DEFAULT 0
+  total NUMERIC(10,2) NOT NULL DEFAULT 0,
+  sede_id BIGINT REFERENCES sede(id) ON DELETE SET NULL DEFAULT app_sede()  -- NULL en ventas anteriores
 );
 
 CREATE TABLE IF NOT EXISTS venta_item (
@@ -117,8 +190,25 @@ CREATE TABLE IF NOT EXISTS venta_item (
   venta_id BIGINT NOT NULL REFERENCES venta(id) ON DELETE CASCADE,
   producto_id BIGINT NOT NULL REFERENCES producto(id),
   cantidad INT NOT NULL,
-  precio NUMERIC(10,2) NOT NULL
+  precio NUMERIC(10,2) NOT NULL,
+  precio_unitario NUMERIC(12,2),
+  subtotal NUMERIC(12,2)
+);
+-- Columnas usadas por pages/7_Productos.py y pages/8_Ventas.py (bases creadas antes)
+ALTER TABLE producto ADD COLUMN IF NOT EXISTS activo BOOLEAN NOT NULL DEFAULT TRUE;
+ALTER TABLE venta_item ADD COLUMN IF NOT EXISTS precio_unitario NUMERIC(12,2);
+ALTER TABLE venta_item ADD COLUMN IF NOT EXISTS subtotal NUMERIC(12,2);
+ALTER TABLE venta ADD COLUMN IF NOT EXISTS sede_id BIGINT REFERENCES sede(id) ON DELETE SET NULL DEFAULT app_sede();
+CREATE INDEX IF NOT EXISTS ix_venta_sede_fecha ON venta(sede_id, fecha);
+
+-- Sesiones compartidas entre workers/hosts (SHARED_STATE_BACKEND=postgres, ver app/lib/estado.py).
+-- UNLOGGED: sin WAL (escrituras baratas); tras una caída del servidor se vacía y los usuarios vuelven a entrar.
+CREATE UNLOGGED TABLE IF NOT EXISTS app_sesion (
+  sid TEXT PRIMARY KEY,
+  datos JSONB NOT NULL,
+  expira TIMESTAMPTZ NOT NULL
 );
+CREATE INDEX IF NOT EXISTS ix_app_sesion_expira ON app_sesion(expira);
 
 -- Auditoría sencilla
 CREATE TABLE IF NOT EXISTS auditoria (
@@ -130,3 +220,26 @@ CREATE TABLE IF NOT EXISTS auditoria (
   detalle JSONB,
   ts TIMESTAMPTZ NOT NULL DEFAULT now()
 );
+-- ts crece con el id: BRIN ocupa muy poco y basta para rangos de fechas
+CREATE INDEX IF NOT EXISTS ix_auditoria_ts_brin ON auditoria USING brin(ts);
+-- Búsquedas "contiene" (ILIKE '%..%') por entidad y por actor
+CREATE INDEX IF NOT EXISTS ix_auditoria_entidad_trgm ON auditoria USING gin(entidad gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_app_user_email_trgm ON app_user USING gin(email gin_trgm_ops);
+-- Búsqueda por actor: los usuarios que calzan con el email y, por cada uno, sus
+-- registros ya ordenados por fecha (ORDER BY fecha DESC LIMIT n sin ordenar todo;
+-- BRIN no entrega orden)
+CREATE INDEX IF NOT EXISTS ix_auditoria_usuario_ts ON auditoria(usuario_id, ts DESC);
+-- Búsquedas por clave/valor dentro de detalle (@>, @?, @@)
+CREATE INDEX IF NOT EXISTS ix_auditoria_detalle ON auditoria USING gin(detalle jsonb_path_ops);
+
+-- Vista usada por pages/9_Auditoria.py
+CREATE OR REPLACE VIEW auditoria_v AS
+SELECT a.id,
+       a.ts        AS fecha,
+       u.email     AS actor,
+       a.accion,
+       a.entidad   AS tabla,
+       a.entidad_id,
+       a.detalle
+FROM auditoria a
+LEFT JOIN app_user u ON u.id = a.usuario_id;
@@ -0,0 +1,5 @@
+#!/bin/bash
+# Permite conexiones de replicación (pg_basebackup / streaming) desde la red de compose.
+# Solo corre al inicializar el volumen; en una base existente agrega la línea a mano.
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
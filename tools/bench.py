@@ -0,0 +1,290 @@
+# tools/bench.py
+"""
+Benchmarks de procedimientos almacenados (sp_*) y de las consultas de cada página.
+
+    # contra la base actual
+    python -m tools.bench --label local --out bench/actual.json
+    # genera el dataset de cada escala (borra datos transaccionales) y mide
+    python -m tools.bench --scales small,medium,large --out bench/baseline.json
+    # compara contra una línea base y falla (exit 1) si hay regresiones
+    python -m tools.bench --scales medium --compare bench/baseline.json --threshold 0.2
+
+Cada caso corre `--warmup` veces sin medir y luego `--repeat` veces; las
+escrituras se ejecutan dentro de una transacción que se revierte, así que el
+dataset no cambia entre iteraciones. Se reporta p50, p95 y throughput (ops/s).
+"""
+import argparse
+import json
+import logging
+import platform
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+
+from app.lib.db import get_conn
+
+# -------------------------------------------
+# Contexto: ids reales del dataset para parametrizar los casos
+# -------------------------------------------
+def load_context(cur, seed):
+    def ids(sql, limit=500):
+        cur.execute(f"{sql} LIMIT {limit}")
+        return [next(iter(r.values())) for r in cur.fetchall()]
+
+    ctx = {
+        "socio": ids("SELECT id FROM socio ORDER BY random()"),
+        "socio_activo": ids("""SELECT socio_id FROM membresia
+                               WHERE estado='activa' AND fecha_fin >= CURRENT_DATE ORDER BY random()"""),
+        "sede": ids("SELECT id FROM sede ORDER BY id"),
+        "plan": ids("SELECT id FROM membresia_plan ORDER BY id"),
+        "clase": ids("SELECT id FROM clase WHERE estado='programada' ORDER BY random()"),
+        "reserva": ids("SELECT id FROM reserva WHERE estado='confirmada' ORDER BY random()"),
+        "acceso_abierto": ids("SELECT id FROM acceso WHERE fecha_salida IS NULL ORDER BY random()"),
+        "venta": ids("SELECT id FROM venta ORDER BY random()"),
+        "membresia_vence": ids("""SELECT id FROM membresia WHERE estado='activa'
+                                  AND fecha_fin BETWEEN CURRENT_DATE AND CURRENT_DATE + 30""", 5000),
+    }
+    ctx["rng"] = random.Random(seed)
+    return ctx
+
+def pick(ctx, key, default=0):
+    vals = ctx.get(key) or [default]
+    return ctx["rng"].choice(vals)
+
+# -------------------------------------------
+# Casos: procedimientos almacenados
+# -------------------------------------------
+SP_CASES = {
+    "sp_alta_socio": lambda c: ("SELECT * FROM sp_alta_socio(%s,%s,%s,%s)",
+                                (f"B{c['rng'].randrange(10**9)}", "Bench Socio", None, None)),
+    "sp_crear_membresia": lambda c: ("SELECT * FROM sp_crear_membresia(%s,%s,%s)",
+                                     (pick(c, "socio"), pick(c, "plan"), date.today())),
+    "sp_registrar_pago": lambda c: ("SELECT * FROM sp_registrar_pago(%s,%s,%s,%s,%s)",
+                                    (pick(c, "socio"), "Bench", 50, "Efectivo", None)),
+    "sp_publicar_clase": lambda c: ("SELECT * FROM sp_publicar_clase(%s,%s,%s,%s)",
+                                    (pick(c, "sede"), "Bench", datetime.now(timezone.utc), 20)),
+    "sp_reservar_clase": lambda c: ("SELECT * FROM sp_reservar_clase(%s,%s)", (pick(c, "socio"), pick(c, "clase"))),
+    "sp_checkin_clase": lambda c: ("SELECT * FROM sp_checkin_clase(%s)", (pick(c, "reserva"),)),
+    "sp_registrar_acceso": lambda c: ("SELECT * FROM sp_registrar_acceso(%s,%s)",
+                                      (pick(c, "socio_activo"), pick(c, "sede"))),
+    "sp_registrar_salida": lambda c: ("SELECT * FROM sp_registrar_salida(%s)", (pick(c, "acceso_abierto"),)),
+    "sp_aforo_actual": lambda c: ("SELECT sp_aforo_actual(%s)", (pick(c, "sede"),)),
+    "sp_kpis": lambda c: ("SELECT * FROM sp_kpis()", ()),
+    "sp_renovar_membresias": lambda c: ("SELECT * FROM sp_renovar_membresias(%s, %s, %s)",
+                                        (c.get("membresia_vence") or [0], "Efectivo", True)),
+    "sp_congelar_membresia": lambda c: ("SELECT * FROM sp_congelar_membresia(%s, CURRENT_DATE, %s)",
+                                        (pick(c, "membresia_vence"), 7)),
+    "sp_descongelar_membresia": lambda c: ("SELECT * FROM sp_descongelar_membresia(%s)", (pick(c, "membresia_vence"),)),
+    "sp_congelar_sede": lambda c: ("SELECT * FROM sp_congelar_sede(%s, CURRENT_DATE, %s)", (pick(c, "sede"), 14)),
+    "sp_descongelar_sede": lambda c: ("SELECT * FROM sp_descongelar_sede(%s)", (pick(c, "sede"),)),
+    "sp_rollup_ocupacion": lambda c: ("SELECT * FROM sp_rollup_ocupacion()", ()),
+}
+
+# -------------------------------------------
+# Casos: consultas de páginas (copiadas de app/Home.py y app/pages/*.py)
+# -------------------------------------------
+def _semana():
+    hoy = date.today()
+    return hoy - timedelta(days=7), hoy + timedelta(days=1)
+
+PAGE_CASES = {
+    "home.aforo_por_sede": lambda c: ("SELECT s.nombre, sp_aforo_actual(s.id) as aforo_actual FROM sede s ORDER BY s.nombre", ()),
+    "home.ventas_hoy": lambda c: ("SELECT COALESCE(SUM(total), 0)::numeric(10,2) as total FROM venta WHERE fecha::date = CURRENT_DATE", ()),
+    "home.clases_hoy": lambda c: ("SELECT COUNT(*) c FROM clase WHERE fecha_hora::date = CURRENT_DATE AND estado = 'programada'", ()),
+    "home.vencimientos_7d": lambda c: ("""SELECT COUNT(*) c FROM membresia
+        WHERE estado = 'activa' AND fecha_fin BETWEEN CURRENT_DATE AND CURRENT_DATE + 7""", ()),
+    "home.accesos_semana": lambda c: ("""SELECT fecha_entrada::date as fecha, COUNT(*) as accesos FROM acceso
+        WHERE fecha_entrada >= CURRENT_DATE - 7 GROUP BY fecha_entrada::date ORDER BY fecha""", ()),
+    "home.ventas_semana": lambda c: ("""SELECT fecha::date as fecha, SUM(total) as total_ventas FROM venta
+        WHERE fecha >= CURRENT_DATE - 7 GROUP BY fecha::date ORDER BY fecha""", ()),
+    "home.proximas_clases": lambda c: ("""SELECT c.id, c.nombre, s.nombre AS sede, c.fecha_hora, c.capacidad,
+            COUNT(r.id) as reservas, (c.capacidad - COUNT(r.id)) as disponibles
+        FROM clase c JOIN sede s ON s.id = c.sede_id
+        LEFT JOIN reserva r ON r.clase_id = c.id AND r.estado = 'confirmada'
+        WHERE c.fecha_hora >= now() - interval '1 hour' AND c.fecha_hora <= now() + interval '48 hours'
+          AND c.estado = 'programada'
+        GROUP BY c.id, c.nombre, s.nombre, c.fecha_hora, c.capacidad ORDER BY c.fecha_hora LIMIT 20""", ()),
+    "home.accesos_recientes": lambda c: ("""SELECT s.nombre as socio, se.nombre as sede, a.fecha_entrada,
+            CASE WHEN a.fecha_salida IS NULL THEN 'Dentro' ELSE 'Salió' END as estado
+        FROM acceso a JOIN socio s ON s.id = a.socio_id JOIN sede se ON se.id = a.sede_id
+        ORDER BY a.fecha_entrada DESC LIMIT 10""", ()),
+    "home.vencimientos_detalle": lambda c: ("""SELECT s.nombre as socio, s.telefono, mp.nombre as plan, m.fecha_fin,
+            (m.fecha_fin - CURRENT_DATE) as dias_restantes, sr.riesgo, sr.nivel
+        FROM membresia m JOIN socio s ON s.id = m.socio_id JOIN membresia_plan mp ON mp.id = m.plan_id
+        LEFT JOIN socio_riesgo sr ON sr.socio_id = m.socio_id
+        WHERE m.estado = 'activa' AND m.fecha_fin BETWEEN CURRENT_DATE AND CURRENT_DATE + 15
+        ORDER BY sr.riesgo DESC NULLS LAST, m.fecha_fin""", ()),
+    "home.top_productos": lambda c: ("""SELECT p.nombre, SUM(vi.cantidad) as total_vendido, SUM(vi.subtotal) as ingresos,
+            p.stock as stock_actual
+        FROM venta_item vi JOIN producto p ON p.id = vi.producto_id JOIN venta v ON v.id = vi.venta_id
+        WHERE v.fecha >= CURRENT_DATE - 30
+        GROUP BY p.id, p.nombre, p.stock ORDER BY total_vendido DESC LIMIT 10""", ()),
+    "socios.listado": lambda c: ("SELECT id, dni, nombre, email, telefono, estado, fecha_alta FROM socio ORDER BY id DESC LIMIT %s", (100,)),
+    "socios.buscar": lambda c: ("""SELECT id, dni, nombre, email, telefono, estado, fecha_alta FROM socio
+        WHERE nombre ILIKE %s OR email ILIKE %s ORDER BY id DESC LIMIT %s""", ("%garc%", "%garc%", 100)),
+    "membresias.listado": lambda c: ("""SELECT m.id, s.nombre AS socio, p.nombre AS plan, m.fecha_inicio, m.fecha_fin, m.estado
+        FROM membresia m JOIN socio s ON s.id = m.socio_id JOIN membresia_plan p ON p.id = m.plan_id
+        ORDER BY m.id DESC LIMIT 300""", ()),
+    "clases.listado": lambda c: ("""SELECT c.id, c.nombre, s.nombre AS sede, c.fecha_hora, c.capacidad, c.estado
+        FROM clase c JOIN sede s ON s.id=c.sede_id ORDER BY c.fecha_hora DESC LIMIT 300""", ()),
+    "clases.reservas_pendientes": lambda c: ("""SELECT r.id, r.clase_id, r.socio_id, r.estado, c.nombre as clase
+        FROM reserva r JOIN clase c ON c.id=r.clase_id WHERE r.estado='confirmada' ORDER BY r.id DESC LIMIT 200""", ()),
+    "accesos.abiertos": lambda c: ("""SELECT id, socio_id, fecha_entrada FROM acceso
+        WHERE sede_id=%s AND fecha_salida IS NULL ORDER BY id DESC LIMIT 100""", (pick(c, "sede"),)),
+    "reportes.ingresos_dia": lambda c: ("SELECT date(fecha) as dia, sum(monto) as ingresos FROM pago GROUP BY 1 ORDER BY 1 DESC LIMIT 60", ()),
+    "reportes.heatmap_ocupacion": lambda c: ("""SELECT (hora AT TIME ZONE 'America/Lima')::date AS dia,
+            EXTRACT(HOUR FROM hora AT TIME ZONE 'America/Lima')::int AS h, SUM(ocupacion_media)::float AS valor
+        FROM ocupacion_hora WHERE hora >= now() - interval '8 weeks' GROUP BY 1, 2""", ()),
+    "reportes.exportar_socios": lambda c: ("SELECT id, dni, nombre, email, telefono, estado, fecha_alta FROM socio ORDER BY id DESC", ()),
+    # productos / ventas: listado y carrito leen app/lib/catalogo.py; esta es su carga completa
+    "catalogo.carga": lambda c: ("SELECT id, nombre, precio, stock, activo FROM producto", ()),
+    "ventas.listado": lambda c: ("""SELECT v.id, v.fecha, v.total, s.nombre AS socio FROM venta v JOIN socio s ON s.id = v.socio_id
+        WHERE 1=1 ORDER BY v.id DESC LIMIT 200""", ()),
+    "ventas.detalle": lambda c: ("""SELECT vi.id, p.nombre, vi.cantidad, vi.precio_unitario, vi.subtotal
+        FROM venta_item vi JOIN producto p ON p.id = vi.producto_id WHERE vi.venta_id = %s ORDER BY vi.id""",
+                                 (pick(c, "venta"),)),
+    "pagos.listado_semana": lambda c: ("""SELECT p.id, p.fecha, s.nombre AS socio, p.concepto, p.medio, p.monto, p.ref_externa
+        FROM pago p JOIN socio s ON s.id = p.socio_id WHERE p.fecha >= %s AND p.fecha < %s
+        ORDER BY p.fecha DESC, p.id DESC LIMIT %s""", (*_semana(), 200)),
+    "auditoria.semana": lambda c: ("""SELECT id, fecha, actor, accion, tabla, detalle FROM auditoria_v
+        WHERE fecha >= %s AND fecha < %s ORDER BY fecha DESC, id DESC LIMIT %s""", (*_semana(), 100)),
+    "auditoria.anio_actor": lambda c: ("""SELECT id, fecha, actor, accion, tabla, detalle FROM auditoria_v
+        WHERE fecha >= %s AND fecha < %s AND actor ILIKE %s ORDER BY fecha DESC, id DESC LIMIT %s""",
+                                       (date.today() - timedelta(days=365), date.today() + timedelta(days=1), "%recep%", 100)),
+}
+
+# -------------------------------------------
+# Ejecución
+# -------------------------------------------
+def run_case(conn, build, ctx, warmup, repeat):
+    tiempos = []
+    errores = 0
+    with conn.cursor() as cur:
+        for i in range(warmup + repeat):
+            sql, params = build(ctx)
+            t0 = time.perf_counter()
+            try:
+                cur.execute(sql, params)
+                if cur.description:
+                    cur.fetchall()
+            except Exception:
+                errores += 1
+            finally:
+                conn.rollback()  # las escrituras no persisten entre iteraciones
+            if i >= warmup:
+                tiempos.append((time.perf_counter() - t0) * 1000.0)
+    arr = np.array(tiempos)
+    return {
+        "n": len(arr),
+        "errors": errores,
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "mean_ms": round(float(arr.mean()), 3),
+        "ops_s": round(len(arr) / (arr.sum() / 1000.0), 1) if arr.sum() else None,
+    }
+
+def dataset_size(cur):
+    cur.execute("""
+        SELECT relname, n_live_tup FROM pg_stat_user_tables
+        WHERE relname IN ('socio','membresia','pago','clase','reserva','acceso','producto','venta','venta_item','auditoria')
+    """)
+    filas = {r["relname"]: r["n_live_tup"] for r in cur.fetchall()}
+    return {"rows": sum(filas.values()), "tables": filas}
+
+def bench_current(args, label):
+    casos = {}
+    if "sp" in args.suites:
+        casos.update({f"sp.{k}": v for k, v in SP_CASES.items()})
+    if "pages" in args.suites:
+        casos.update({f"page.{k}": v for k, v in PAGE_CASES.items()})
+    if args.only:
+        casos = {k: v for k, v in casos.items() if any(o in k for o in args.only.split(","))}
+
+    res = {}
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            ctx = load_context(cur, args.seed)
+            size = dataset_size(cur)
+            cur.execute("SELECT proname FROM pg_proc WHERE proname LIKE 'sp\\_%%' ORDER BY 1")
+            sin_caso = sorted({r["proname"] for r in cur.fetchall()} - set(SP_CASES))
+        conn.rollback()
+        if sin_caso:
+            print(f"  aviso: procedimientos sin caso de benchmark: {', '.join(sin_caso)}")
+        for nombre, build in casos.items():
+            r = run_case(conn, build, ctx, args.warmup, args.repeat)
+            res[nombre] = r
+            print(f"  {label:>8} {nombre:<34} p50 {r['p50_ms']:>9.2f} ms  p95 {r['p95_ms']:>9.2f} ms"
+                  f"  {r['ops_s'] or 0:>9.1f} ops/s" + (f"  ({r['errors']} errores)" if r["errors"] else ""))
+    return {"dataset": size, "cases": res}
+
+def compare(actual, base, threshold, metric):
+    """Lista de regresiones: casos cuyo `metric` empeora más de `threshold` (fracción)."""
+    regresiones = []
+    for escala, datos in actual["scales"].items():
+        ref = base.get("scales", {}).get(escala, {}).get("cases", {})
+        for caso, r in datos["cases"].items():
+            b = ref.get(caso)
+            if not b or not b.get(metric):
+                continue
+            ratio = r[metric] / b[metric]
+            if ratio > 1 + threshold:
+                regresiones.append({"scale": escala, "case": caso, "base": b[metric],
+                                    "actual": r[metric], "ratio": round(ratio, 2)})
+    return regresiones
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scales", default="", help="presets de tools.gen_data a generar y medir (small,medium,large)")
+    ap.add_argument("--label", default="actual", help="nombre de la escala si no se generan datos")
+    ap.add_argument("--suites", default="sp,pages")
+    ap.add_argument("--only", default="", help="filtra casos por subcadena (coma-separado)")
+    ap.add_argument("--warmup", type=int, default=3)
+    ap.add_argument("--repeat", type=int, default=30)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", help="guarda resultados en JSON")
+    ap.add_argument("--compare", help="JSON de línea base para detectar regresiones")
+    ap.add_argument("--threshold", type=float, default=0.20, help="empeoramiento tolerado (0.20 = 20%%)")
+    ap.add_argument("--metric", default="p95_ms", choices=["p50_ms", "p95_ms", "mean_ms"])
+    args = ap.parse_args(argv)
+    # el slow log de la app solo ensucia la salida: aquí ya medimos cada caso
+    logging.getLogger("gym.slow_query").disabled = True
+
+    resultado = {
+        "meta": {"ts": datetime.now(timezone.utc).isoformat(timespec="seconds"), "host": platform.node(),
+                 "python": platform.python_version(), "warmup": args.warmup, "repeat": args.repeat,
+                 "seed": args.seed},
+        "scales": {},
+    }
+    escalas = [s for s in args.scales.split(",") if s]
+    if escalas:
+        from tools import gen_data
+        for escala in escalas:
+            print(f"== generando dataset '{escala}'")
+            gen_data.main(["--preset", escala, "--seed", str(args.seed), "--truncate"])
+            print(f"== midiendo '{escala}'")
+            resultado["scales"][escala] = bench_current(args, escala)
+    else:
+        resultado["scales"][args.label] = bench_current(args, args.label)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"resultados guardados en {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+        reg = compare(resultado, base, args.threshold, args.metric)
+        if reg:
+            print(f"\n{len(reg)} regresiones ({args.metric} > +{args.threshold:.0%}):")
+            for r in reg:
+                print(f"  [{r['scale']}] {r['case']}: {r['base']:.2f} -> {r['actual']:.2f} ms (x{r['ratio']})")
+            return 1
+        print(f"\nsin regresiones ({args.metric}, tolerancia {args.threshold:.0%})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
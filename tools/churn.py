@@ -0,0 +1,231 @@
+# tools/churn.py
+"""
+Pipeline batch de riesgo de abandono (churn) por socio -> tabla socio_riesgo.
+
+    python -m tools.churn                    # calcula con fecha de hoy
+    python -m tools.churn --fecha 2025-06-30 --dry-run
+
+Extrae acceso, pago, reserva y membresía con COPY ... TO STDOUT en bloques,
+calcula las features de forma vectorizada (arrays indexados por socio_id) y
+puntúa con un modelo logístico simple de pesos fijos (MODELO). Solo se
+puntúan socios con membresía activa o vencida hace menos de 30 días.
+
+Features:
+    visitas_30d / visitas_90d   frecuencia reciente
+    tendencia                   visitas 30d / (visitas 90d / 3): <1 = decae
+    dias_sin_visita             desde la última entrada (tope 180)
+    dias_desde_pago, brecha_pago  días desde el último pago y atraso respecto a
+                                  la mediana de sus intervalos entre pagos
+    asistencia_clases           asistió / reservas de clases pasadas (90 días)
+"""
+import argparse
+import io
+import sys
+import time
+from datetime import date, datetime, time as dtime, timezone
+
+import numpy as np
+import pandas as pd
+from psycopg import IsolationLevel
+
+from app.lib.db import get_conn
+
+VENTANA_ACCESOS = 180  # días
+CHUNK_BYTES = 8 << 20
+
+# Pesos del modelo logístico (log-odds). Ajustables sin tocar el resto del pipeline.
+MODELO = {
+    "intercepto": -1.2,
+    "dias_sin_visita": 0.05,       # por día, tope 60
+    "visitas_30d": -0.12,          # por visita, tope 20
+    "tendencia": -0.9,             # por unidad sobre/bajo 1, tope 1.5
+    "brecha_pago": 0.03,           # por día de atraso, tope 60
+    "asistencia_clases": -1.0,     # centrado en 0.5; sin reservas = neutro
+    "vence_7d": 0.6,               # membresía vence en <= 7 días
+}
+NIVELES = ((0.66, "alto"), (0.33, "medio"), (0.0, "bajo"))
+
+def _log(msg):
+    print(f"[{datetime.now():%H:%M:%S}] {msg}", flush=True)
+
+# -------------------------------------------
+# Extracción: COPY en bloques -> DataFrames
+# -------------------------------------------
+def copy_chunks(cur, sql, params, columns, chunk_bytes=CHUNK_BYTES):
+    """Itera DataFrames de ~chunk_bytes leyendo `COPY (sql) TO STDOUT` (CSV)."""
+    buf = bytearray()
+    with cur.copy(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv)", params) as cp:
+        for bloque in cp:
+            buf += bloque
+            if len(buf) >= chunk_bytes:
+                corte = buf.rfind(b"\n") + 1
+                yield pd.read_csv(io.BytesIO(bytes(buf[:corte])), names=columns, header=None)
+                del buf[:corte]
+    if buf:
+        yield pd.read_csv(io.BytesIO(bytes(buf)), names=columns, header=None)
+
+def _edad_dias(ref_epoch, epoch):
+    return (ref_epoch - epoch.to_numpy(dtype="float64")) / 86400.0
+
+# -------------------------------------------
+# Features
+# -------------------------------------------
+def features(cur, ref: datetime):
+    """Features por socio. Debe correr en una sola transacción REPEATABLE READ: los
+    arrays se dimensionan con MAX(socio.id) y un socio nuevo entre consultas
+    rompería los bincount."""
+    ref_epoch = ref.timestamp()
+    cur.execute("SELECT COALESCE(MAX(id), 0) AS n FROM socio")
+    n = int(cur.fetchone()["n"]) + 1
+
+    # Socios a puntuar y días para vencer su membresía vigente más reciente
+    cur.execute("""
+        SELECT DISTINCT ON (socio_id) socio_id, (fecha_fin - %s::date) AS dias_para_vencer
+        FROM membresia
+        WHERE estado IN ('activa', 'congelada') AND fecha_fin >= %s::date - 30
+        ORDER BY socio_id, fecha_fin DESC
+    """, (ref.date(), ref.date()))
+    base = pd.DataFrame(cur.fetchall(), columns=["socio_id", "dias_para_vencer"])
+
+    # Accesos: conteos y recencia acumulados por bloque con bincount / minimum.at
+    v30 = np.zeros(n)
+    v90 = np.zeros(n)
+    ultima = np.full(n, float(VENTANA_ACCESOS))
+    filas = 0
+    for df in copy_chunks(cur, """
+            SELECT socio_id, extract(epoch FROM fecha_entrada)::bigint
+            FROM acceso WHERE fecha_entrada >= %s::timestamptz - make_interval(days => %s)
+              AND fecha_entrada < %s::timestamptz
+        """, (ref, VENTANA_ACCESOS, ref), ["socio_id", "ts"]):
+        ids = df["socio_id"].to_numpy()
+        edad = _edad_dias(ref_epoch, df["ts"])
+        v30 += np.bincount(ids, weights=edad < 30, minlength=n)
+        v90 += np.bincount(ids, weights=edad < 90, minlength=n)
+        np.minimum.at(ultima, ids, edad)
+        filas += len(df)
+    _log(f"accesos: {filas:,} filas")
+
+    # Pagos: intervalos entre pagos consecutivos del mismo socio (mediana) y último pago
+    bloques = list(copy_chunks(cur, """
+            SELECT socio_id, extract(epoch FROM fecha)::bigint
+            FROM pago WHERE fecha >= %s::timestamptz - interval '365 days' AND fecha < %s::timestamptz
+              AND monto > 0
+        """, (ref, ref), ["socio_id", "ts"]))
+    # Sin pagos en la ventana (BD nueva o chica): DataFrame vacío con enteros para indexar
+    pagos = (pd.concat(bloques, ignore_index=True) if bloques
+             else pd.DataFrame({"socio_id": np.empty(0, np.int64), "ts": np.empty(0, np.int64)}))
+    _log(f"pagos: {len(pagos):,} filas")
+    pagos = pagos.sort_values(["socio_id", "ts"], kind="mergesort")
+    pagos["gap"] = pagos.groupby("socio_id")["ts"].diff() / 86400.0
+    por_socio = pagos.groupby("socio_id").agg(ultimo=("ts", "max"), mediana_gap=("gap", "median"))
+    desde_pago = np.full(n, np.nan)
+    mediana_gap = np.full(n, np.nan)
+    idx = por_socio.index.to_numpy()
+    desde_pago[idx] = _edad_dias(ref_epoch, por_socio["ultimo"])
+    mediana_gap[idx] = por_socio["mediana_gap"].to_numpy()
+
+    # Reservas de clases ya realizadas (90 días): asistencia
+    reservadas = np.zeros(n)
+    asistio = np.zeros(n)
+    for df in copy_chunks(cur, """
+            SELECT r.socio_id, (r.estado = 'asistio')::int
+            FROM reserva r JOIN clase c ON c.id = r.clase_id
+            WHERE c.fecha_hora >= %s::timestamptz - interval '90 days' AND c.fecha_hora < %s::timestamptz
+              AND r.estado IN ('confirmada', 'asistio')
+        """, (ref, ref), ["socio_id", "asistio"]):
+        ids = df["socio_id"].to_numpy()
+        reservadas += np.bincount(ids, minlength=n)
+        asistio += np.bincount(ids, weights=df["asistio"].to_numpy(), minlength=n)
+
+    ids = base["socio_id"].to_numpy()
+    f = pd.DataFrame({"socio_id": ids})
+    f["visitas_30d"] = v30[ids].astype(int)
+    f["visitas_90d"] = v90[ids].astype(int)
+    f["tendencia"] = np.where(v90[ids] > 0, v30[ids] / np.maximum(v90[ids] / 3.0, 1e-9), 0.0)
+    f["dias_sin_visita"] = np.floor(ultima[ids]).astype(int)
+    f["dias_desde_pago"] = desde_pago[ids]
+    f["brecha_pago"] = desde_pago[ids] - mediana_gap[ids]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        f["asistencia_clases"] = np.where(reservadas[ids] > 0, asistio[ids] / reservadas[ids], np.nan)
+    f["dias_para_vencer"] = base["dias_para_vencer"].to_numpy()
+    return f
+
+def score(f: pd.DataFrame) -> pd.Series:
+    m = MODELO
+    z = (m["intercepto"]
+         + m["dias_sin_visita"] * f["dias_sin_visita"].clip(upper=60)
+         + m["visitas_30d"] * f["visitas_30d"].clip(upper=20)
+         + m["tendencia"] * (f["tendencia"].clip(upper=1.5) - 1.0)
+         + m["brecha_pago"] * f["brecha_pago"].fillna(0).clip(lower=0, upper=60)
+         + m["asistencia_clases"] * (f["asistencia_clases"].fillna(0.5) - 0.5)
+         + m["vence_7d"] * (f["dias_para_vencer"] <= 7))
+    return 1.0 / (1.0 + np.exp(-z))
+
+def nivel(riesgo: pd.Series) -> pd.Series:
+    out = pd.Series("bajo", index=riesgo.index)
+    for umbral, nombre in reversed(NIVELES):
+        out[riesgo >= umbral] = nombre
+    return out
+
+# -------------------------------------------
+# Carga
+# -------------------------------------------
+COLUMNAS = ["socio_id", "riesgo", "nivel", "visitas_30d", "visitas_90d", "tendencia", "dias_sin_visita",
+            "dias_desde_pago", "brecha_pago", "asistencia_clases"]
+
+def guardar(cur, f: pd.DataFrame, ref: datetime):
+    """Reemplaza socio_riesgo en una transacción: COPY a tabla temporal + upsert."""
+    cur.execute("CREATE TEMP TABLE tmp_riesgo (LIKE socio_riesgo INCLUDING DEFAULTS) ON COMMIT DROP")
+    out = f[COLUMNAS].copy()
+    out["riesgo"] = out["riesgo"].round(4)
+    out["tendencia"] = out["tendencia"].round(2)
+    out["dias_desde_pago"] = out["dias_desde_pago"].round().astype("Int64")
+    out["brecha_pago"] = out["brecha_pago"].round(1)
+    out["asistencia_clases"] = out["asistencia_clases"].round(2)
+    buf = io.StringIO()
+    out.to_csv(buf, index=False, header=False)
+    with cur.copy(f"COPY tmp_riesgo ({', '.join(COLUMNAS)}) FROM STDIN WITH (FORMAT csv)") as cp:
+        cp.write(buf.getvalue())
+    sets = ", ".join(f"{c} = EXCLUDED.{c}" for c in COLUMNAS[1:])
+    cur.execute(f"""
+        INSERT INTO socio_riesgo ({', '.join(COLUMNAS)}, calculado)
+        SELECT {', '.join(COLUMNAS)}, %s FROM tmp_riesgo
+        ON CONFLICT (socio_id) DO UPDATE SET {sets}, calculado = EXCLUDED.calculado
+    """, (ref,))
+    cur.execute("DELETE FROM socio_riesgo r WHERE NOT EXISTS (SELECT 1 FROM tmp_riesgo t WHERE t.socio_id = r.socio_id)")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--fecha", type=date.fromisoformat, help="fecha de referencia (default: ahora)")
+    ap.add_argument("--dry-run", action="store_true", help="calcula y muestra el resumen sin escribir")
+    args = ap.parse_args(argv)
+    ref = (datetime.combine(args.fecha, dtime.min, tzinfo=timezone.utc) if args.fecha
+           else datetime.now(timezone.utc))
+
+    t0 = time.perf_counter()
+    with get_conn(timeout="batch") as conn:
+        # Extracción en un único instante (REPEATABLE READ, solo lectura); la escritura
+        # de socio_riesgo va en una transacción aparte con los valores por defecto
+        conn.isolation_level = IsolationLevel.REPEATABLE_READ
+        conn.read_only = True
+        with conn.cursor() as cur:
+            f = features(cur, ref)
+            conn.commit()
+            conn.isolation_level = None
+            conn.read_only = None
+            f["riesgo"] = score(f)
+            f["nivel"] = nivel(f["riesgo"])
+            _log(f"{len(f):,} socios puntuados · " +
+                 " · ".join(f"{k}: {v:,}" for k, v in f["nivel"].value_counts().items()))
+            if args.dry_run:
+                print(f.sort_values("riesgo", ascending=False).head(15).to_string(index=False))
+                conn.rollback()
+            else:
+                guardar(cur, f, ref)
+                conn.commit()
+                _log("socio_riesgo actualizado")
+    _log(f"listo en {time.perf_counter() - t0:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
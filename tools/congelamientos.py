@@ -0,0 +1,26 @@
+# tools/congelamientos.py
+"""
+Cierra los congelamientos de período fijo ya cumplidos (sp_reactivar_congeladas):
+la membresía vuelve a 'activa' el día congelada_hasta.
+
+    python -m tools.congelamientos
+
+Pensado para cron (p.ej. diario a las 00:05). Los SP que escriben membresías ya
+reactivan las suyas; esto deja al día el estado para KPIs, listados y reportes.
+"""
+import argparse
+import sys
+import time
+
+from app.lib.sp_wrappers import reactivar_congeladas
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.parse_args(argv)
+    t0 = time.perf_counter()
+    r = reactivar_congeladas()[0]
+    print(f"{r['message']} en {time.perf_counter() - t0:.1f}s")
+    return 0 if r["status"] == "OK" else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+# tools/loadtest.py
+"""
+Prueba de carga headless: N usuarios virtuales ejecutando guiones de sesión
+reales (login, Home, entrada/salida en Accesos, venta en Ventas, pago en Pagos)
+con streamlit.testing.v1.AppTest, todos en este proceso (como un servidor
+Streamlit único) contra la base configurada en .env / PG*.
+
+    python -m tools.gen_data --preset small --truncate          # recepcionN@gym.local / demo123
+    python -m tools.loadtest --users 12 --iterations 5 --out bench/carga.json
+    python -m tools.loadtest --users 12 --compare bench/carga.json --threshold 0.25
+
+Reporta latencia de rerun por paso (p50/p95/max), errores por paso y conexiones
+a la BD (muestreadas de pg_stat_activity y del gauge interno de app.lib.db).
+"""
+import argparse
+import json
+import logging
+import platform
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+from app.lib import db
+from app.lib.db import query
+
+ROOT = Path(__file__).resolve().parents[1]
+PAGES = {
+    "home": ROOT / "app" / "Home.py",
+    "accesos": ROOT / "app" / "pages" / "4_Accesos_Aforo.py",
+    "ventas": ROOT / "app" / "pages" / "8_Ventas.py",
+    "pagos": ROOT / "app" / "pages" / "10_Pagos.py",
+}
+AUTH_KEYS = ("user", "permissions", "roles")
+
+# -------------------------------------------
+# Helpers de AppTest
+# -------------------------------------------
+def _find(widgets, label):
+    return next((w for w in widgets if w.label == label), None)
+
+def _elegir_socio(sb, rng):
+    """Selectbox de socios con format_func "id - nombre": AppTest solo ve el texto,
+    así que se reconstruye el dict para que format_func vuelva a dar la misma opción."""
+    sid, nombre = rng.choice(sb.options).split(" - ", 1)
+    sb.set_value({"id": int(sid), "nombre": nombre})
+
+def compartir_runtime():
+    """AppTest instala y borra un Runtime simulado global en cada run(); con varios
+    hilos a la vez eso rompe los runs ajenos. Se deja uno fijo para todo el proceso."""
+    from unittest.mock import MagicMock
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.testing.v1 import app_test
+
+    rt = MagicMock(spec=Runtime)
+    rt.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    rt.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = rt
+
+    class _Fijo(type):
+        def __setattr__(cls, name, value):
+            pass  # ignora Runtime._instance = ... de cada run
+
+    app_test.Runtime = _Fijo("Runtime", (), {})
+    config.set_option("global.appTest", True)
+
+class VirtualUser:
+    """Un navegador: una sesión por página (AppTest) que se reutiliza entre iteraciones."""
+
+    def __init__(self, n, email, password, timeout, rec):
+        self.n = n
+        self.email = email
+        self.password = password
+        self.timeout = timeout
+        self.rec = rec
+        self.rng = random.Random(n)
+        self.auth = {}
+        self.apps = {}
+        self.resyncs = 0
+
+    def _app(self, page):
+        at = self.apps.get(page)
+        if at is None:
+            at = self.apps[page] = AppTest.from_file(str(PAGES[page]), default_timeout=self.timeout)
+            for k, v in self.auth.items():
+                at.session_state[k] = v
+        return at
+
+    def step(self, name, fn):
+        """Ejecuta fn() (que termina en un .run()) midiendo la latencia del rerun."""
+        t0 = time.perf_counter()
+        err = None
+        at = None
+        try:
+            at = fn()
+            if at.exception:
+                err = at.exception[0].message
+        except Exception as e:
+            err = f"{type(e).__name__}: {e}"
+        self.rec(name, (time.perf_counter() - t0) * 1000.0, err)
+        if at is not None:
+            self._sincronizar(at)
+
+    def _sincronizar(self, at):
+        """Tras un st.rerun() AppTest deja en el árbol widgets del run anterior que ya
+        no existen en session_state; se re-ejecuta (sin medir) para limpiar el árbol."""
+        try:
+            at._tree.get_widget_states()
+        except KeyError:
+            self.resyncs += 1
+            at._run()
+
+    # ---- guiones ----
+    def login(self):
+        def go():
+            at = self._app("home").run()
+            _find(at.text_input, "Email").input(self.email)
+            _find(at.text_input, "Contraseña").input(self.password)
+            at = _find(at.button, "Ingresar").click().run()
+            if not at.session_state["user"]:
+                raise RuntimeError(f"login falló para {self.email}")
+            self.auth = {k: at.session_state[k] for k in AUTH_KEYS if k in at.session_state}
+            return at
+        self.step("login", go)
+
+    def home(self):
+        self.step("home", lambda: self._app("home").run())
+
+    def accesos(self):
+        at = self._app("accesos")
+        self.step("accesos:ver", at.run)
+        socio = _find(at.selectbox, "Socio")
+        if socio is not None and socio.options:
+            _elegir_socio(socio, self.rng)
+            self.step("accesos:entrada", lambda: _find(at.button, "Entrada").click().run())
+        if _find(at.selectbox, "Acceso") is not None:
+            # salida del acceso abierto más reciente (opción por defecto)
+            self.step("accesos:salida", lambda: _find(at.button, "Salida").click().run())
+
+    def ventas(self):
+        at = self._app("ventas")
+        otra = _find(at.button, "➕ Nueva Venta")
+        if otra is not None:
+            self.step("ventas:nueva", lambda: otra.click().run())
+        else:
+            self.step("ventas:ver", at.run)
+        if _find(at.button, "➕ Agregar") is None:
+            return
+        self.step("ventas:agregar", lambda: _find(at.button, "➕ Agregar").click().run())
+        confirmar = _find(at.button, "💾 Confirmar venta")
+        if confirmar is not None:
+            self.step("ventas:confirmar", lambda: confirmar.click().run())
+
+    def pagos(self):
+        at = self._app("pagos")
+        otro = _find(at.button, "➕ Registrar Nuevo Pago")
+        if otro is not None:
+            self.step("pagos:nuevo", lambda: otro.click().run())
+        else:
+            self.step("pagos:ver", at.run)
+        concepto = _find(at.text_input, "Concepto")
+        if concepto is None:
+            return
+        concepto.input(f"Carga VU{self.n}")
+        self.step("pagos:guardar", lambda: _find(at.button, "💾 Guardar pago").click().run())
+
+    def script(self, iterations, think):
+        self.login()
+        if not self.auth.get("user"):
+            return
+        for _ in range(iterations):
+            for paso in (self.home, self.accesos, self.ventas, self.pagos):
+                paso()
+                if think:
+                    time.sleep(self.rng.uniform(0, think))
+
+# -------------------------------------------
+# Muestreo de conexiones
+# -------------------------------------------
+class ConnSampler(threading.Thread):
+    def __init__(self, interval):
+        super().__init__(name="loadtest-conns", daemon=True)
+        self.interval = interval
+        self.samples = []
+        self.in_use = []
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.wait(self.interval):
+            try:
+                r = query("SELECT count(*) AS n FROM pg_stat_activity WHERE datname = current_database()")
+                self.samples.append(int(r[0]["n"]))
+            except Exception:
+                pass
+            self.in_use.append(sum(v for v in db.CONNECTIONS_IN_USE._values.values()))
+
+def _stats(values):
+    if not values:
+        return {"max": 0, "mean": 0}
+    return {"max": int(max(values)), "mean": round(float(np.mean(values)), 1)}
+
+# -------------------------------------------
+# Main
+# -------------------------------------------
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=12, help="usuarios virtuales concurrentes")
+    ap.add_argument("--iterations", type=int, default=3, help="vueltas del guion por usuario")
+    ap.add_argument("--ramp", type=float, default=0.5, help="segundos entre el arranque de cada usuario")
+    ap.add_argument("--think", type=float, default=0.0, help="pausa aleatoria máx. entre pasos (s)")
+    ap.add_argument("--email", default="recepcion{n}@gym.local", help="plantilla; {n} = 1..--accounts")
+    ap.add_argument("--accounts", type=int, default=4)
+    ap.add_argument("--password", default="demo123")
+    ap.add_argument("--timeout", type=float, default=60.0, help="timeout por rerun (s)")
+    ap.add_argument("--out", help="guarda resultados en JSON")
+    ap.add_argument("--compare", help="JSON previo para detectar regresiones de p95")
+    ap.add_argument("--threshold", type=float, default=0.25)
+    args = ap.parse_args(argv)
+    logging.getLogger("gym.slow_query").disabled = True
+    compartir_runtime()
+
+    lat = defaultdict(list)
+    errs = defaultdict(list)
+    lock = threading.Lock()
+
+    def rec(step, ms, err):
+        with lock:
+            lat[step].append(ms)
+            if err:
+                errs[step].append(err)
+
+    sampler = ConnSampler(0.25)
+    sampler.start()
+    t0 = time.perf_counter()
+    hilos = []
+    vus = []
+    for i in range(args.users):
+        vu = VirtualUser(i, args.email.format(n=i % args.accounts + 1), args.password, args.timeout, rec)
+        vus.append(vu)
+        h = threading.Thread(target=vu.script, args=(args.iterations, args.think), name=f"vu-{i}")
+        h.start()
+        hilos.append(h)
+        time.sleep(args.ramp)
+    for h in hilos:
+        h.join()
+    dur = time.perf_counter() - t0
+    sampler.stop.set()
+
+    pasos = {}
+    print(f"{'paso':<20} {'n':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for paso in sorted(lat):
+        arr = np.array(lat[paso])
+        pasos[paso] = {
+            "n": len(arr), "errors": len(errs[paso]),
+            "p50_ms": round(float(np.percentile(arr, 50)), 1),
+            "p95_ms": round(float(np.percentile(arr, 95)), 1),
+            "max_ms": round(float(arr.max()), 1),
+            "sample_errors": sorted(set(errs[paso]))[:5],
+        }
+        r = pasos[paso]
+        print(f"{paso:<20} {r['n']:>5} {r['errors']:>4} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['max_ms']:>9.1f}")
+        for e in r["sample_errors"]:
+            print(f"    ! {e[:160]}")
+
+    total = sum(len(v) for v in lat.values())
+    resyncs = sum(vu.resyncs for vu in vus)
+    conns = {"pg_stat_activity": _stats(sampler.samples), "in_use": _stats(sampler.in_use),
+             "opened": int(sum(db.CONNECTIONS_OPENED._values.values()))}
+    print(f"\n{total} reruns en {dur:.1f}s ({total / dur:.1f} reruns/s) · "
+          f"conexiones BD: máx {conns['pg_stat_activity']['max']} (media {conns['pg_stat_activity']['mean']}), "
+          f"en uso máx {conns['in_use']['max']}, abiertas {conns['opened']}"
+          + (f" · {resyncs} re-ejecuciones de sincronización no medidas" if resyncs else ""))
+
+    resultado = {
+        "meta": {"ts": datetime.now(timezone.utc).isoformat(timespec="seconds"), "host": platform.node(),
+                 "users": args.users, "iterations": args.iterations, "think": args.think},
+        "duration_s": round(dur, 2), "reruns_s": round(total / dur, 2),
+        "resyncs": resyncs, "steps": pasos, "db_connections": conns,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"resultados guardados en {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)["steps"]
+        reg = [(p, base[p]["p95_ms"], r["p95_ms"]) for p, r in pasos.items()
+               if p in base and base[p]["p95_ms"] and r["p95_ms"] > base[p]["p95_ms"] * (1 + args.threshold)]
+        for p, b, a in reg:
+            print(f"  regresión {p}: p95 {b:.1f} -> {a:.1f} ms")
+        if reg:
+            return 1
+        print(f"sin regresiones de p95 (tolerancia {args.threshold:.0%})")
+    return 1 if any(errs.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
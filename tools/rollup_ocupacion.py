@@ -0,0 +1,26 @@
+# tools/rollup_ocupacion.py
+"""
+Actualiza la tabla ocupacion_hora (rollup incremental de acceso por sede y hora).
+
+    python -m tools.rollup_ocupacion                      # desde la última marca de agua
+    python -m tools.rollup_ocupacion --desde 2025-01-01   # recalcula desde una fecha
+
+Pensado para cron (p.ej. cada hora a los :05). Solo procesa horas completas.
+"""
+import argparse
+import sys
+import time
+
+from app.lib.sp_wrappers import rollup_ocupacion
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--desde", help="fecha/hora ISO desde la que recalcular (ignora la marca de agua)")
+    args = ap.parse_args(argv)
+    t0 = time.perf_counter()
+    r = rollup_ocupacion(args.desde)[0]
+    print(f"{r['message']}: {r['horas']} filas en {time.perf_counter() - t0:.1f}s")
+    return 0 if r["status"] == "OK" else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
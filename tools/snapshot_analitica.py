@@ -0,0 +1,36 @@
+# tools/snapshot_analitica.py
+"""
+Actualiza los snapshots Parquet de analítica (ver app/lib/analitica.py).
+
+    python -m tools.snapshot_analitica                 # incremental desde las marcas de agua
+    python -m tools.snapshot_analitica --completo      # rehace todo (p.ej. semanal)
+    python -m tools.snapshot_analitica --tablas pago,venta
+
+Pensado para cron (p.ej. cada 15 minutos). La carpeta se elige con ANALYTICS_DIR.
+"""
+import argparse
+import sys
+import time
+
+from app.lib import analitica
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--completo", action="store_true", help="ignora las marcas de agua y copia todo de nuevo")
+    ap.add_argument("--tablas", default="", help=f"subconjunto (coma-separado) de: {','.join(analitica.TABLAS)}")
+    args = ap.parse_args(argv)
+    tablas = [t.strip() for t in args.tablas.split(",") if t.strip()]
+    desconocidas = set(tablas) - set(analitica.TABLAS)
+    if desconocidas:
+        ap.error(f"tablas desconocidas: {', '.join(sorted(desconocidas))}")
+
+    t0 = time.perf_counter()
+    copiadas = analitica.snapshot(completo=args.completo, tablas=tablas or None)
+    est = analitica.estado()
+    for tabla, n in copiadas.items():
+        print(f"{tabla:<12} {n:>9} filas leídas  {est[tabla]['filas']:>10} en Parquet")
+    print(f"snapshot en {analitica.DIR} ({time.perf_counter() - t0:.1f}s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+# tools/startup.py
+"""
+Benchmark de arranque en frío: import y primer render de cada página, y
+tiempo hasta que un proceso de Streamlit responde.
+
+    python -m tools.startup                       # todas las páginas, 3 procesos por página
+    python -m tools.startup --pages Home,Reportes --runs 5 --out bench/startup.json
+    python -m tools.startup --compare bench/startup.json --threshold 0.2
+
+Cada medición corre en un proceso Python nuevo (módulos sin cachear):
+  - import_ms   importar streamlit + app.lib (lo que toda página paga)
+  - render_ms   primer rerun de la página con AppTest (incluye sus imports)
+  - pesados     librerías grandes cargadas al terminar (pandas, plotly, numpy...)
+Home se mide dos veces: sin sesión (pantalla de login) y con sesión de admin.
+`--server` mide además `streamlit run app/Home.py` hasta que /_stcore/health
+responde (listo para aceptar sesiones).
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+APP = RAIZ / "app"
+PESADOS = ["pandas", "numpy", "plotly", "pyarrow", "psycopg", "dotenv"]
+
+# Se ejecuta en un proceso nuevo: mide imports base y el primer render
+_SONDA = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import streamlit
+from app.lib import auth, db, profiler, sp_wrappers, ui
+t1 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+import logging
+logging.getLogger("gym.slow_query").disabled = True
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+if sys.argv[2] == "1":
+    at.session_state["user"] = {"id": 1, "email": "admin@gym.local", "rol": "admin", "sede_id": None}
+t2 = time.perf_counter()
+at.run()
+t3 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000.0,
+    "render_ms": (t3 - t2) * 1000.0,
+    "errores": [str(e.value)[:200] for e in at.exception],
+    "pesados": [m for m in json.loads(sys.argv[3]) if m in sys.modules],
+}))
+"""
+
+def paginas():
+    out = [("Home (login)", APP / "Home.py", False), ("Home", APP / "Home.py", True)]
+    for p in sorted((APP / "pages").glob("*.py"), key=lambda p: int(p.name.split("_")[0])):
+        out.append((p.stem.split("_", 1)[1], p, True))
+    return out
+
+def medir_pagina(path, con_sesion, runs):
+    muestras = []
+    for _ in range(runs):
+        r = subprocess.run([sys.executable, "-c", _SONDA, str(path), "1" if con_sesion else "0", json.dumps(PESADOS)],
+                           cwd=RAIZ, capture_output=True, text=True, env={**os.environ, "REALTIME": "0"})
+        if r.returncode != 0:
+            raise RuntimeError(f"{path.name}: {r.stderr.strip()[-500:]}")
+        muestras.append(json.loads(r.stdout.strip().splitlines()[-1]))
+    return {
+        "import_ms": round(statistics.median(m["import_ms"] for m in muestras), 1),
+        "render_ms": round(statistics.median(m["render_ms"] for m in muestras), 1),
+        "pesados": muestras[-1]["pesados"],
+        "errores": muestras[-1]["errores"],
+    }
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def medir_servidor(runs, timeout=60):
+    """ms desde `streamlit run` hasta que /_stcore/health responde 200."""
+    tiempos = []
+    for _ in range(runs):
+        port = _puerto_libre()
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", str(APP / "Home.py"), "--server.headless", "true",
+             "--server.port", str(port), "--browser.gatherUsageStats", "false"],
+            cwd=RAIZ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                if time.perf_counter() - t0 > timeout:
+                    raise RuntimeError("el servidor no respondió a tiempo")
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as r:
+                        if r.status == 200:
+                            break
+                except OSError:
+                    time.sleep(0.05)
+            tiempos.append((time.perf_counter() - t0) * 1000.0)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+    return round(statistics.median(tiempos), 1)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--pages", default="", help="filtra páginas por subcadena (coma-separado)")
+    ap.add_argument("--runs", type=int, default=3, help="procesos nuevos por página (se reporta la mediana)")
+    ap.add_argument("--server", action="store_true", help="mide también el arranque de `streamlit run`")
+    ap.add_argument("--out", help="guarda resultados en JSON")
+    ap.add_argument("--compare", help="JSON de línea base: exit 1 si render_ms empeora más que --threshold")
+    ap.add_argument("--threshold", type=float, default=0.20)
+    args = ap.parse_args(argv)
+
+    filtros = [f.strip().lower() for f in args.pages.split(",") if f.strip()]
+    resultado = {"meta": {"ts": datetime.now(timezone.utc).isoformat(timespec="seconds"), "runs": args.runs,
+                          "python": sys.version.split()[0]}, "paginas": {}}
+    print(f"{'página':<20} {'import ms':>10} {'render ms':>10}  pesados")
+    for nombre, path, con_sesion in paginas():
+        if filtros and not any(f in nombre.lower() for f in filtros):
+            continue
+        r = medir_pagina(path, con_sesion, args.runs)
+        resultado["paginas"][nombre] = r
+        extra = f"  ⚠ {r['errores'][0]}" if r["errores"] else ""
+        print(f"{nombre:<20} {r['import_ms']:>10.1f} {r['render_ms']:>10.1f}  {','.join(r['pesados'])}{extra}")
+
+    if args.server:
+        resultado["servidor_ms"] = medir_servidor(args.runs)
+        print(f"servidor listo (/_stcore/health): {resultado['servidor_ms']:.0f} ms")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"resultados guardados en {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)["paginas"]
+        peores = [(n, base[n]["render_ms"], r["render_ms"]) for n, r in resultado["paginas"].items()
+                  if n in base and r["render_ms"] > base[n]["render_ms"] * (1 + args.threshold)]
+        for n, antes, ahora in peores:
+            print(f"REGRESIÓN {n}: {antes:.0f} → {ahora:.0f} ms")
+        return 1 if peores else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())